@@ -0,0 +1,119 @@
+"""
+Benchmark of the chart aggregation in `get_chart`.
+
+Compares the original implementation (parse the whole CSV with
+`csv.DictReader`, group raw strings in a `defaultdict(list)`, then convert
+every value with `float()`) against the columnar sidecar + vectorized
+aggregation engine in `omnidemo.charts`.
+
+Usage:
+
+    python benchmarks/bench_charts.py [--rows 1000000]
+"""
+
+from __future__ import annotations
+import argparse
+import csv
+import io
+import random
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable
+
+from omnidemo.charts import ChartKey, compute_chart
+from omnidemo.columnar import ColumnarTable, convert_csv
+
+CHART_KEYS = [
+    "region,sum/forecast",
+    "sku,avg/forecast",
+    "sku,region,max/forecast",
+    "date,count/forecast",
+]
+
+
+def make_forecast(path: Path, n_rows: int) -> None:
+    rng = random.Random(42)
+    regions = ["us", "eu", "asia", "latam", ""]
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        writer.writerow(["sku", "region", "date", "price", "forecast"])
+        for i in range(n_rows):
+            writer.writerow(
+                [
+                    f"sku-{rng.randrange(5000)}",
+                    rng.choice(regions),
+                    f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                    str(rng.randrange(100, 10000) / 100),
+                    "" if i % 17 == 0 else str(rng.random() * 300),
+                ]
+            )
+
+
+def legacy_chart(path: Path, chart_key: str) -> list[list[Any]]:
+    fields = chart_key.split(",")
+    agg = "sum"
+    if "/" in fields[-1]:
+        agg, field = fields[-1].split("/", 1)
+        fields[-1] = field
+    reader = csv.DictReader(io.StringIO(path.read_text()))
+    data = [[row.get(header) for header in fields] for row in reader]
+    aggregated_data: dict[tuple[Any, ...], list[str]] = defaultdict(list)
+    for row in data:
+        if row[-1]:
+            aggregated_data[tuple(row[:-1])].append(row[-1])
+    agg_fns: dict[str, Callable[[list[str]], float]] = {
+        "sum": lambda v: sum(float(x) for x in v),
+        "avg": lambda v: sum(float(x) for x in v) / len(v),
+        "min": lambda v: min(float(x) for x in v),
+        "max": lambda v: max(float(x) for x in v),
+        "count": len,
+    }
+    agg_fn = agg_fns[agg]
+    return [[*k, agg_fn(v)] for k, v in aggregated_data.items()]
+
+
+def columnar_chart(path: Path, chart_key: str) -> list[list[Any]]:
+    table = ColumnarTable.open(path)
+    assert table is not None
+    return compute_chart(table, ChartKey.parse(chart_key)).rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "forecast.csv"
+        make_forecast(path, args.rows)
+        t0 = time.perf_counter()
+        convert_csv(path)
+        t1 = time.perf_counter()
+        print(f"{args.rows:,} rows; building the columnar sidecar: {t1 - t0:.2f}s")
+        print(f"{'chart key':28} {'before rows/s':>14} {'after rows/s':>14} speedup")
+        for chart_key in CHART_KEYS:
+            t0 = time.perf_counter()
+            expected = legacy_chart(path, chart_key)
+            t1 = time.perf_counter()
+            actual = columnar_chart(path, chart_key)
+            t2 = time.perf_counter()
+            assert actual == expected or _close(actual, expected), chart_key
+            before = args.rows / (t1 - t0)
+            after = args.rows / (t2 - t1)
+            print(
+                f"{chart_key:28} {before:14,.0f} {after:14,.0f} "
+                f"{after / before:6.1f}x"
+            )
+
+
+def _close(a: list[list[Any]], b: list[list[Any]]) -> bool:
+    return len(a) == len(b) and all(
+        ra[:-1] == rb[:-1] and abs(ra[-1] - rb[-1]) <= 1e-9 * abs(rb[-1])
+        for ra, rb in zip(a, b)
+    )
+
+
+if __name__ == "__main__":
+    main()
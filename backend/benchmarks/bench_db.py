@@ -0,0 +1,185 @@
+"""
+Concurrency benchmark of the database access layer.
+
+Simulates many concurrent requests issuing a mix of reads and writes, and
+reports the latency percentiles of the requests. Meanwhile, a thread plays
+the role of another server process that periodically holds the write lock
+for a while (e.g. while storing a large chart). The "before" setup is the
+synchronous `SqliteDatabase` running on the event loop (rollback journal,
+commit per statement); the "after" setup is `AsyncSqliteDatabase` (WAL,
+reader pool + serialized writer, off-loop execution).
+
+Usage:
+
+    python benchmarks/bench_db.py [--clients 20] [--requests 60] [--writes 0.2]
+                                  [--lock-ms 20]
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from omnidemo.db import AsyncSqliteDatabase, SqliteDatabase
+from omnidemo.settings import settings
+
+N_JOBS = 1000
+N_INSIGHTS = 2000
+CHART_DATA = "[" + ", ".join(f'["sku-{i}", {i * 1.5}]' for i in range(100_000)) + "]"
+
+
+def create_db(path: Path, wal: bool) -> None:
+    conn = sqlite3.connect(path)
+    if wal:
+        conn.execute("PRAGMA journal_mode = WAL")
+    conn.executescript(settings.sqlite_sql.read_text())
+    conn.execute("INSERT INTO forecasts (status) VALUES ('draft')")
+    conn.executemany(
+        "INSERT INTO jobs (id, status, progress) VALUES (?, 'running', 0)",
+        [(f"job-{i}",) for i in range(N_JOBS)],
+    )
+    conn.executemany(
+        "INSERT INTO insights (message, username) VALUES (?, ?)",
+        [(f"message {i} " * 10, f"user-{i % 20}") for i in range(N_INSIGHTS)],
+    )
+    conn.commit()
+    conn.close()
+
+
+Query = Callable[[str, tuple[Any, ...]], Awaitable[Any]]
+Latencies = dict[str, list[float]]
+
+
+async def run_clients(
+    read: Query, write: Query, clients: int, requests: int, writes: float
+) -> Latencies:
+    latencies: Latencies = defaultdict(list)
+
+    async def client(seed: int) -> None:
+        rng = random.Random(seed)
+        for _ in range(requests):
+            # The latency is measured from the moment the request is due, so
+            # that it includes the time spent waiting for a blocked event loop
+            delay = rng.random() * 0.01
+            t0 = time.perf_counter() + delay
+            await asyncio.sleep(delay)
+            job_id = f"job-{rng.randrange(N_JOBS)}"
+            op = rng.random()
+            if op < writes * 0.9:
+                kind = "update-job"
+                await write(
+                    "UPDATE jobs SET progress = ? WHERE id = ?", (rng.random(), job_id)
+                )
+            elif op < writes:
+                kind = "insert-chart"
+                await write(
+                    "INSERT INTO charts (forecast_id, chart_key, data) VALUES (?, ?, ?)",
+                    (1, f"chart-{seed}-{t0}", CHART_DATA),
+                )
+            elif op < writes + 0.1:
+                kind = "list-insights"
+                await read("SELECT * FROM insights", ())
+            else:
+                kind = "get-job"
+                await read("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            latency = time.perf_counter() - t0
+            latencies[kind].append(latency)
+            latencies["all"].append(latency)
+
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    return latencies
+
+
+class OtherWorker(threading.Thread):
+    """Holds the write lock for `lock_ms` out of every 100ms."""
+
+    def __init__(self, path: Path, lock_ms: float):
+        super().__init__(daemon=True)
+        self.path = path
+        self.lock_ms = lock_ms
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        while not self.stopped.wait(0.1 - self.lock_ms / 1000):
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE jobs SET progress = progress WHERE id = 'job-0'")
+            time.sleep(self.lock_ms / 1000)
+            conn.execute("COMMIT")
+        conn.close()
+
+
+async def bench_sync(path: Path, args: argparse.Namespace) -> Latencies:
+    db = SqliteDatabase(sqlite3.connect(path))
+
+    async def read(sql: str, params: tuple[Any, ...]) -> Any:
+        return db.fetch_rows(sql, params)
+
+    async def write(sql: str, params: tuple[Any, ...]) -> Any:
+        return db.execute(sql, params)
+
+    try:
+        return await run_clients(read, write, args.clients, args.requests, args.writes)
+    finally:
+        db.close()
+
+
+async def bench_async(path: Path, args: argparse.Namespace) -> Latencies:
+    db = AsyncSqliteDatabase(path, settings.sqlite_readers)
+    try:
+        return await run_clients(
+            db.fetch_rows, db.execute, args.clients, args.requests, args.writes
+        )
+    finally:
+        await db.close()
+
+
+def report(before: Latencies, after: Latencies) -> None:
+    print(f"{'':14} {'before p50':>11} {'p99':>9} {'after p50':>11} {'p99':>9}")
+    for kind in before:
+        stats = []
+        for latencies in (before[kind], after[kind]):
+            q = statistics.quantiles(latencies, n=100)
+            stats += [q[49] * 1000, q[98] * 1000]
+        print(
+            f"{kind:14} {stats[0]:9.2f}ms {stats[1]:7.2f}ms "
+            f"{stats[2]:9.2f}ms {stats[3]:7.2f}ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--writes", type=float, default=0.2)
+    parser.add_argument("--lock-ms", type=float, default=20)
+    args = parser.parse_args()
+
+    results: list[Latencies] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, wal, bench in [
+            ("before", False, bench_sync),
+            ("after", True, bench_async),
+        ]:
+            path = Path(tmp) / f"{name}.db"
+            create_db(path, wal=wal)
+            other = OtherWorker(path, args.lock_ms)
+            other.start()
+            try:
+                results.append(asyncio.run(bench(path, args)))
+            finally:
+                other.stopped.set()
+                other.join()
+    report(*results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Benchmark of the file downloads in `download_file`.
+
+Compares the original implementation (an async generator that reads the
+file with blocking `read()` calls on the event loop) against starlette's
+`FileResponse`, which reads the file in a worker thread, and against
+`DownloadResponse`, which does the same with larger chunks. All are served
+by uvicorn in a subprocess, while a background task in the server measures how long the
+event loop is blocked ("stall"). The client downloads the file a few times
+in parallel, and reports the throughput.
+
+Usage:
+
+    python benchmarks/bench_download.py [--size-mb 512] [--clients 4]
+"""
+
+from __future__ import annotations
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncGenerator, AsyncIterator
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import FileResponse, StreamingResponse
+
+from omnidemo.api.inputs.download_file import DownloadResponse
+
+PORT = 8799
+
+
+def make_app(path: Path) -> FastAPI:
+    stall = {"max": 0.0}
+
+    async def watch_loop() -> None:
+        interval = 0.005
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(interval)
+            stall["max"] = max(stall["max"], time.perf_counter() - t0 - interval)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        watcher = asyncio.create_task(watch_loop())
+        yield
+        watcher.cancel()
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/legacy")
+    async def legacy() -> StreamingResponse:
+        async def file_generator() -> AsyncGenerator[bytes, None]:
+            chunk_size = 1024 * 1024
+            with open(path, mode="rb") as file:
+                while chunk := file.read(chunk_size):
+                    yield chunk
+
+        return StreamingResponse(file_generator())
+
+    @app.get("/file")
+    async def file() -> FileResponse:
+        return FileResponse(path)
+
+    @app.get("/download")
+    async def download() -> DownloadResponse:
+        return DownloadResponse(path)
+
+    @app.get("/stall")
+    async def get_stall() -> float:
+        value, stall["max"] = stall["max"], 0.0
+        return value
+
+    return app
+
+
+async def download(client: httpx.AsyncClient, url: str) -> int:
+    size = 0
+    async with client.stream("GET", url) as response:
+        async for chunk in response.aiter_raw():
+            size += len(chunk)
+    return size
+
+
+async def run_client(n_clients: int, rounds: int) -> None:
+    url = f"http://127.0.0.1:{PORT}"
+    async with httpx.AsyncClient(timeout=None) as client:
+        print(f"{'variant':<10} {'throughput':>12} {'max stall':>10}")
+        for name in ["legacy", "file", "download"]:
+            await client.get(f"{url}/stall")
+            t0 = time.perf_counter()
+            total = 0
+            for _ in range(rounds):
+                sizes = await asyncio.gather(
+                    *(download(client, f"{url}/{name}") for _ in range(n_clients))
+                )
+                total += sum(sizes)
+            elapsed = time.perf_counter() - t0
+            stall = (await client.get(f"{url}/stall")).json()
+            throughput = total / 2**20 / elapsed
+            print(f"{name:<10} {throughput:8.0f}MB/s {stall * 1000:8.1f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--serve", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        uvicorn.run(make_app(Path(args.serve)), port=PORT, log_level="warning")
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "input.bin"
+        with open(path, "wb") as out:
+            for _ in range(args.size_mb):
+                out.write(os.urandom(2**20))
+        print(f"File: {args.size_mb} MB, {args.clients} parallel downloads\n")
+        server = subprocess.Popen([sys.executable, __file__, "--serve", str(path)])
+        try:
+            for _ in range(100):
+                try:
+                    httpx.get(f"http://127.0.0.1:{PORT}/stall")
+                    break
+                except httpx.ConnectError:
+                    time.sleep(0.1)
+            asyncio.run(run_client(args.clients, args.rounds))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
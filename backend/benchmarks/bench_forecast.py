@@ -0,0 +1,109 @@
+"""
+Benchmark of the forecast pipeline in `run_forecast`.
+
+Compares the peak memory and the running time of the original
+implementation (`read_text()` of the whole input, a list of `DictReader`
+rows, a second list of output rows, then writing everything out) against
+the streaming pipeline in `omnidemo.forecast`. Each variant runs in a
+fresh subprocess, so that the peak RSS is measured separately.
+
+Usage:
+
+    python benchmarks/bench_forecast.py [--rows 2000000]
+"""
+
+from __future__ import annotations
+import argparse
+import csv
+import io
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from omnidemo.columnar import ColumnarWriter, columns_path
+from omnidemo.forecast import forecast_file
+
+
+def make_input(path: Path, n_rows: int) -> None:
+    rng = random.Random(42)
+    regions = ["us", "eu", "asia", "latam", ""]
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        writer.writerow(["sku", "region", "date", "price", "forecast"])
+        for i in range(n_rows):
+            writer.writerow(
+                [
+                    f"sku-{rng.randrange(5000)}",
+                    rng.choice(regions),
+                    f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                    str(rng.randrange(100, 10000) / 100),
+                    str(rng.randrange(1000)),
+                ]
+            )
+
+
+def legacy_forecast(source: Path, target: Path) -> None:
+    rows = list(csv.DictReader(io.StringIO(source.read_text())))
+    out_rows: list[list[str]] = []
+    for row in rows:
+        forecast = float(row["forecast"]) * 2
+        del row["forecast"]
+        out_rows.append(list(row.values()) + [str(forecast)])
+    headers = [h for h in rows[0].keys() if h != "forecast"] + ["forecast"]
+    with open(target, "w", newline="", encoding="utf-8") as out:
+        writer = csv.writer(out)
+        writer.writerow(headers)
+        writer.writerows(out_rows)
+    with ColumnarWriter(columns_path(target), headers) as columns:
+        columns.write_rows(out_rows)
+
+
+def streaming_forecast(source: Path, target: Path) -> None:
+    for _ in forecast_file(source, target, 2):
+        pass
+
+
+def run_variant(name: str, source: Path, target: Path) -> None:
+    """Entry point of the subprocess: run one variant and print its stats."""
+    fn = legacy_forecast if name == "legacy" else streaming_forecast
+    t0 = time.perf_counter()
+    fn(source, target)
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{elapsed:.3f} {peak_mb:.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--variant", help=argparse.SUPPRESS)
+    parser.add_argument("--source", help=argparse.SUPPRESS)
+    parser.add_argument("--target", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.variant:
+        run_variant(args.variant, Path(args.source), Path(args.target))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "input.csv"
+        make_input(source, args.rows)
+        size_mb = source.stat().st_size / 2**20
+        print(f"Input: {args.rows:,} rows, {size_mb:.1f} MB\n")
+        print(f"{'variant':<10} {'time':>9} {'peak RSS':>10}")
+        for name in ["legacy", "streaming"]:
+            target = Path(tmp) / f"{name}.csv"
+            output = subprocess.check_output(
+                [sys.executable, __file__, "--variant", name]
+                + ["--source", str(source), "--target", str(target)],
+                text=True,
+            )
+            elapsed, peak_mb = map(float, output.split())
+            print(f"{name:<10} {elapsed:8.2f}s {peak_mb:8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,7 @@
+-- Initial schema of a new database. The later changes are made by the
+-- migrations in omnidemo/migrations.py: add a new migration there instead of
+-- modifying this file.
+
 -- create table public.forecasts (
 --   id bigint generated by default as identity not null,
 --   file_id character varying null,
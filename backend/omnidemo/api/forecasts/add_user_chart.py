@@ -4,7 +4,7 @@ from pydantic import BaseModel
 
 from omnidemo.api.forecasts import router
 from omnidemo.api.forecasts.get_user_charts import UserChart
-from omnidemo.db import SqliteDatabase
+from omnidemo.db import AsyncSqliteDatabase
 
 
 class AddUserChartRequest(BaseModel):
@@ -20,9 +20,9 @@ class AddUserChartResponse(BaseModel):
 async def add_user_chart(
     body: AddUserChartRequest, request: Request
 ) -> AddUserChartResponse:
-    db = SqliteDatabase.from_app(request.app)
+    db = AsyncSqliteDatabase.from_app(request.app)
 
-    data = db.insert_row(
+    data = await db.insert_row(
         """
         INSERT INTO user_charts (username, chart_key)
         VALUES (?, ?)
@@ -0,0 +1,42 @@
+from __future__ import annotations
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+
+from omnidemo.api.forecasts import router
+from omnidemo.api.forecasts.get_latest_forecast import Forecast
+from omnidemo.api.jobs.get_job import Job
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.executor import ForecastExecutor
+
+
+class CancelForecastRequest(BaseModel):
+    id: int
+
+
+class CancelForecastResponse(BaseModel):
+    forecast: Forecast
+    job: Job
+
+
+@router.post("/forecasts/cancel-forecast")
+async def cancel_forecast(
+    body: CancelForecastRequest, request: Request
+) -> CancelForecastResponse:
+    """
+    Cancel a queued or running forecast. A running forecast stops within
+    about a second, and its partial output is removed.
+    """
+    db = AsyncSqliteDatabase.from_app(request.app)
+    executor = ForecastExecutor.from_app(request.app)
+
+    rows = await db.fetch_rows("SELECT * FROM forecasts WHERE id = ?", (body.id,))
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"Forecast not found: {body.id}")
+    forecast = Forecast.model_validate(rows[0])
+    if forecast.job_id is None or not await executor.cancel(forecast.job_id):
+        raise HTTPException(
+            status_code=409, detail=f"Forecast {body.id} is not in progress"
+        )
+
+    row = await db.fetch_one("SELECT * FROM jobs WHERE id = ?", (forecast.job_id,))
+    return CancelForecastResponse(forecast=forecast, job=Job.model_validate(row))
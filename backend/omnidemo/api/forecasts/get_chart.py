@@ -1,15 +1,28 @@
 from __future__ import annotations
 import asyncio
-import csv
-import io
-from collections import defaultdict
+import contextlib
 import json
-from fastapi import HTTPException, Request
+from fastapi import HTTPException, Query, Request, Response
 from pydantic import BaseModel
-from typing import Any, Callable, cast
+from typing import Any, Literal, cast
 
 from omnidemo.api.forecasts import router
-from omnidemo.db import SqliteDatabase
+from omnidemo.chart_cache import chart_cache
+from omnidemo.chart_formats import (
+    BINARY_TYPE,
+    COLUMNS_TYPE,
+    MEDIA_TYPES,
+    chart_format,
+    encode_chart,
+)
+from omnidemo.chart_views import ChartView
+from omnidemo.chart_warmup import chart_lease, insert_chart
+from omnidemo.charts import ChartData, ChartKey, compute_chart, rollup_chart
+from omnidemo.columnar import ColumnarTable, convert_csv
+from omnidemo.db import AnyDict, AsyncSqliteDatabase
+from omnidemo.http_cache import IMMUTABLE, content_etag, etag_matches
+from omnidemo.settings import settings
+from omnidemo.singleflight import SingleFlight
 
 
 class Chart(BaseModel):
@@ -22,7 +35,9 @@ class Chart(BaseModel):
     # specified, the default is `sum`.
     # Example: `sku,region,count/forecast`.
     chart_key: str
-    data: Any
+    # Rows `[*x_values, y]`. The response is not built from this model: the
+    # stored JSON of the rows is sent as it is, see `encode_chart`.
+    data: list[list[Any]]
     created_at: str
 
 
@@ -30,116 +45,274 @@ class GetChartResponse(BaseModel):
     chart: Chart
 
 
-@router.get("/forecasts/get-chart")
+chart_flights: SingleFlight[tuple[int, str], AnyDict] = SingleFlight()
+
+
+@router.get(
+    "/forecasts/get-chart",
+    response_model=GetChartResponse,
+    responses={
+        200: {"content": {COLUMNS_TYPE: {}, BINARY_TYPE: {}}},
+    },
+)
 async def get_chart(
-    forecast_id: int, chart_key: str, request: Request
-) -> GetChartResponse:
+    forecast_id: int,
+    chart_key: str,
+    request: Request,
+    sort: Literal["x", "-x", "y", "-y"] | None = None,
+    top: int | None = Query(None, ge=1),
+    points: int | None = Query(None, ge=3),
+    downsample: Literal["lttb", "bucket"] = "lttb",
+    format: Literal["rows", "columns", "binary"] | None = None,
+) -> Response:
     """
-    Returns the list of chart descriptions for the given user.
-    The charts themselves are not returned, only the metadata.
+    Returns the data of the chart for the given forecast, computing it if
+    this is the first time the chart is requested.
+
+    The charts with many groups can be reduced for drawing: sorted, limited
+    to the `top` groups plus the "other" group, or downsampled to at most
+    `points` points along a numeric or date x-axis, see `ChartView`.
+
+    The data is sent as a list of rows by default, or in one of the columnar
+    formats (see `omnidemo.chart_formats`), which are requested with the
+    `format` parameter or with the `Accept` header.
     """
-    db = SqliteDatabase.from_app(request.app)
+    try:
+        view = ChartView(sort=sort, top=top, points=points, downsample=downsample)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response_format = chart_format(format, request.headers.get("accept", ""))
+
+    # Popular charts are served from memory, already encoded. Each variant and
+    # format of the chart is cached separately.
+    cache_key = view.cache_key(chart_key)
+    if response_format != "rows":
+        cache_key += f"#{response_format}"
+    body = chart_cache.get(forecast_id, cache_key)
+    if body is not None:
+        return chart_response(request, body, response_format)
 
-    # TODO: prevent two users from requesting the same chart at the same time
-    # Also, should we return a job here?
+    db = AsyncSqliteDatabase.from_app(request.app)
+    version = chart_cache.version
 
     # See if the chart is already in the database, and if so return it
-    rows = db.fetch_rows(
-        """
-        SELECT * FROM charts WHERE chart_key = ? AND forecast_id = ?
-        """,
-        (chart_key, forecast_id),
-    )
-    if rows:
-        return GetChartResponse(chart=Chart.model_validate(rows[0]))
-
-    # Otherwise, we need to compute the chart's data
-    fields = chart_key.split(",")
-    agg = "sum"
-    if "/" in fields[-1]:
-        agg, field = fields[-1].split("/", 1)
-        fields[-1] = field
-    if agg not in ["sum", "avg", "min", "max", "count"]:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unsupported aggregation function: {agg}",
-        )
+    row = await fetch_chart(db, forecast_id, chart_key)
+    if row is None:
+        # Otherwise, we need to compute the chart's data
+        try:
+            key = ChartKey.parse(chart_key)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-    if len(fields) < 2:
-        raise HTTPException(
-            status_code=400,
-            detail="Chart key must contain at least two fields",
+        # Find the name of the file that has the full forecast data
+        # If the forecast is not ready yet, then wait for it to be ready
+        forecast_file_id = await wait_for_forecast(db, forecast_id)
+
+        # If several users request the same chart at the same time, only one
+        # of them computes it, and the others wait for the result
+        row = await chart_flights.run(
+            (forecast_id, chart_key),
+            lambda: compute_and_store_chart(
+                db, forecast_id, chart_key, key, forecast_file_id
+            ),
         )
 
-    # Find the name of the file that has the full forecast data
-    # If the forecast is not ready yet, then wait for it to be ready
-    while True:
-        row = db.fetch_one(
-            "SELECT file_id FROM forecasts WHERE id = ?",
+    # The variants are derived from the full chart
+    if not view.is_full:
+        row = await apply_view(view, row)
+
+    if response_format == "rows":
+        body = encode_chart(response_format, row)
+    else:
+        body = await asyncio.to_thread(encode_chart, response_format, row)
+    chart_cache.put(forecast_id, cache_key, row["file_id"], body, version)
+    return chart_response(request, body, response_format)
+
+
+async def apply_view(view: ChartView, row: AnyDict) -> AnyDict:
+    """The chart row with the data replaced by its variant."""
+
+    def apply() -> bytes:
+        key = ChartKey.parse(row["chart_key"])
+        partials = row["partials"] and json.loads(row["partials"])
+        rows = view.apply(key, ChartData(json.loads(row["data"]), partials))
+        return json.dumps(rows).encode()
+
+    try:
+        return {**row, "data": await asyncio.to_thread(apply)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def chart_response(request: Request, body: bytes, format: str) -> Response:
+    """
+    Once computed, a chart never changes: the clients may keep it for as long
+    as they like, and revalidate it with its content hash.
+    """
+    etag = content_etag(body)
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE, "Vary": "Accept"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=MEDIA_TYPES[format], headers=headers)
+
+
+async def wait_for_forecast(db: AsyncSqliteDatabase, forecast_id: int) -> str:
+    """
+    Return the file id of the forecast, waiting for the forecast's job to
+    complete if necessary. The database is re-checked only when the
+    forecast job signals a change, not on a timer.
+    """
+
+    async def check() -> str | None:
+        rows = await db.fetch_rows(
+            """
+            SELECT forecasts.file_id, jobs.status, jobs.error
+            FROM forecasts LEFT JOIN jobs ON jobs.id = forecasts.job_id
+            WHERE forecasts.id = ?
+            """,
             (forecast_id,),
         )
-        forecast_file_id = cast(str, row["file_id"])
-        if forecast_file_id:
-            break
-        await asyncio.sleep(1)
-
-    # Load the data from the Supabase storage
-    file_content = (db.storage / forecast_file_id).read_text()
-    csv_file = io.StringIO(file_content)
-    reader = csv.DictReader(csv_file)
-    data = [[row.get(header) for header in fields] for row in reader]
-
-    # Aggregate the y-data by groups in x-data.
-    aggregated_data: dict[tuple[Any, ...], list[str]] = defaultdict(list)
-    for row in data:
-        x_value = tuple(row[:-1])
-        y_value = row[-1]
-        if y_value:
-            aggregated_data[x_value].append(y_value)
-    agg_fn: Callable[[list[str]], float] = {
-        "sum": agg_sum,
-        "avg": agg_avg,
-        "min": agg_min,
-        "max": agg_max,
-        "count": agg_count,
-    }[agg]
-    agg_data: list[list[Any]] = [[*k, agg_fn(v)] for k, v in aggregated_data.items()]
-
-    # Save the chart data
-    row = db.insert_row(
-        """
-        INSERT INTO charts (forecast_id, chart_key, data)
-        VALUES (?, ?, ?)
+        if not rows:
+            raise HTTPException(
+                status_code=404, detail=f"Forecast not found: {forecast_id}"
+            )
+        if rows[0]["file_id"]:
+            return cast(str, rows[0]["file_id"])
+        if rows[0]["status"] == "failed":
+            raise HTTPException(
+                status_code=409,
+                detail=f"Forecast {forecast_id} failed: {rows[0]['error']}",
+            )
+        if rows[0]["status"] == "cancelled":
+            raise HTTPException(
+                status_code=409, detail=f"Forecast {forecast_id} was cancelled"
+            )
+        return None
+
+    try:
+        return await db.changes.wait_for(check, settings.forecast_wait_timeout)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=504, detail=f"Forecast {forecast_id} is not ready yet"
+        )
+
+
+async def fetch_chart(
+    db: AsyncSqliteDatabase, forecast_id: int, chart_key: str, with_data: bool = True
+) -> AnyDict | None:
+    """Read the chart, together with the file of its forecast."""
+    charts = await fetch_charts(db, forecast_id, [chart_key], with_data)
+    return charts.get(chart_key)
+
+
+async def fetch_charts(
+    db: AsyncSqliteDatabase,
+    forecast_id: int,
+    chart_keys: list[str],
+    with_data: bool = True,
+) -> dict[str, AnyDict]:
+    """
+    Read the charts of the forecast that are in the database, by chart key.
+    The chart's data is read as the bytes of its JSON, which go into the
+    response as they are.
+    """
+    data = "CAST(charts.data AS BLOB)" if with_data else "NULL"
+    placeholders = ", ".join("?" * len(chart_keys))
+    rows = await db.fetch_rows(
+        f"""
+        SELECT charts.id, charts.forecast_id, charts.chart_key, charts.created_at,
+            charts.partials, {data} AS data, forecasts.file_id
+        FROM charts JOIN forecasts ON forecasts.id = charts.forecast_id
+        WHERE charts.forecast_id = ? AND charts.chart_key IN ({placeholders})
         """,
-        (forecast_id, chart_key, json.dumps(agg_data)),
+        (forecast_id, *chart_keys),
     )
+    return {row["chart_key"]: row for row in rows}
 
-    # Return the chart to the user
-    chart = Chart.model_validate(row)
-    return GetChartResponse(chart=chart)
 
+async def compute_and_store_chart(
+    db: AsyncSqliteDatabase,
+    forecast_id: int,
+    chart_key: str,
+    key: ChartKey,
+    forecast_file_id: str,
+) -> AnyDict:
+    """
+    Compute the chart and save it into the `charts` table. Other server
+    processes may be computing the same chart at the same time: the lease
+    ensures that only one of them does the work, while the rest wait for
+    the chart to appear in the database.
+    """
+    lease = chart_lease(db, forecast_id, chart_key)
+    while not await lease.acquire():
+        await asyncio.sleep(0.25)
+        row = await fetch_chart(db, forecast_id, chart_key)
+        if row is not None:
+            return row
 
-def agg_sum(data: list[str]) -> float:
-    return sum(float(v) for v in data)
+    try:
+        # The chart could have been stored while we were waiting for the lease
+        row = await fetch_chart(db, forecast_id, chart_key)
+        if row is not None:
+            return row
 
+        # A chart that aggregates by fewer x-fields than one of the charts
+        # computed already is derived from that chart's groups
+        data = await rollup_from_charts(db, forecast_id, key)
+        if data is None:
+            # Load the data from the storage. Forecasts come with a columnar
+            # sidecar, which lets us memory-map only the columns that the chart
+            # needs. Older forecasts only have the CSV file, so we convert it
+            # once.
+            forecast_file = db.storage / forecast_file_id
 
-def agg_avg(data: list[str]) -> float:
-    return agg_sum(data) / len(data)
+            def compute() -> ChartData:
+                table = ColumnarTable.open(forecast_file) or convert_csv(forecast_file)
+                return compute_chart(table, key)
 
+            data = await asyncio.to_thread(compute)
 
-def agg_count(data: list[str]) -> float:
-    return len(data)
+        # Save the chart data. The rows are serialized once, and the same JSON
+        # is stored and sent, rather than read back from the database.
+        rows = await insert_chart(db, forecast_id, chart_key, data)
+        row = await fetch_chart(db, forecast_id, chart_key, with_data=False)
+        assert row is not None
+        return {**row, "data": rows.encode()}
+    finally:
+        await lease.release()
 
 
-def agg_min(data: list[str]) -> float:
-    min_value = float("inf")
-    for v in data:
-        min_value = min(min_value, float(v))
-    return min_value
+async def rollup_from_charts(
+    db: AsyncSqliteDatabase, forecast_id: int, key: ChartKey
+) -> ChartData | None:
+    """
+    Derive the chart from the smallest chart of the forecast in the database
+    that it rolls up, if there is one. This reads a few thousand groups
+    instead of the whole forecast.
+    """
+    rows = await db.fetch_rows(
+        """
+        SELECT id, chart_key, LENGTH(data) AS size FROM charts
+        WHERE forecast_id = ? AND (partials IS NOT NULL OR ? != 'avg')
+        """,
+        (forecast_id, key.agg),
+    )
+    best: tuple[int, int, ChartKey] | None = None
+    for row in rows:
+        with contextlib.suppress(ValueError):
+            finer = ChartKey.parse(row["chart_key"])
+            if key.rolls_up(finer) and (best is None or row["size"] < best[0]):
+                best = (row["size"], row["id"], finer)
+    if best is None:
+        return None
+    _, chart_id, finer = best
+    row = await db.fetch_one(
+        "SELECT data, partials FROM charts WHERE id = ?", (chart_id,)
+    )
 
+    def rollup() -> ChartData:
+        partials = row["partials"] and json.loads(row["partials"])
+        return rollup_chart(key, finer, ChartData(json.loads(row["data"]), partials))
 
-def agg_max(data: list[str]) -> float:
-    max_value = float("-inf")
-    for v in data:
-        max_value = max(max_value, float(v))
-    return max_value
+    return await asyncio.to_thread(rollup)
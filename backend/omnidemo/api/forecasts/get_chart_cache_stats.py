@@ -0,0 +1,23 @@
+from __future__ import annotations
+from pydantic import BaseModel
+
+from omnidemo.api.forecasts import router
+from omnidemo.chart_cache import chart_cache
+
+
+class GetChartCacheStatsResponse(BaseModel):
+    hits: int
+    misses: int
+    entries: int
+    # Memory used by the cache, and its budget, in bytes
+    size: int
+    max_size: int
+
+
+@router.get("/forecasts/get-chart-cache-stats")
+async def get_chart_cache_stats() -> GetChartCacheStatsResponse:
+    """
+    Returns the counters of the chart cache of the server process that
+    handles the request.
+    """
+    return GetChartCacheStatsResponse.model_validate(chart_cache.stats())
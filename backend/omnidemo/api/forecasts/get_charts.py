@@ -0,0 +1,129 @@
+from __future__ import annotations
+import asyncio
+import functools
+from fastapi import HTTPException, Query, Request, Response
+from pydantic import BaseModel
+from typing import Literal
+
+from omnidemo.api.forecasts import router
+from omnidemo.api.forecasts.get_chart import (
+    Chart,
+    apply_view,
+    chart_flights,
+    chart_response,
+    compute_and_store_chart,
+    fetch_charts,
+    wait_for_forecast,
+)
+from omnidemo.chart_cache import chart_cache
+from omnidemo.chart_formats import (
+    BINARY_TYPE,
+    COLUMNS_TYPE,
+    chart_format,
+    encode_chart,
+    encode_charts,
+)
+from omnidemo.chart_views import ChartView
+from omnidemo.chart_warmup import compute_charts
+from omnidemo.charts import ChartKey
+from omnidemo.db import AnyDict, AsyncSqliteDatabase
+
+
+class GetChartsResponse(BaseModel):
+    charts: list[Chart]
+
+
+@router.get(
+    "/forecasts/get-charts",
+    response_model=GetChartsResponse,
+    responses={
+        200: {"content": {COLUMNS_TYPE: {}, BINARY_TYPE: {}}},
+    },
+)
+async def get_charts(
+    forecast_id: int,
+    request: Request,
+    chart_key: list[str] = Query(min_length=1, max_length=100),
+    sort: Literal["x", "-x", "y", "-y"] | None = None,
+    top: int | None = Query(None, ge=1),
+    points: int | None = Query(None, ge=3),
+    downsample: Literal["lttb", "bucket"] = "lttb",
+    format: Literal["rows", "columns", "binary"] | None = None,
+) -> Response:
+    """
+    Returns the data of several charts of the forecast (e.g. all the charts
+    of a dashboard), in the order of the `chart_key` parameters. The view
+    parameters and the formats apply to every chart, as in `get_chart`.
+
+    The charts that are not computed yet are computed together, in one pass
+    over the forecast's columns, instead of one pass per chart. A chart key
+    that is repeated is computed once, and sent as many times.
+    """
+    try:
+        view = ChartView(sort=sort, top=top, points=points, downsample=downsample)
+        keys = {k: ChartKey.parse(k) for k in chart_key}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    response_format = chart_format(format, request.headers.get("accept", ""))
+
+    # The charts are cached one by one, as by `get_chart`
+    def cache_key(k: str) -> str:
+        if response_format == "rows":
+            return view.cache_key(k)
+        return f"{view.cache_key(k)}#{response_format}"
+
+    bodies: dict[str, bytes] = {}
+    for k in keys:
+        body = chart_cache.get(forecast_id, cache_key(k))
+        if body is not None:
+            bodies[k] = body
+    missing = [k for k in keys if k not in bodies]
+    if missing:
+        db = AsyncSqliteDatabase.from_app(request.app)
+        version = chart_cache.version
+        rows = await fetch_charts(db, forecast_id, missing)
+        if len(rows) < len(missing):
+            keys_to_compute = {k: keys[k] for k in missing if k not in rows}
+            rows.update(await compute_missing_charts(db, forecast_id, keys_to_compute))
+
+        for k, row in rows.items():
+            chart = row if view.is_full else await apply_view(view, row)
+            if response_format == "rows":
+                body = encode_chart(response_format, chart)
+            else:
+                body = await asyncio.to_thread(encode_chart, response_format, chart)
+            chart_cache.put(forecast_id, cache_key(k), chart["file_id"], body, version)
+            bodies[k] = body
+
+    body = encode_charts(response_format, [bodies[k] for k in chart_key])
+    return chart_response(request, body, response_format)
+
+
+async def compute_missing_charts(
+    db: AsyncSqliteDatabase,
+    forecast_id: int,
+    keys: dict[str, ChartKey],
+) -> dict[str, AnyDict]:
+    """
+    Compute the charts that are not in the database, all at once. The
+    charts that are being computed by another request, or that fail to
+    compute, are left to `compute_and_store_chart`, which waits for the
+    former and reports the errors of the latter.
+    """
+    forecast_file_id = await wait_for_forecast(db, forecast_id)
+    stored = await compute_charts(db, forecast_id, forecast_file_id, keys)
+
+    # The rows are sent as they were serialized, rather than read back
+    computed: dict[str, AnyDict] = {}
+    if stored:
+        charts = await fetch_charts(db, forecast_id, list(stored), with_data=False)
+        for k, row in charts.items():
+            computed[k] = {**row, "data": stored[k].encode()}
+    for k, key in keys.items():
+        if k not in computed:
+            compute = functools.partial(
+                compute_and_store_chart, db, forecast_id, k, key, forecast_file_id
+            )
+            computed[k] = await chart_flights.run((forecast_id, k), compute)
+    return computed
@@ -1,11 +1,12 @@
 from __future__ import annotations
-from fastapi import Request
+from fastapi import Request, Response
 from pydantic import BaseModel
 from typing import Literal
 
 from omnidemo.api.forecasts import router
 from omnidemo.api.jobs.get_job import Job
-from omnidemo.db import SqliteDatabase
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.http_cache import check_etag, tables_etag
 
 
 class Forecast(BaseModel):
@@ -22,14 +23,20 @@ class GetForecastResponse(BaseModel):
 
 
 @router.get("/forecasts/get-latest-forecast")
-async def get_latest_forecast(request: Request) -> GetForecastResponse:
-    db = SqliteDatabase.from_app(request.app)
+async def get_latest_forecast(
+    request: Request, response: Response
+) -> GetForecastResponse:
+    db = AsyncSqliteDatabase.from_app(request.app)
+    etag = await tables_etag(db, ["forecasts", "jobs"])
+    check_etag(request, response, etag)
 
     # Get the latest forecast
-    rows = db.fetch_rows("""
+    rows = await db.fetch_rows(
+        """
         SELECT * FROM forecasts
         ORDER BY created_at DESC LIMIT 1
-        """)
+        """
+    )
     if not rows:
         return GetForecastResponse(forecast=None, job=None)
 
@@ -38,7 +45,7 @@ async def get_latest_forecast(request: Request) -> GetForecastResponse:
 
     # Get the job associated with the forecast
     if forecast.job_id:
-        rows = db.fetch_rows(
+        rows = await db.fetch_rows(
             "SELECT * FROM jobs WHERE id = ?",
             (forecast.job_id,),
         )
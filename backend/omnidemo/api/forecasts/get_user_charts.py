@@ -1,9 +1,10 @@
 from __future__ import annotations
-from fastapi import Request
+from fastapi import Request, Response
 from pydantic import BaseModel
 
 from omnidemo.api.forecasts import router
-from omnidemo.db import SqliteDatabase
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.http_cache import check_etag, tables_etag
 
 
 class UserChart(BaseModel):
@@ -18,12 +19,18 @@ class GetUserChartsResponse(BaseModel):
 
 
 @router.get("/forecasts/get-user-charts")
-async def get_user_charts(username: str, request: Request) -> GetUserChartsResponse:
+async def get_user_charts(
+    username: str, request: Request, response: Response
+) -> GetUserChartsResponse:
     """
     Returns the list of chart descriptions for the given user.
     The charts themselves are not returned, only the metadata.
     """
-    db = SqliteDatabase.from_app(request.app)
+    db = AsyncSqliteDatabase.from_app(request.app)
+    etag = await tables_etag(db, ["user_charts"], username)
+    check_etag(request, response, etag)
 
-    rows = db.fetch_rows("SELECT * FROM user_charts WHERE username = ?", (username,))
+    rows = await db.fetch_rows(
+        "SELECT * FROM user_charts WHERE username = ?", (username,)
+    )
     return GetUserChartsResponse(charts=[UserChart.model_validate(row) for row in rows])
@@ -4,7 +4,8 @@ from pydantic import BaseModel
 
 from omnidemo.api.forecasts import router
 from omnidemo.api.forecasts.get_latest_forecast import Forecast
-from omnidemo.db import SqliteDatabase
+from omnidemo.chart_warmup import chart_warmup
+from omnidemo.db import AsyncSqliteDatabase
 
 
 class PublishForecastRequest(BaseModel):
@@ -20,20 +21,25 @@ async def get_latest_forecast(
     body: PublishForecastRequest, request: Request
 ) -> PublishForecastResponse:
     # TODO: also check that the user has permission for publishing
-    db = SqliteDatabase.from_app(request.app)
-
-    db.execute(
-        """
-        UPDATE forecasts SET status = 'published' WHERE id = ?
-        """,
-        (body.id,),
-    )
-    row = db.fetch_one(
-        """
-        SELECT * FROM forecasts WHERE id = ?
-        """,
-        (body.id,),
-    )
+    db = AsyncSqliteDatabase.from_app(request.app)
+
+    async with db.transaction() as tx:
+        await tx.execute(
+            """
+            UPDATE forecasts SET status = 'published' WHERE id = ?
+            """,
+            (body.id,),
+        )
+        row = await tx.fetch_one(
+            """
+            SELECT * FROM forecasts WHERE id = ?
+            """,
+            (body.id,),
+        )
     forecast = Forecast.model_validate(row)
 
+    # Published forecasts are opened by everyone, so have their charts ready.
+    # This is a no-op if the forecast is not completed yet.
+    chart_warmup.enqueue(body.id)
+
     return PublishForecastResponse(forecast=forecast)
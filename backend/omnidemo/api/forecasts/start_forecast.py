@@ -1,20 +1,19 @@
 from __future__ import annotations
-import asyncio
-import csv
-import io
-import random
-from typing import cast
-from fastapi import BackgroundTasks, HTTPException, Request
+from fastapi import Request
 from pydantic import BaseModel
 
 from omnidemo.api.forecasts import router
 from omnidemo.api.forecasts.get_latest_forecast import Forecast
 from omnidemo.api.jobs.get_job import Job
-from omnidemo.db import SqliteDatabase
+from omnidemo.chart_warmup import chart_warmup
+from omnidemo.db import AnyDict, AsyncSqliteDatabase, Transaction
+from omnidemo.executor import update_queue_positions
+from omnidemo.forecast import INSIGHTS_SQL, LATEST_INPUT_SQL, forecast_memo_key
 
 
 class StartForecastRequest(BaseModel):
-    pass
+    # Run the forecast even if there is one for the same inputs already
+    force: bool = False
 
 
 class StartForecastResponse(BaseModel):
@@ -24,107 +23,119 @@ class StartForecastResponse(BaseModel):
 
 @router.post("/forecasts/start-forecast")
 async def start_forecast(
-    background_tasks: BackgroundTasks, request: Request
+    request: Request, body: StartForecastRequest | None = None
 ) -> StartForecastResponse:
-    db = SqliteDatabase.from_app(request.app)
-
-    # TODO: Check if there is already a forecast in progress
-    # TODO: Also check if there is already a forecast from the latest
-    #       version of the input file.
-    # Note, I don't do it right now because for demo purposes we
-    # want to be able to run the forecast at-will.
-    pass
-
-    # First create a job to track the progress of the forecast
-    job_id = db.generate_uuid()
-    db.execute(
-        "INSERT INTO jobs (id, status) VALUES (?, ?)",
-        (job_id, "running"),
-    )
-    row = db.fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
-    job = Job.model_validate(row)
-
-    # Also create a tentative forecast entry, so that people can see
-    # that a forecast is in progress
-    row = db.insert_row(
-        "INSERT INTO forecasts (file_id, job_id, status) VALUES (?, ?, ?)",
-        (None, job.id, "draft"),
-    )
-    forecast = Forecast.model_validate(row)
-
-    # Run the forecast in the background
-    background_tasks.add_task(run_forecast, db, job.id, forecast.id)
+    """
+    Start a new forecast. If a forecast was already computed from the same
+    input file content and insights, its results are reused, and the job of
+    the new forecast is completed right away. If such a forecast is still
+    queued or running, it is returned instead of starting another one. With
+    `force`, the forecast is computed again in any case.
+    """
+    db = AsyncSqliteDatabase.from_app(request.app)
+    force = body is not None and body.force
+
+    async with db.transaction() as tx:
+        memo_key = await current_memo_key(tx)
+        source = None if force else await find_forecast(db, tx, memo_key)
+        if source is not None and source["job_status"] != "completed":
+            row = await tx.fetch_one(
+                "SELECT * FROM forecasts WHERE id = ?", (source["id"],)
+            )
+            forecast = Forecast.model_validate(row)
+            row = await tx.fetch_one(
+                "SELECT * FROM jobs WHERE id = ?", (source["job_id"],)
+            )
+            return StartForecastResponse(forecast=forecast, job=Job.model_validate(row))
+
+        # First create a job to track the progress of the forecast
+        job_id = db.generate_uuid()
+        if source is None:
+            await tx.execute(
+                "INSERT INTO jobs (id, status) VALUES (?, ?)",
+                (job_id, "queued"),
+            )
+        else:
+            await tx.execute(
+                "INSERT INTO jobs (id, status, progress) VALUES (?, ?, ?)",
+                (job_id, "completed", 1),
+            )
+
+        # Also create a tentative forecast entry, so that people can see
+        # that a forecast is in progress. A reused forecast shares the file.
+        # The key is recorded right away, so that the same request made
+        # while the forecast is running finds it; `run_forecast` records it
+        # again, from the inputs that it has actually read.
+        file_id = source["file_id"] if source else None
+        codec = source["codec"] if source else None
+        row = await tx.insert_row(
+            """
+            INSERT INTO forecasts (file_id, codec, job_id, status, memo_key)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (file_id, codec, job_id, "draft", memo_key),
+        )
+        forecast = Forecast.model_validate(row)
+
+        if source is None:
+            await update_queue_positions(tx)
+        else:
+            # The charts are the same as well
+            await tx.execute(
+                """
+                INSERT INTO charts (forecast_id, chart_key, data, partials)
+                SELECT ?, chart_key, data, partials FROM charts
+                WHERE forecast_id = ?
+                """,
+                (forecast.id, source["id"]),
+            )
+        row = await tx.fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        job = Job.model_validate(row)
+
+    # The job is picked up by any server process with a free forecast worker.
+    # Wake up the executor of this process right away.
+    db.changes.notify()
+    if source is not None:
+        # The charts saved since the reused forecast are not there yet
+        chart_warmup.enqueue(forecast.id)
 
     return StartForecastResponse(forecast=forecast, job=job)
 
 
-async def run_forecast(db: SqliteDatabase, job_id: str, forecast_id: int):
-    async def update_job(progress: float):
-        status = "running" if progress < 1.0 else "completed"
-        db.execute(
-            "UPDATE jobs SET progress = ?, status = ? WHERE id = ?",
-            (progress, status, job_id),
-        )
-        # Add random delays to make it look like we work really hard
-        # Also, at least a 0 delay is needed to allow other threads to
-        # proceed
-        await asyncio.sleep((1 + random.random()) * 0.5)  # ~ U[0.5, 1]
-
-    try:
-        # Locate the input file for the forecast
-        rows = db.fetch_rows(
-            "SELECT stored_name FROM inputs ORDER BY created_at DESC LIMIT 1"
-        )
-        if not rows:
-            raise HTTPException(400, "No input files found")
-        storage_id = cast(str, rows[0]["stored_name"])
-        await update_job(0.1)
-
-        # Collect the notes for the forecast
-        rows = db.fetch_rows(
-            "SELECT message FROM insights ORDER BY created_at ASC",
-        )
-        notes = [row["message"] for row in rows]
-        await update_job(0.2)
-
-        # Download the file from the backend storage
-        file_content = (db.storage / storage_id).read_text()
-        await update_job(0.4)
-
-        # Parse the CSV file
-        csv_file = io.StringIO(file_content)
-        reader = csv.DictReader(csv_file)
-        rows = [row for row in reader]
-        await update_job(0.5)
-
-        # Perform some processing on the parsed data (example)
-        FORECAST_FACTOR = 3 if notes else 2
-        out_rows: list[list[str]] = []
-        for row in rows:
-            forecast = float(row["forecast"]) * FORECAST_FACTOR
-            del row["forecast"]
-            out_rows.append(list(row.values()) + [str(forecast)])
-        await update_job(0.6)
-
-        # Create a CSV file with the forecast results
-        target = db.storage / f"forecasts~{job_id}.csv"
-        with open(target, "w", newline="", encoding="utf-8") as out:
-            headers = [h for h in rows[0].keys() if h != "forecast"] + ["forecast"]
-            writer = csv.writer(out)
-            writer.writerow(headers)
-            writer.writerows(out_rows)
-            await update_job(0.8)
-
-        # Update the entry in the forecasts table
-        db.execute(
-            """UPDATE forecasts SET file_id = ? WHERE id = ?""",
-            (target.name, forecast_id),
-        )
-        await update_job(1.0)
-
-    except Exception as e:
-        # Update the job status to failed
-        db.execute(
-            "UPDATE jobs SET status = ?, error = ? WHERE id = ?",
-            ("failed", str(e), job_id),
-        )
+async def current_memo_key(tx: Transaction) -> str | None:
+    """Key of the forecast for the current input file and insights."""
+    rows = await tx.fetch_rows(LATEST_INPUT_SQL)
+    if not rows:
+        return None
+    insights = await tx.fetch_rows(INSIGHTS_SQL)
+    notes = [row["message"] for row in insights]
+    return forecast_memo_key(rows[0]["sha256"], notes)
+
+
+async def find_forecast(
+    db: AsyncSqliteDatabase, tx: Transaction, memo_key: str | None
+) -> AnyDict | None:
+    """
+    The latest forecast with the given key that is completed, queued or
+    running, if there is any, with the status of its job as `job_status`.
+    """
+    if memo_key is None:
+        return None
+    rows = await tx.fetch_rows(
+        """
+        SELECT forecasts.id, forecasts.job_id, forecasts.file_id, forecasts.codec,
+            jobs.status AS job_status
+        FROM forecasts JOIN jobs ON jobs.id = forecasts.job_id
+        WHERE forecasts.memo_key = ?
+            AND jobs.status IN ('queued', 'running', 'completed')
+        ORDER BY forecasts.id DESC LIMIT 1
+        """,
+        (memo_key,),
+    )
+    if not rows:
+        return None
+    if rows[0]["job_status"] != "completed":
+        return rows[0]
+    if rows[0]["file_id"] and (db.storage / rows[0]["file_id"]).exists():
+        return rows[0]
+    return None
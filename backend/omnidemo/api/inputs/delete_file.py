@@ -0,0 +1,38 @@
+from __future__ import annotations
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+
+from omnidemo.api.inputs import router
+from omnidemo.api.inputs.list_inputs import Input
+from omnidemo.blobs import remove_unused_blobs
+from omnidemo.db import AsyncSqliteDatabase
+
+
+class DeleteFileRequest(BaseModel):
+    id: str
+
+
+class DeleteFileResponse(BaseModel):
+    input: Input
+
+
+@router.post("/inputs/delete-file")
+async def delete_file(body: DeleteFileRequest, request: Request) -> DeleteFileResponse:
+    """
+    Delete an input file. The stored content is removed only when no other
+    input has the same content.
+    """
+    db = AsyncSqliteDatabase.from_app(request.app)
+
+    async with db.transaction() as tx:
+        rows = await tx.fetch_rows("SELECT * FROM inputs WHERE id = ?", (body.id,))
+        if not rows:
+            raise HTTPException(status_code=404, detail=f"File not found: {body.id}")
+        await tx.execute("DELETE FROM inputs WHERE id = ?", (body.id,))
+
+    if rows[0]["sha256"] is None:
+        # Uploaded before the content-addressed storage, not shared
+        (db.storage / rows[0]["stored_name"]).unlink(missing_ok=True)
+    else:
+        await remove_unused_blobs(db)
+    return DeleteFileResponse(input=Input.model_validate(rows[0]))
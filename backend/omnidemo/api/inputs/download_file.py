@@ -1,39 +1,96 @@
 from __future__ import annotations
+import asyncio
+from pathlib import Path
 from typing import AsyncGenerator
-from fastapi import Request, HTTPException
-from fastapi.responses import StreamingResponse
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 
 from omnidemo.api.inputs import router
-from omnidemo.db import SqliteDatabase
+from omnidemo.compression import accepts_encoding
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.storage import Codec, codec_named, decompress
+
+
+class DownloadResponse(FileResponse):
+    """
+    The file is read in a worker thread, one chunk at a time, rather than on
+    the event loop. The chunks are larger than the default, since each read
+    is a round trip to the thread pool.
+    """
+
+    chunk_size = 1024 * 1024
 
 
 @router.get("/inputs/download-file")
-async def download_file(id: str, request: Request):
-    db = SqliteDatabase.from_app(request.app)
+async def download_file(id: str, request: Request) -> Response:
+    """
+    Download an input file, or the output file of a forecast. Supports the
+    `Range` and `If-Range` headers, so that downloads can be resumed.
+
+    Compressed files are sent as they are stored, with `Content-Encoding`,
+    if the client accepts that encoding; otherwise they are decompressed on
+    the fly, and then the ranges are not supported.
+    """
+    db = AsyncSqliteDatabase.from_app(request.app)
 
     file = db.storage / id
     if file.exists():
         file_name = file.name
         stored_name = file.name
+        rows = await db.fetch_rows(
+            "SELECT codec FROM forecasts WHERE file_id = ? LIMIT 1", (id,)
+        )
+        codec_name = rows[0]["codec"] if rows else None
     else:
-        row = db.fetch_one(
-            """SELECT file_name, stored_name FROM inputs WHERE id = ?""", (id,)
+        row = await db.fetch_one(
+            "SELECT file_name, stored_name, codec FROM inputs WHERE id = ?", (id,)
         )
         file_name = row["file_name"]
         stored_name = row["stored_name"]
+        codec_name = row["codec"]
 
     path = db.storage / stored_name
     if not path.exists():
         raise HTTPException(status_code=404, detail=f"File not found: {stored_name}")
 
-    async def file_generator() -> AsyncGenerator[bytes, None]:
-        chunk_size = 1024 * 1024
-        with open(path, mode="rb") as file:
-            while chunk := file.read(chunk_size):
-                yield chunk
-
+    codec = codec_named(codec_name)
+    if codec is None:
+        return DownloadResponse(
+            path, media_type="application/octet-stream", filename=file_name
+        )
+    file_name = file_name.removesuffix(codec.suffix)
+    headers = {"Vary": "Accept-Encoding"}
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if codec.content_encoding and accepts_encoding(
+        accept_encoding, codec.content_encoding
+    ):
+        headers["Content-Encoding"] = codec.content_encoding
+        return DownloadResponse(
+            path,
+            media_type="application/octet-stream",
+            filename=file_name,
+            headers=headers,
+        )
+    headers["Content-Disposition"] = content_disposition(file_name)
     return StreamingResponse(
-        file_generator(),
+        decompressed_chunks(path, codec),
         media_type="application/octet-stream",
-        headers={"Content-Disposition": f"attachment;filename={file_name}"},
+        headers=headers,
     )
+
+
+def content_disposition(file_name: str) -> str:
+    """The `Content-Disposition` header, the same as that of `FileResponse`."""
+    quoted = quote(file_name)
+    if quoted != file_name:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{file_name}"'
+
+
+async def decompressed_chunks(path: Path, codec: Codec) -> AsyncGenerator[bytes, None]:
+    """Read the file decompressing it in a worker thread, one chunk at a time."""
+    with open(path, "rb") as raw, decompress(raw, codec) as file:
+        while chunk := await asyncio.to_thread(file.read, DownloadResponse.chunk_size):
+            yield chunk
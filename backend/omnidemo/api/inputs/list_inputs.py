@@ -1,13 +1,17 @@
 from __future__ import annotations
-from omnidemo.db import SqliteDatabase
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.http_cache import check_etag, tables_etag
+from omnidemo.pagination import DEFAULT_LIMIT, MAX_LIMIT, fetch_page
 from pydantic import BaseModel
 
 from omnidemo.api.inputs import router
-from fastapi import Request
+from fastapi import Query, Request, Response
 
 
 class Input(BaseModel):
     id: str
+    # Number of the upload, by which the inputs are paginated
+    seq: int
     file_name: str
     username: str
     size: int
@@ -16,10 +20,29 @@ class Input(BaseModel):
 
 class ListInputsResponse(BaseModel):
     inputs: list[Input]
+    # Pass this as `after` (or `since`) to get the next page
+    next_cursor: str | None = None
 
 
 @router.get("/inputs/list-inputs")
-async def list_inputs(request: Request) -> ListInputsResponse:
-    db = SqliteDatabase.from_app(request.app)
-    rows = db.fetch_rows("SELECT * FROM inputs")
-    return ListInputsResponse(inputs=[Input.model_validate(row) for row in rows])
+async def list_inputs(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    after: str | None = None,
+    since: str | None = None,
+) -> ListInputsResponse:
+    """
+    Returns a page of the input files, newest first. With `since`, returns
+    only the files uploaded after that cursor, oldest first. See
+    `fetch_page()`.
+    """
+    db = AsyncSqliteDatabase.from_app(request.app)
+    etag = await tables_etag(db, ["inputs"], limit, after, since)
+    check_etag(request, response, etag)
+    rows, next_cursor = await fetch_page(
+        db, "inputs", key="seq", limit=limit, after=after, since=since
+    )
+    return ListInputsResponse(
+        inputs=[Input.model_validate(row) for row in rows], next_cursor=next_cursor
+    )
@@ -1,10 +1,13 @@
 from __future__ import annotations
-from pathlib import Path
+import asyncio
 from pydantic import BaseModel
 from fastapi import Form, Request, UploadFile, File, HTTPException
 
 from omnidemo.api.inputs import router
-from omnidemo.db import SqliteDatabase
+from omnidemo.blobs import BlobWriter, store_blob
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.jobs import job_registry, update_job
+from omnidemo.storage import codec_name
 
 
 class UploadFileResponse(BaseModel):
@@ -19,47 +22,69 @@ async def upload_file(
     job_id: str = Form(...),
     file: UploadFile = File(...),
 ) -> UploadFileResponse:
-    db = SqliteDatabase.from_app(request.app)
+    db = AsyncSqliteDatabase.from_app(request.app)
     if not username:
         raise HTTPException(status_code=400, detail="Username is required")
     if not job_id:
         raise HTTPException(status_code=400, detail="Job ID is required")
 
     # Create an entry in the jobs table
-    db.execute(
-        "INSERT INTO jobs (id, status, progress) VALUES (?, ?, ?)",
-        (job_id, "running", 0),
-    )
+    async with db.transaction() as tx:
+        await tx.execute(
+            "INSERT INTO jobs (id, status, progress) VALUES (?, ?, ?)",
+            (job_id, "running", 0),
+        )
+        job = await tx.fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    job_registry.add(job)
 
-    # Read the file and save it to the local storage directory
-    f = Path(file.filename or "")
-    target = db.storage / f"{f.stem}~{job_id}{'.'.join(f.suffixes)}"
+    # Read the file into the storage, hashing it on the way. The chunks are
+    # written in a worker thread, so as not to block the event loop.
+    writer = BlobWriter(db.storage)
     file_size_total = file.size or 1
-    file_size_read = 0
-    with open(target, "wb") as out:
+    try:
         while chunk := await file.read(1024 * 1024):
-            out.write(chunk)
-            file_size_read += len(chunk)
-            db.execute(
-                "UPDATE jobs SET progress = ? WHERE id = ?",
-                (file_size_read / file_size_total, job_id),
-            )
+            await asyncio.to_thread(writer.write, chunk)
+            await update_job(db, job_id, progress=writer.size / file_size_total)
+
+        async with db.transaction() as tx:
+            # Identical uploads share the same blob, so the file is stored only
+            # if its content is new
+            stored_name, codec = await store_blob(tx, writer)
 
-    # After uploading, create an entry in the `inputs` table
-    db.execute(
-        """
-        INSERT INTO inputs (id, file_name, stored_name, username, size) 
-        VALUES (?, ?, ?, ?, ?)
-        """,
-        (job_id, file.filename, target.name, username, file_size_total),
-    )
+            # After uploading, create an entry in the `inputs` table
+            await tx.execute(
+                """
+                INSERT INTO inputs (
+                    id, file_name, stored_name, codec, username, size, sha256
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job_id,
+                    file.filename,
+                    stored_name,
+                    codec_name(codec),
+                    username,
+                    file_size_total,
+                    writer.sha256,
+                ),
+            )
 
-    # Update the job status to completed
-    db.execute(
-        """
-        UPDATE jobs SET status = ?, progress = ? WHERE id = ?
-        """,
-        ("completed", 1, job_id),
-    )
+            # Update the job status to completed
+            await tx.execute(
+                """
+                UPDATE jobs SET status = ?, progress = ? WHERE id = ?
+                """,
+                ("completed", 1, job_id),
+            )
+            job = await tx.fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    except BaseException as e:
+        # Also when the client has disconnected: the job must not be left
+        # running, which would keep it in the registry forever
+        writer.discard()
+        error = str(e) or type(e).__name__
+        await asyncio.shield(update_job(db, job_id, status="failed", error=error))
+        raise
+    job_registry.remove(job)
 
     return UploadFileResponse(file_id=job_id, file_size=file_size_total)
@@ -2,8 +2,10 @@ from __future__ import annotations
 from pydantic import BaseModel
 
 from omnidemo.api.insights import router
-from omnidemo.db import SqliteDatabase
-from fastapi import Request
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.http_cache import check_etag, tables_etag
+from omnidemo.pagination import DEFAULT_LIMIT, MAX_LIMIT, fetch_page
+from fastapi import Query, Request, Response
 
 
 class Insight(BaseModel):
@@ -15,12 +17,29 @@ class Insight(BaseModel):
 
 class ListInsightsResponse(BaseModel):
     insights: list[Insight]
+    # Pass this as `after` (or `since`) to get the next page
+    next_cursor: str | None = None
 
 
 @router.get("/insights/list-insights")
-async def list_insights(request: Request) -> ListInsightsResponse:
-    db = SqliteDatabase.from_app(request.app)
-    data = db.fetch_rows("SELECT * FROM insights")
+async def list_insights(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    after: str | None = None,
+    since: str | None = None,
+) -> ListInsightsResponse:
+    """
+    Returns a page of the insights, newest first. With `since`, returns only
+    the insights posted after that cursor, oldest first. See `fetch_page()`.
+    """
+    db = AsyncSqliteDatabase.from_app(request.app)
+    etag = await tables_etag(db, ["insights"], limit, after, since)
+    check_etag(request, response, etag)
+    rows, next_cursor = await fetch_page(
+        db, "insights", key="id", limit=limit, after=after, since=since
+    )
     return ListInsightsResponse(
-        insights=[Insight.model_validate(row) for row in data],
+        insights=[Insight.model_validate(row) for row in rows],
+        next_cursor=next_cursor,
     )
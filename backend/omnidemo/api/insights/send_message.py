@@ -4,7 +4,7 @@ from pydantic import BaseModel
 
 from omnidemo.api.insights import router
 from omnidemo.api.insights.list_insights import Insight
-from omnidemo.db import SqliteDatabase
+from omnidemo.db import AsyncSqliteDatabase
 
 
 class SendMessageRequest(BaseModel):
@@ -20,9 +20,9 @@ class SendMessageResponse(BaseModel):
 async def send_message(
     body: SendMessageRequest, request: Request
 ) -> SendMessageResponse:
-    db = SqliteDatabase.from_app(request.app)
+    db = AsyncSqliteDatabase.from_app(request.app)
 
-    row = db.insert_row(
+    row = await db.insert_row(
         """
         INSERT INTO insights (message, username)
         VALUES (?, ?)
@@ -4,7 +4,7 @@ from pydantic import BaseModel
 
 from omnidemo.api.insights import router
 from omnidemo.api.insights.list_insights import Insight
-from omnidemo.db import SqliteDatabase
+from omnidemo.db import AsyncSqliteDatabase
 
 
 class UpdateMessageRequest(BaseModel):
@@ -21,19 +21,20 @@ class UpdateMessageResponse(BaseModel):
 async def update_message(
     body: UpdateMessageRequest, request: Request
 ) -> UpdateMessageResponse:
-    db = SqliteDatabase.from_app(request.app)
-
-    db.execute(
-        """
-        UPDATE insights
-        SET message = ?
-        WHERE id = ? AND username = ?
-        """,
-        (body.message.strip(), body.message_id, body.username),
-    )
-    row = db.fetch_one(
-        "SELECT * FROM insights WHERE id = ?",
-        (body.message_id,),
-    )
+    db = AsyncSqliteDatabase.from_app(request.app)
+
+    async with db.transaction() as tx:
+        await tx.execute(
+            """
+            UPDATE insights
+            SET message = ?
+            WHERE id = ? AND username = ?
+            """,
+            (body.message.strip(), body.message_id, body.username),
+        )
+        row = await tx.fetch_one(
+            "SELECT * FROM insights WHERE id = ?",
+            (body.message_id,),
+        )
 
     return UpdateMessageResponse(insight=Insight.model_validate(row))
@@ -3,3 +3,4 @@ from fastapi import APIRouter
 router = APIRouter()
 
 import omnidemo.api.jobs.get_job  # type: ignore[import]
+import omnidemo.api.jobs.stream_job  # type: ignore[import]
@@ -1,18 +1,22 @@
 from __future__ import annotations
-from fastapi import Request
+from fastapi import Request, Response
 from pydantic import BaseModel
 from typing import Literal
 
 from omnidemo.api.jobs import router
-from omnidemo.db import SqliteDatabase
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.http_cache import check_etag, digest
+from omnidemo.jobs import job_registry
 
 
 class Job(BaseModel):
     id: str
     progress: float
-    status: Literal["running", "completed", "failed"]
+    status: Literal["queued", "running", "completed", "failed", "cancelled"]
     error: str | None = None
     created_at: str
+    # Position in the forecast queue, while the job is queued
+    queue_position: int | None = None
 
 
 class GetJobResponse(BaseModel):
@@ -20,7 +24,15 @@ class GetJobResponse(BaseModel):
 
 
 @router.get("/jobs/get-job")
-async def get_job(id: str, request: Request) -> GetJobResponse:
-    db = SqliteDatabase.from_app(request.app)
-    row = db.fetch_one("SELECT * FROM jobs WHERE id = ?", (id,))
-    return GetJobResponse(job=Job.model_validate(row))
+async def get_job(id: str, request: Request, response: Response) -> GetJobResponse:
+    db = AsyncSqliteDatabase.from_app(request.app)
+    # The progress of the jobs running in this process is most up-to-date
+    # in memory, since it is written into the database only periodically
+    row = job_registry.get(id)
+    if row is None:
+        row = await db.fetch_one("SELECT * FROM jobs WHERE id = ?", (id,))
+    out = GetJobResponse(job=Job.model_validate(row))
+    # For the same reason, the ETag is of the content rather than of the
+    # version of the `jobs` table
+    check_etag(request, response, f'W/"{digest(out.model_dump_json().encode())}"')
+    return out
@@ -0,0 +1,58 @@
+from __future__ import annotations
+from typing import AsyncIterator
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from omnidemo.api.jobs import router
+from omnidemo.api.jobs.get_job import GetJobResponse, Job
+from omnidemo.db import AnyDict, AsyncSqliteDatabase
+from omnidemo.jobs import JobSubscription, job_hub, job_registry
+from omnidemo.settings import settings
+
+
+@router.get("/jobs/stream", response_class=StreamingResponse)
+async def stream_job(id: str, request: Request) -> StreamingResponse:
+    """
+    Server-Sent Events stream with the progress of the job. Every message
+    has the same payload as `get-job`, and is sent whenever the job changes.
+    The stream ends once the job is finished.
+    """
+    db = AsyncSqliteDatabase.from_app(request.app)
+
+    # Subscribe before reading the job, so that no update is lost in between
+    subscription = job_hub.subscribe(id)
+    try:
+        job = job_registry.get(id)
+        if job is None:
+            rows = await db.fetch_rows("SELECT * FROM jobs WHERE id = ?", (id,))
+            job = rows[0] if rows else None
+        if job is None:
+            # The client may open the stream before the job is created
+            job = await subscription.get(settings.job_stream_start_timeout)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job not found: {id}")
+    except BaseException:
+        subscription.close()
+        raise
+
+    return StreamingResponse(
+        job_events(job, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(subscription.close),
+    )
+
+
+async def job_events(job: AnyDict, subscription: JobSubscription) -> AsyncIterator[str]:
+    last_message = None
+    while True:
+        message = GetJobResponse(job=Job.model_validate(job)).model_dump_json()
+        if message != last_message:
+            yield f"data: {message}\n\n"
+            last_message = message
+        if job["status"] not in ("queued", "running"):
+            return
+        while (update := await subscription.get(settings.job_stream_keepalive)) is None:
+            yield ": keep-alive\n\n"
+        job = update
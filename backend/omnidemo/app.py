@@ -7,7 +7,13 @@ from fastapi import FastAPI
 from fastapi.responses import UJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from omnidemo.db import SqliteDatabase
+from omnidemo.chart_cache import chart_cache
+from omnidemo.chart_warmup import chart_warmup
+from omnidemo.compression import CompressionMiddleware
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.executor import ForecastExecutor
+from omnidemo.jobs import job_registry
+from omnidemo.settings import settings
 
 
 def get_app() -> FastAPI:
@@ -35,6 +41,12 @@ def get_app() -> FastAPI:
         allow_headers=["*"],
     )
 
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.compression_min_size,
+        cache_size=settings.compression_cache_size,
+    )
+
     # Main router for the API.
     app.include_router(router=api_router, prefix="/api")
 
@@ -57,6 +69,20 @@ async def lifespan_setup(
 
     app.middleware_stack = None
     app.middleware_stack = app.build_middleware_stack()
-    app.state.db = SqliteDatabase.connect()
+    db = AsyncSqliteDatabase.connect()
+    db.changes.start()
+    job_registry.start(db)
+    chart_cache.start(db)
+    chart_warmup.start(db)
+    app.state.db = db
+    app.state.forecasts = ForecastExecutor(db, settings.forecast_workers)
+    app.state.forecasts.start()
 
     yield
+
+    await app.state.forecasts.stop()
+    await job_registry.stop()
+    await chart_cache.stop()
+    await chart_warmup.stop()
+    await db.changes.stop()
+    await db.close()
@@ -0,0 +1,104 @@
+from __future__ import annotations
+import hashlib
+import uuid
+from pathlib import Path
+
+from omnidemo.db import AsyncSqliteDatabase, Transaction
+from omnidemo.storage import CODECS, Codec, compress, storage_codec
+
+# Directory of the blobs within the storage
+BLOBS_DIR = "blobs"
+
+
+def blob_name(sha256: str, suffix: str = "") -> str:
+    """
+    Location of the blob relative to the storage directory, which is what
+    the `stored_name` of an input points to. The blobs are spread over
+    subdirectories by the first two characters of the hash. The `suffix`
+    is that of the blob's compression, see `omnidemo.storage`.
+    """
+    return f"{BLOBS_DIR}/{sha256[:2]}/{sha256}{suffix}"
+
+
+def blob_variants(sha256: str) -> list[tuple[str, Codec | None]]:
+    """All the names that the blob may be stored under, with their codecs."""
+    codecs: list[Codec | None] = [None, *CODECS.values()]
+    return [
+        (blob_name(sha256, codec.suffix if codec else ""), codec) for codec in codecs
+    ]
+
+
+def blob_names(sha256: str) -> list[str]:
+    """All the names that the blob may be stored under."""
+    return [name for name, _ in blob_variants(sha256)]
+
+
+class BlobWriter:
+    """
+    Writes an uploaded file into a temporary file within the storage,
+    compressing it and computing the SHA-256 of its content along the way.
+    Once the upload is complete, the file is moved into the content-addressed
+    storage with `store_blob()`.
+    """
+
+    def __init__(self, storage: Path):
+        self.storage = storage
+        self.codec = storage_codec()
+        self.path = storage / BLOBS_DIR / f"{uuid.uuid4().hex}.partial"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Size of the content, before the compression
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._raw = open(self.path, "wb")
+        self._file = compress(self._raw, self.codec)
+
+    def write(self, chunk: bytes) -> None:
+        self._file.write(chunk)
+        self._hash.update(chunk)
+        self.size += len(chunk)
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def close(self) -> None:
+        self._file.close()
+        self._raw.close()
+
+    def discard(self) -> None:
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+async def store_blob(tx: Transaction, writer: BlobWriter) -> tuple[str, Codec | None]:
+    """
+    Store the written file as a blob, unless the same content is stored
+    already, and return the blob's name and codec. The inputs that point to
+    the blob must be inserted within the same transaction: while it holds
+    the write lock, the blob cannot be removed by `remove_unused_blobs()`.
+    """
+    writer.close()
+    await tx.execute(
+        "INSERT OR IGNORE INTO blobs (sha256, size) VALUES (?, ?)",
+        (writer.sha256, writer.size),
+    )
+    # The blob may have been stored with a different compression
+    for name, codec in blob_variants(writer.sha256):
+        if (writer.storage / name).exists():
+            writer.discard()
+            return name, codec
+    name = blob_name(writer.sha256, writer.codec.suffix if writer.codec else "")
+    target = writer.storage / name
+    target.parent.mkdir(parents=True, exist_ok=True)
+    writer.path.replace(target)
+    return name, writer.codec
+
+
+async def remove_unused_blobs(db: AsyncSqliteDatabase) -> None:
+    """Remove the blobs that are no longer referenced by any input."""
+    async with db.transaction() as tx:
+        rows = await tx.fetch_rows("SELECT sha256 FROM blobs WHERE refcount <= 0")
+        for row in rows:
+            await tx.execute("DELETE FROM blobs WHERE sha256 = ?", (row["sha256"],))
+            for name in blob_names(row["sha256"]):
+                (db.storage / name).unlink(missing_ok=True)
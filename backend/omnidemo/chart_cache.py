@@ -0,0 +1,173 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import logging
+from collections import OrderedDict
+
+from omnidemo.db import AnyDict, AsyncSqliteDatabase
+from omnidemo.settings import settings
+
+logger = logging.getLogger(__name__)
+
+ChartCacheKey = tuple[int, str]
+
+# The tables whose changes may make the cached charts stale
+CHART_TABLES = ("charts", "forecasts")
+
+# Approximate memory used by an entry in addition to its body: the key, the
+# dict slot and the bytes object header
+ENTRY_OVERHEAD = 200
+
+
+class ChartCache:
+    """
+    In-memory cache of the encoded `get-chart` responses, keyed by
+    `(forecast_id, chart_key)`. The entries are evicted in the LRU order
+    once their total size exceeds `max_bytes`.
+
+    A chart depends on the file of its forecast. The cache remembers which
+    file each cached forecast had, and after every change of the forecasts
+    (or of the stored charts) re-reads the files of the cached forecasts:
+    the charts of a forecast whose file has changed are dropped. The changes
+    are detected by the `ChangeNotifier`, and told apart from the changes of
+    the other tables by their `table_versions`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Incremented on every change of the `CHART_TABLES`, see `put()`
+        self.version = 0
+        self._entries: OrderedDict[ChartCacheKey, bytes] = OrderedDict()
+        self._size = 0
+        # File id and cached chart keys of each forecast in the cache
+        self._file_ids: dict[int, str] = {}
+        self._chart_keys: dict[int, set[str]] = {}
+        self._task: asyncio.Task[None] | None = None
+
+    def get(self, forecast_id: int, chart_key: str) -> bytes | None:
+        key = (forecast_id, chart_key)
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(
+        self, forecast_id: int, chart_key: str, file_id: str, body: bytes, version: int
+    ) -> None:
+        """
+        Store the response body of a chart computed from the forecast file
+        `file_id`. The `version` must be taken before the chart was read from
+        the database: if the database has changed since, the chart may be
+        stale and is not stored.
+        """
+        if version != self.version or entry_size(chart_key, body) > self.max_bytes:
+            return
+        if self._file_ids.get(forecast_id, file_id) != file_id:
+            self.invalidate(forecast_id)
+            return
+        self._remove((forecast_id, chart_key))
+        self._entries[(forecast_id, chart_key)] = body
+        self._size += entry_size(chart_key, body)
+        self._file_ids[forecast_id] = file_id
+        self._chart_keys.setdefault(forecast_id, set()).add(chart_key)
+        while self._size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, forecast_id: int) -> None:
+        """Drop all charts of the forecast."""
+        self.version += 1
+        for chart_key in list(self._chart_keys.get(forecast_id, ())):
+            self._remove((forecast_id, chart_key))
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "size": self._size,
+            "max_size": self.max_bytes,
+        }
+
+    def start(self, db: AsyncSqliteDatabase) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch(db))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def _remove(self, key: ChartCacheKey) -> None:
+        body = self._entries.pop(key, None)
+        if body is None:
+            return
+        forecast_id, chart_key = key
+        self._size -= entry_size(chart_key, body)
+        chart_keys = self._chart_keys[forecast_id]
+        chart_keys.discard(chart_key)
+        if not chart_keys:
+            del self._chart_keys[forecast_id]
+            del self._file_ids[forecast_id]
+
+    async def _watch(self, db: AsyncSqliteDatabase) -> None:
+        versions: list[AnyDict] = []
+        change = db.changes.next_change()
+        while True:
+            await change.wait()
+            # Take the next event before querying, so that the changes made
+            # while the query runs are not missed
+            change = db.changes.next_change()
+            try:
+                versions = await self._check(db, versions)
+            except Exception:
+                logger.exception("Failed to check the cached charts")
+
+    async def _check(
+        self, db: AsyncSqliteDatabase, versions: list[AnyDict]
+    ) -> list[AnyDict]:
+        """
+        Drop the charts of the forecasts whose file has changed, if any of
+        the `CHART_TABLES` has changed since `versions`. Returns the current
+        versions of the tables.
+        """
+        placeholders = ", ".join("?" for _ in CHART_TABLES)
+        rows = await db.fetch_rows(
+            f"""
+            SELECT name, version FROM table_versions
+            WHERE name IN ({placeholders}) ORDER BY name
+            """,
+            CHART_TABLES,
+        )
+        if rows == versions:
+            return rows
+        # The charts that are being read from the database right now may
+        # predate the change, so they are not cached
+        self.version += 1
+        forecast_ids = list(self._file_ids)
+        if not forecast_ids:
+            return rows
+        placeholders = ", ".join("?" for _ in forecast_ids)
+        forecasts = await db.fetch_rows(
+            f"SELECT id, file_id FROM forecasts WHERE id IN ({placeholders})",
+            tuple(forecast_ids),
+        )
+        file_ids = {row["id"]: row["file_id"] for row in forecasts}
+        for forecast_id in forecast_ids:
+            cached = self._file_ids.get(forecast_id)
+            if cached is not None and file_ids.get(forecast_id) != cached:
+                self.invalidate(forecast_id)
+        return rows
+
+
+def entry_size(chart_key: str, body: bytes) -> int:
+    return len(body) + len(chart_key) + ENTRY_OVERHEAD
+
+
+chart_cache = ChartCache(settings.chart_cache_size)
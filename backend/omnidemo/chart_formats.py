@@ -0,0 +1,132 @@
+"""
+Encodings of the `get-chart` responses.
+
+- `rows` (the default): the chart's `data` is the list of rows
+  `[[*x_values, y], ...]`. The JSON of the rows is spliced into the
+  response as it is stored, without being parsed.
+- `columns`: `data` is an object `{"n_rows": N, "columns": [...]}` with one
+  entry per field of the chart key. The x-columns are dictionary-encoded,
+  `{"name", "dictionary": [...], "codes": [...]}`, and the y-column is
+  `{"name", "values": [...]}`.
+- `binary`: the same columns, as typed arrays. The body is a little-endian
+  uint32 length of a JSON header, the header, and then the arrays, each
+  aligned to 8 bytes. The header is the `columns` response, in which the
+  `codes` and `values` are replaced by `{"type", "offset"}`: the type is
+  one of `u1`, `u2`, `u4` (unsigned integers) or `f8` (float64), and the
+  offset is from the end of the header, rounded up to 8 bytes. This is
+  read by the browser into typed arrays without copying.
+
+The format is chosen by the `format` parameter, or else by the `Accept`
+header of the request.
+
+The `get-charts` responses are `{"charts": [...]}` in the JSON formats. In
+the `binary` format, the body is a little-endian uint32 count of the charts
+and a uint32 length of each, followed by the `binary` bodies of the charts,
+each starting at an offset aligned to 8 bytes.
+"""
+
+from __future__ import annotations
+import json
+import struct
+from typing import Any
+
+import numpy as np
+
+from omnidemo.charts import ChartKey
+from omnidemo.db import AnyDict
+
+COLUMNS_TYPE = "application/vnd.omnidemo.chart-columns+json"
+BINARY_TYPE = "application/vnd.omnidemo.chart-columns"
+MEDIA_TYPES = {
+    "rows": "application/json",
+    "columns": COLUMNS_TYPE,
+    "binary": BINARY_TYPE,
+}
+
+# Fields of the chart, other than its data
+CHART_FIELDS = ["id", "forecast_id", "chart_key", "created_at"]
+
+# Start of the body of a `rows` response, which is followed by the chart
+CHART_PREFIX = b'{"chart": '
+
+
+def chart_format(format: str | None, accept: str) -> str:
+    """The format of the response, per the request."""
+    if format is not None:
+        return format
+    media_types = {item.split(";")[0].strip().lower() for item in accept.split(",")}
+    for name in ["binary", "columns"]:
+        if MEDIA_TYPES[name] in media_types:
+            return name
+    return "rows"
+
+
+def encode_chart(format: str, row: AnyDict) -> bytes:
+    """
+    The body of the response for the chart row, whose `data` is the JSON of
+    the rows, as bytes.
+    """
+    chart = {field: row[field] for field in CHART_FIELDS}
+    if format == "rows":
+        meta = json.dumps(chart).encode()
+        return CHART_PREFIX + meta[:-1] + b', "data": ' + row["data"] + b"}}"
+
+    key = ChartKey.parse(row["chart_key"])
+    rows = json.loads(row["data"])
+    names = [*key.x_fields, key.y_field]
+    if format == "columns":
+        chart["data"] = {"n_rows": len(rows), "columns": _columns(names, rows)}
+        return json.dumps({"chart": chart}).encode()
+
+    columns = _columns(names, rows)
+    buffers = bytearray()
+    for column in columns:
+        if "codes" in column:
+            dtype = _code_dtype(column["dictionary"])
+            field, array = "codes", np.asarray(column["codes"], dtype=dtype)
+        else:
+            field, array = "values", np.asarray(column["values"], dtype="<f8")
+        column[field] = {"type": array.dtype.str[1:], "offset": len(buffers)}
+        buffers += array.tobytes()
+        buffers += bytes(_align(len(buffers)) - len(buffers))
+    chart["data"] = {"n_rows": len(rows), "columns": columns}
+
+    header = json.dumps({"chart": chart}).encode()
+    prefix = struct.pack("<I", len(header)) + header
+    return prefix + bytes(_align(len(prefix)) - len(prefix)) + buffers
+
+
+def encode_charts(format: str, bodies: list[bytes]) -> bytes:
+    """The body of the `get-charts` response, from the bodies of the charts."""
+    if format == "binary":
+        out = bytearray(
+            struct.pack(f"<I{len(bodies)}I", len(bodies), *map(len, bodies))
+        )
+        for body in bodies:
+            out += bytes(_align(len(out)) - len(out))
+            out += body
+        return bytes(out)
+    # Both JSON formats start with the same prefix
+    charts = [body[len(CHART_PREFIX) : -1] for body in bodies]
+    return b'{"charts": [' + b", ".join(charts) + b"]}"
+
+
+def _columns(names: list[str], rows: list[list[Any]]) -> list[dict[str, Any]]:
+    columns: list[dict[str, Any]] = []
+    for i, name in enumerate(names[:-1]):
+        dictionary: dict[Any, int] = {}
+        codes = [dictionary.setdefault(row[i], len(dictionary)) for row in rows]
+        columns.append({"name": name, "dictionary": list(dictionary), "codes": codes})
+    columns.append({"name": names[-1], "values": [row[-1] for row in rows]})
+    return columns
+
+
+def _code_dtype(dictionary: list[Any]) -> str:
+    for dtype in ["<u1", "<u2"]:
+        if len(dictionary) <= np.iinfo(dtype).max + 1:
+            return dtype
+    return "<u4"
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) // 8 * 8
@@ -0,0 +1,206 @@
+"""
+Reduced variants of a chart's data, for the charts that have more groups
+than can be drawn: sorted, limited to the top groups, or downsampled. The
+full chart is computed (and stored) once, and its variants are derived
+from it.
+"""
+
+from __future__ import annotations
+import datetime
+import math
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from omnidemo.charts import (
+    ChartData,
+    ChartKey,
+    FloatArray,
+    IntArray,
+    group_partials,
+    merge_partials,
+    partial_value,
+)
+
+SORTS = ("x", "-x", "y", "-y")
+DOWNSAMPLES = ("lttb", "bucket")
+
+# x-value of the group that collects everything outside of the top groups
+OTHER_LABEL = "(other)"
+
+
+@dataclass(frozen=True)
+class ChartView:
+    """
+    A variant of the chart's data:
+
+    - `sort`: order of the groups, by the x-values or by y (`-` for the
+      descending order); by default, the groups are in the order of their
+      first appearance in the data;
+    - `top`: keep only the `top` groups with the largest y, and merge the
+      others into a single group labelled `OTHER_LABEL`, which comes last;
+    - `points`: downsample a chart with a numeric or date x-axis to at most
+      this many points, ordered by x. With `downsample="lttb"`, the points
+      that preserve the shape of the line are kept (Largest-Triangle-Three-
+      Buckets); with `downsample="bucket"`, consecutive points are merged
+      into buckets of equal size, each labelled by its first x-value.
+    """
+
+    sort: str | None = None
+    top: int | None = None
+    points: int | None = None
+    downsample: str = "lttb"
+
+    def __post_init__(self) -> None:
+        if self.sort is not None and self.sort not in SORTS:
+            raise ValueError(f"Unsupported sort order: {self.sort}")
+        if self.downsample not in DOWNSAMPLES:
+            raise ValueError(f"Unsupported downsampling: {self.downsample}")
+        if self.top is not None and self.points is not None:
+            raise ValueError("Parameters `top` and `points` are exclusive")
+
+    @property
+    def is_full(self) -> bool:
+        """Whether this is the full chart, as it is stored."""
+        return self.sort is None and self.top is None and self.points is None
+
+    def cache_key(self, chart_key: str) -> str:
+        """The key under which this variant of the chart is cached."""
+        if self.is_full:
+            return chart_key
+        params = [f"sort={self.sort}" if self.sort else ""]
+        if self.top is not None:
+            params.append(f"top={self.top}")
+        if self.points is not None:
+            params.append(f"points={self.points}&downsample={self.downsample}")
+        return f"{chart_key}?{'&'.join(p for p in params if p)}"
+
+    def apply(self, key: ChartKey, data: ChartData) -> list[list[Any]]:
+        """The rows of this variant of the chart."""
+        rows = data.rows
+        other: list[list[Any]] = []
+        if self.points is not None:
+            rows = self._downsample(key, data)
+        elif self.top is not None and len(rows) > self.top:
+            rows, other = self._top(key, data)
+        if self.sort is not None:
+            rows = _sorted(rows, self.sort)
+        return rows + other
+
+    def _top(
+        self, key: ChartKey, data: ChartData
+    ) -> tuple[list[list[Any]], list[list[Any]]]:
+        """The top groups, in their original order, and the "other" group."""
+        assert self.top is not None
+        rows = data.rows
+        partials = group_partials(key.agg, data)
+        order = sorted(range(len(rows)), key=lambda i: rows[i][-1], reverse=True)
+        merged = list(partials[order[self.top]])
+        for i in order[self.top + 1 :]:
+            merge_partials(key.agg, merged, partials[i])
+        other = [OTHER_LABEL] * len(key.x_fields) + [partial_value(key.agg, merged)]
+        return [rows[i] for i in sorted(order[: self.top])], [other]
+
+    def _downsample(self, key: ChartKey, data: ChartData) -> list[list[Any]]:
+        assert self.points is not None
+        if len(key.x_fields) != 1:
+            raise ValueError("Only the charts with a single x-field are downsampled")
+        rows = data.rows
+        axis = [_axis_value(row[0]) for row in rows]
+        if any(x is None and not _is_empty(row[0]) for x, row in zip(axis, rows)):
+            raise ValueError("Only the numeric or date x-axes are downsampled")
+        # The groups with an empty x-value have no place on the axis
+        placed = sorted((x, i) for i, x in enumerate(axis) if x is not None)
+        indices = [i for _, i in placed]
+        if len(indices) <= self.points:
+            return [rows[i] for i in indices]
+
+        if self.downsample == "lttb":
+            x = np.array([x for x, _ in placed], dtype=np.float64)
+            y = np.array([rows[i][-1] for i in indices], dtype=np.float64)
+            return [rows[indices[j]] for j in lttb(x, y, self.points).tolist()]
+
+        partials = group_partials(key.agg, data)
+        result = []
+        for bucket in np.array_split(np.array(indices), self.points):
+            first, *rest = bucket.tolist()
+            merged = list(partials[first])
+            for i in rest:
+                merge_partials(key.agg, merged, partials[i])
+            result.append([rows[first][0], partial_value(key.agg, merged)])
+        return result
+
+
+def lttb(x: FloatArray, y: FloatArray, n_out: int) -> IntArray:
+    """
+    Indices of the `n_out` points of the line `(x, y)` (sorted by x) chosen
+    by the Largest-Triangle-Three-Buckets algorithm: the first and the last
+    points are kept, and the rest are split into `n_out - 2` buckets. From
+    each bucket, the point that makes the largest triangle with the point
+    chosen from the previous bucket and the average of the next bucket is
+    taken.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    every = (n - 2) / (n_out - 2)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        indices[i + 1] = a = start + int(np.argmax(areas))
+    indices[-1] = n - 1
+    return indices
+
+
+def _axis_value(label: Any) -> float | None:
+    """Position of the x-value on a numeric or date axis, if it has one."""
+    value = _number(label)
+    if value is not None or _is_empty(label):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(label).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _number(label: Any) -> float | None:
+    try:
+        value = float(label)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _is_empty(label: Any) -> bool:
+    return label is None or label == ""
+
+
+def _sorted(rows: list[list[Any]], sort: str) -> list[list[Any]]:
+    if sort.endswith("y"):
+        return sorted(rows, key=lambda row: row[-1], reverse=sort == "-y")
+    return sorted(
+        rows,
+        key=lambda row: [_x_sort_key(label) for label in row[:-1]],
+        reverse=sort == "-x",
+    )
+
+
+def _x_sort_key(label: Any) -> tuple[int, Any]:
+    """
+    The numbers come first, in the numeric order, then the other values
+    (which sorts the ISO dates chronologically), and the empty values last.
+    """
+    if _is_empty(label):
+        return (2, "")
+    value = _number(label)
+    return (0, value) if value is not None else (1, str(label))
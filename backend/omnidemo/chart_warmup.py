@@ -0,0 +1,167 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import json
+import logging
+
+from omnidemo.charts import ChartComputer, ChartData, ChartKey
+from omnidemo.columnar import ColumnarTable, convert_csv
+from omnidemo.db import AsyncSqliteDatabase, Transaction
+from omnidemo.settings import settings
+from omnidemo.singleflight import SqliteLease
+
+logger = logging.getLogger(__name__)
+
+
+def chart_lease(
+    db: AsyncSqliteDatabase, forecast_id: int, chart_key: str
+) -> SqliteLease:
+    """The lease held by the server process that computes the chart."""
+    return SqliteLease(
+        db, f"chart:{forecast_id}:{chart_key}", ttl=settings.chart_lease_ttl
+    )
+
+
+class ChartWarmup:
+    """
+    Computes the charts that the users have saved in `user_charts` for a
+    forecast in the background, once the forecast is completed or published,
+    so that the dashboards don't have to wait for them.
+
+    The forecasts are warmed up one at a time, in the order in which they
+    were enqueued. This is only an optimization: if the server stops before
+    the charts are computed, `get_chart` computes them on demand.
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.Queue[int] = asyncio.Queue()
+        self._pending: set[int] = set()
+        self._task: asyncio.Task[None] | None = None
+
+    def enqueue(self, forecast_id: int) -> None:
+        if forecast_id not in self._pending:
+            self._pending.add(forecast_id)
+            self._queue.put_nowait(forecast_id)
+
+    def start(self, db: AsyncSqliteDatabase) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._work(db))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _work(self, db: AsyncSqliteDatabase) -> None:
+        while True:
+            forecast_id = await self._queue.get()
+            self._pending.discard(forecast_id)
+            try:
+                await warm_up_charts(db, forecast_id)
+            except Exception:
+                logger.exception(
+                    "Failed to warm up the charts of forecast %s", forecast_id
+                )
+
+
+async def warm_up_charts(db: AsyncSqliteDatabase, forecast_id: int) -> None:
+    """Compute the saved charts of the forecast that are not in the database yet."""
+    rows = await db.fetch_rows(
+        "SELECT file_id FROM forecasts WHERE id = ?", (forecast_id,)
+    )
+    if not rows or not rows[0]["file_id"]:
+        return
+    forecast_file_id = rows[0]["file_id"]
+    rows = await db.fetch_rows(
+        """
+        SELECT DISTINCT chart_key FROM user_charts
+        WHERE chart_key NOT IN (SELECT chart_key FROM charts WHERE forecast_id = ?)
+        """,
+        (forecast_id,),
+    )
+    keys: dict[str, ChartKey] = {}
+    for row in rows:
+        with contextlib.suppress(ValueError):
+            keys[row["chart_key"]] = ChartKey.parse(row["chart_key"])
+    await compute_charts(db, forecast_id, forecast_file_id, keys)
+
+
+async def compute_charts(
+    db: AsyncSqliteDatabase,
+    forecast_id: int,
+    forecast_file_id: str,
+    keys: dict[str, ChartKey],
+) -> dict[str, str]:
+    """
+    Compute the charts of the forecast, all in one pass over the forecast's
+    columns, and save them. The charts that are being computed by someone
+    else already (i.e. whose lease is taken) are skipped, as are the charts
+    that cannot be computed.
+
+    :return: the JSON of the rows of the charts computed, by chart key.
+    """
+    forecast_file = db.storage / forecast_file_id
+    keys = dict(keys)
+    leases: list[SqliteLease] = []
+    try:
+        for chart_key in list(keys):
+            lease = chart_lease(db, forecast_id, chart_key)
+            if await lease.acquire():
+                leases.append(lease)
+            else:
+                del keys[chart_key]
+        if not keys:
+            return {}
+
+        def compute() -> dict[str, ChartData]:
+            table = ColumnarTable.open(forecast_file) or convert_csv(forecast_file)
+            computer = ChartComputer(table)
+            charts: dict[str, ChartData] = {}
+            for chart_key, key in keys.items():
+                # E.g. the sum of a non-numeric column: left for `get_chart`
+                # to report
+                with contextlib.suppress(ValueError):
+                    charts[chart_key] = computer.compute(key)
+            return charts
+
+        charts = await asyncio.to_thread(compute)
+        stored: dict[str, str] = {}
+        async with db.transaction() as tx:
+            for chart_key, data in charts.items():
+                stored[chart_key] = await insert_chart(tx, forecast_id, chart_key, data)
+        return stored
+    finally:
+        for lease in leases:
+            await lease.release()
+
+
+async def insert_chart(
+    tx: Transaction | AsyncSqliteDatabase,
+    forecast_id: int,
+    chart_key: str,
+    data: ChartData,
+) -> str:
+    """
+    Save the chart, unless it has been saved already.
+
+    :return: the JSON of the chart's rows, as it is stored.
+    """
+    rows = json.dumps(data.rows)
+    await tx.execute(
+        """
+        INSERT OR IGNORE INTO charts (forecast_id, chart_key, data, partials)
+        VALUES (?, ?, ?, ?)
+        """,
+        (
+            forecast_id,
+            chart_key,
+            rows,
+            None if data.partials is None else json.dumps(data.partials),
+        ),
+    )
+    return rows
+
+
+chart_warmup = ChartWarmup()
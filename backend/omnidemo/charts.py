@@ -0,0 +1,263 @@
+from __future__ import annotations
+import math
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+
+from omnidemo.columnar import Column, ColumnarTable
+
+AGGREGATIONS = ("sum", "avg", "min", "max", "count")
+
+IntArray = np.ndarray[Any, np.dtype[np.int64]]
+FloatArray = np.ndarray[Any, np.dtype[np.float64]]
+BoolArray = np.ndarray[Any, np.dtype[np.bool_]]
+
+
+@dataclass(frozen=True)
+class ChartKey:
+    """
+    Parsed chart key.
+
+    Chart key is a list of fields, separated by commas. The final field
+    is the y-axis, and the rest are the x-axis + optional categories.
+    The final field may contain the aggregation function, e.g. `count/field`.
+    All aggregations skip over empty values. If the aggregation function is not
+    specified, the default is `sum`.
+    Example: `sku,region,count/forecast`.
+    """
+
+    x_fields: tuple[str, ...]
+    y_field: str
+    agg: str
+
+    @staticmethod
+    def parse(chart_key: str) -> ChartKey:
+        fields = chart_key.split(",")
+        agg = "sum"
+        if "/" in fields[-1]:
+            agg, field = fields[-1].split("/", 1)
+            fields[-1] = field
+        if agg not in AGGREGATIONS:
+            raise ValueError(f"Unsupported aggregation function: {agg}")
+        if len(fields) < 2:
+            raise ValueError("Chart key must contain at least two fields")
+        return ChartKey(x_fields=tuple(fields[:-1]), y_field=fields[-1], agg=agg)
+
+    @property
+    def fields(self) -> list[str]:
+        return [*self.x_fields, self.y_field]
+
+    def rolls_up(self, finer: ChartKey) -> bool:
+        """
+        Whether this chart can be derived from the `finer` chart, which
+        aggregates the same y-field by more x-fields, see `rollup_chart()`.
+        """
+        return (
+            finer.y_field == self.y_field
+            and finer.agg == self.agg
+            and finer.x_fields != self.x_fields
+            and set(self.x_fields) <= set(finer.x_fields)
+        )
+
+
+@dataclass
+class ChartData:
+    # Rows `[*x_values, y]` of the chart, one per group
+    rows: list[list[Any]]
+    # For `avg` charts, the `[sum, count]` of each group: these are what the
+    # chart is rolled up from, see `rollup_chart()`
+    partials: list[list[float]] | None = None
+
+
+def compute_chart(table: ColumnarTable, key: ChartKey) -> ChartData:
+    """
+    Aggregate the y-data of the table by groups in x-data.
+
+    Returns a list of rows `[*x_values, y]`, one per group, in the order in
+    which the groups first appear in the data. This is done with vectorized
+    numpy operations: the x-columns are factorized into integer group codes,
+    and the aggregates are computed with `bincount` / `ufunc.reduceat`.
+    """
+    return ChartComputer(table).compute(key)
+
+
+class ChartComputer:
+    """
+    Computes charts of a table, see `compute_chart()`. The columns are read
+    and factorized once per computer, so computing many charts of the same
+    table with one computer takes a single pass over each column.
+    """
+
+    def __init__(self, table: ColumnarTable):
+        self.table = table
+        self._x: dict[str, tuple[IntArray, list[Any]]] = {}
+        self._y: dict[tuple[str, bool], tuple[FloatArray, BoolArray]] = {}
+
+    def compute(self, key: ChartKey) -> ChartData:
+        y, valid = self._y_values(key)
+        rows = np.flatnonzero(valid)
+        if not len(rows):
+            return ChartData([], [] if key.agg == "avg" else None)
+
+        # Combine the codes of all x-columns into a single group code
+        x_codes: list[IntArray] = []
+        x_labels: list[list[Any]] = []
+        combined = np.zeros(len(rows), dtype=np.int64)
+        n_combined = 1
+        for field in key.x_fields:
+            all_codes, labels = self._factorize(field)
+            codes = all_codes[rows]
+            x_codes.append(codes)
+            x_labels.append(labels)
+            combined = combined * len(labels) + codes
+            n_combined *= len(labels)
+            if n_combined > 1 << 31:
+                # Re-number the groups densely so that the codes don't overflow
+                uniques, combined = np.unique(combined, return_inverse=True)
+                n_combined = len(uniques)
+
+        _, first_index, groups = np.unique(
+            combined, return_index=True, return_inverse=True
+        )
+        n_groups = len(first_index)
+        values = _reduce(key.agg, groups, n_groups, y[rows])
+
+        # Order the groups by their first appearance, same as a dict would
+        order = np.argsort(first_index, kind="stable")
+        first_rows = first_index[order]
+        columns: list[list[Any]] = [
+            [labels[c] for c in codes[first_rows].tolist()]
+            for codes, labels in zip(x_codes, x_labels)
+        ]
+        columns.append(values[order].tolist())
+        partials = None
+        if key.agg == "avg":
+            sums = np.bincount(groups, weights=y[rows], minlength=n_groups)
+            counts = np.bincount(groups, minlength=n_groups)
+            partials = [
+                [s, c] for s, c in zip(sums[order].tolist(), counts[order].tolist())
+            ]
+        return ChartData([list(row) for row in zip(*columns)], partials)
+
+    def _y_values(self, key: ChartKey) -> tuple[FloatArray, BoolArray]:
+        """
+        Returns the y-column as floats, together with the mask of non-empty
+        values. For `count` the values need not be numeric.
+        """
+        cache_key = (key.y_field, key.agg == "count")
+        if cache_key not in self._y:
+            self._y[cache_key] = _y_values(self.table, key)
+        return self._y[cache_key]
+
+    def _factorize(self, field: str) -> tuple[IntArray, list[Any]]:
+        """
+        Convert the values of the x-column into integer codes, and return them
+        together with the list of labels for each code.
+        """
+        if field not in self._x:
+            self._x[field] = _factorize(self.table, field)
+        return self._x[field]
+
+
+def rollup_chart(key: ChartKey, finer: ChartKey, data: ChartData) -> ChartData:
+    """
+    Derive the chart `key` from the data of a `finer` chart that it rolls up
+    (see `ChartKey.rolls_up()`), by merging the groups that differ only in
+    the extra x-fields. This gives the same groups as `compute_chart()`, in
+    the same order: each group first appears with its first finer group.
+    The sums may differ in the last digits, since they are added up in a
+    different order.
+    """
+    index = [finer.x_fields.index(field) for field in key.x_fields]
+    groups: dict[tuple[Any, ...], list[Any]] = {}
+    for row, partial in zip(data.rows, group_partials(key.agg, data)):
+        group = tuple(row[j] for j in index)
+        merged = groups.get(group)
+        if merged is None:
+            groups[group] = list(partial)
+        else:
+            merge_partials(key.agg, merged, partial)
+    return ChartData(
+        [[*group, partial_value(key.agg, p)] for group, p in groups.items()],
+        list(groups.values()) if key.agg == "avg" else None,
+    )
+
+
+def group_partials(agg: str, data: ChartData) -> list[list[Any]]:
+    """
+    The partial aggregates of each group of the chart, by which the groups
+    are merged: `[sum, count]` for `avg`, and `[y]` otherwise. The `avg`
+    charts computed before the partials were stored count as one value per
+    group.
+    """
+    if agg != "avg":
+        return [[row[-1]] for row in data.rows]
+    if data.partials is None:
+        return [[row[-1], 1] for row in data.rows]
+    return data.partials
+
+
+def merge_partials(agg: str, merged: list[Any], partial: list[Any]) -> None:
+    """Merge the partial aggregates of a group into `merged`."""
+    if agg == "min":
+        merged[0] = min(merged[0], partial[0])
+    elif agg == "max":
+        merged[0] = max(merged[0], partial[0])
+    else:
+        for j, value in enumerate(partial):
+            merged[j] += value
+
+
+def partial_value(agg: str, partial: list[Any]) -> Any:
+    """The y-value of a group with the given partial aggregates."""
+    return partial[0] / partial[1] if agg == "avg" else partial[0]
+
+
+def _y_values(table: ColumnarTable, key: ChartKey) -> tuple[FloatArray, BoolArray]:
+    if key.y_field not in table:
+        return np.zeros(table.n_rows), np.zeros(table.n_rows, dtype=np.bool_)
+    column = table.column(key.y_field)
+    if column.values is not None:
+        return column.values, ~np.isnan(column.values)
+
+    assert column.codes is not None and column.dictionary is not None
+    non_empty = np.array([bool(v) for v in column.dictionary], dtype=np.bool_)
+    valid = non_empty[column.codes]
+    if key.agg == "count":
+        return np.zeros(table.n_rows), valid
+    floats = np.array([float(v) if v else math.nan for v in column.dictionary])
+    return floats[column.codes], valid
+
+
+def _factorize(table: ColumnarTable, field: str) -> tuple[IntArray, list[Any]]:
+    if field not in table:
+        # Missing fields are treated as if all their values were None
+        return np.zeros(table.n_rows, dtype=np.int64), [None]
+    column: Column = table.column(field)
+    if column.codes is not None:
+        assert column.dictionary is not None
+        return column.codes.astype(np.int64), column.dictionary
+    assert column.values is not None
+    uniques, codes = np.unique(column.values, return_inverse=True)
+    labels = ["" if math.isnan(v) else repr(v) for v in uniques.tolist()]
+    return codes.astype(np.int64), labels
+
+
+def _reduce(
+    agg: str, groups: IntArray, n_groups: int, y: FloatArray
+) -> np.ndarray[Any, Any]:
+    if agg == "count":
+        return np.bincount(groups, minlength=n_groups)
+    if agg == "sum":
+        return np.bincount(groups, weights=y, minlength=n_groups)
+    if agg == "avg":
+        counts = np.bincount(groups, minlength=n_groups)
+        return np.bincount(groups, weights=y, minlength=n_groups) / counts
+
+    # min/max: sort the values by group, and reduce each contiguous run
+    order = np.argsort(groups, kind="stable")
+    counts = np.bincount(groups, minlength=n_groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    ufunc = np.minimum if agg == "min" else np.maximum
+    return ufunc.reduceat(y[order], starts)
@@ -0,0 +1,252 @@
+from __future__ import annotations
+import csv
+import io
+import itertools
+import json
+import math
+import shutil
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Sequence
+
+import numpy as np
+
+from omnidemo.storage import Codec, decompress
+
+# The columnar "sidecar" is a directory stored next to a CSV file, with the
+# same name plus the `.cols` suffix:
+#
+#     forecasts~<job_id>.csv
+#     forecasts~<job_id>.csv.cols/
+#         meta.json       -- number of rows, column names and types
+#         0.f8            -- float64 values of a numeric column (NaN = empty)
+#         1.i4            -- int32 codes of a dictionary-encoded column
+#         1.dict.json     -- the dictionary for column 1
+#
+# Each column lives in its own file, so that a reader can memory-map only
+# the columns that it actually needs.
+FORMAT_VERSION = 1
+FLOAT_DTYPE = np.dtype("<f8")
+CODE_DTYPE = np.dtype("<i4")
+
+
+def columns_path(file: Path) -> Path:
+    """Location of the columnar sidecar for the given CSV file."""
+    return file.with_name(file.name + ".cols")
+
+
+class ColumnarWriter:
+    """
+    Incrementally writes a table into the columnar sidecar format.
+
+    Every column starts out as a float column, and is converted into a
+    dictionary-encoded column as soon as it encounters a value that cannot
+    be stored as a float without loss (i.e. whose `repr(float(value))`
+    differs from the original text). This way the readers always get back
+    the exact strings that were written.
+
+    The data is written into a temporary directory, which is renamed into
+    its final location by `close()`. If another writer got there first, its
+    output is kept and ours is discarded.
+    """
+
+    def __init__(self, target: Path, headers: Sequence[str]):
+        self.target = target
+        self.tmp_dir = target.with_name(f"{target.name}.{uuid.uuid4().hex}.tmp")
+        self.tmp_dir.mkdir(parents=True)
+        self.n_rows = 0
+        self.columns = [
+            _ColumnBuilder(self.tmp_dir, str(i), name) for i, name in enumerate(headers)
+        ]
+
+    def __enter__(self) -> ColumnarWriter:
+        return self
+
+    def __exit__(self, exc_type: Any, *args: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write_rows(self, rows: Iterable[Sequence[str | None]]) -> None:
+        """Append a batch of rows, each row has one value per column."""
+        batch = list(rows)
+        if not batch:
+            return
+        n = len(self.columns)
+        for i, values in enumerate(zip(*(_pad(row, n) for row in batch))):
+            self.columns[i].append(values)
+        self.n_rows += len(batch)
+
+    def close(self) -> None:
+        meta = {
+            "version": FORMAT_VERSION,
+            "n_rows": self.n_rows,
+            "columns": [col.finish() for col in self.columns],
+        }
+        (self.tmp_dir / "meta.json").write_text(json.dumps(meta))
+        try:
+            self.tmp_dir.rename(self.target)
+        except OSError:
+            if not self.target.exists():
+                raise
+            shutil.rmtree(self.tmp_dir)
+
+    def abort(self) -> None:
+        for col in self.columns:
+            col.file.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+class _ColumnBuilder:
+    def __init__(self, directory: Path, file_id: str, name: str):
+        self.directory = directory
+        self.file_id = file_id
+        self.name = name
+        self.kind = "float"
+        self.file = open(self._path("f8"), "wb")  # noqa: SIM115
+        self.dictionary: dict[str, int] = {}
+
+    def _path(self, ext: str) -> Path:
+        return self.directory / f"{self.file_id}.{ext}"
+
+    def append(self, values: Sequence[str | None]) -> None:
+        if self.kind == "float":
+            floats = _parse_floats(values)
+            if floats is not None:
+                np.asarray(floats, dtype=FLOAT_DTYPE).tofile(self.file)
+                return
+            self._convert_to_dict()
+        index = self.dictionary
+        codes = [index.setdefault(v or "", len(index)) for v in values]
+        np.asarray(codes, dtype=CODE_DTYPE).tofile(self.file)
+
+    def _convert_to_dict(self) -> None:
+        """
+        Re-encode the float values written so far as dictionary codes. All
+        of them were lossless, so their `repr()` is the original text.
+        """
+        self.file.close()
+        floats_path = self._path("f8")
+        self.kind = "dict"
+        self.file = open(self._path("i4"), "wb")  # noqa: SIM115
+        index = self.dictionary
+        chunk_size = 1 << 20
+        with open(floats_path, "rb") as inp:
+            while True:
+                chunk = np.fromfile(inp, dtype=FLOAT_DTYPE, count=chunk_size)
+                if not len(chunk):
+                    break
+                strings = ["" if math.isnan(v) else repr(v) for v in chunk.tolist()]
+                codes = [index.setdefault(s, len(index)) for s in strings]
+                np.asarray(codes, dtype=CODE_DTYPE).tofile(self.file)
+        floats_path.unlink()
+
+    def finish(self) -> dict[str, Any]:
+        self.file.close()
+        if self.kind == "dict":
+            self._path("dict.json").write_text(json.dumps(list(self.dictionary)))
+        return {"name": self.name, "type": self.kind, "file": self.file_id}
+
+
+def convert_csv(
+    file: Path, batch_size: int = 65536, codec: Codec | None = None
+) -> ColumnarTable:
+    """
+    Create the columnar sidecar for an existing CSV file, compressed with
+    `codec`, and open it. The forecasts that have no sidecar predate the
+    compression of the storage, so their files are plain CSV.
+    """
+    with open(file, "rb") as raw, decompress(raw, codec) as inp:
+        reader = csv.reader(io.TextIOWrapper(inp, encoding="utf-8", newline=""))
+        headers = next(reader, [])
+        with ColumnarWriter(columns_path(file), headers) as writer:
+            while batch := list(itertools.islice(reader, batch_size)):
+                writer.write_rows(batch)
+    return ColumnarTable(columns_path(file))
+
+
+def _parse_floats(values: Sequence[str | None]) -> list[float] | None:
+    """
+    Convert the values into floats, or return None if any of them cannot
+    be represented as a float exactly.
+    """
+    out: list[float] = []
+    for v in values:
+        if not v:
+            out.append(math.nan)
+            continue
+        try:
+            f = float(v)
+        except ValueError:
+            return None
+        if not math.isfinite(f) or repr(f) != v:
+            return None
+        out.append(f)
+    return out
+
+
+def _pad(row: Sequence[str | None], n: int) -> Sequence[str | None]:
+    if len(row) == n:
+        return row
+    return [*row[:n], *([None] * (n - len(row)))]
+
+
+@dataclass
+class Column:
+    """
+    A single column of a columnar table. Exactly one of `values` (float
+    columns) or `codes` (dictionary-encoded columns) is set. The arrays
+    are memory-mapped, so they are read from disk lazily.
+    """
+
+    name: str
+    values: np.ndarray[Any, np.dtype[np.float64]] | None = None
+    codes: np.ndarray[Any, np.dtype[np.int32]] | None = None
+    dictionary: list[str] | None = None
+
+
+class ColumnarTable:
+    """Read-only access to a columnar sidecar written by `ColumnarWriter`."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        meta = json.loads((path / "meta.json").read_text())
+        if meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported columnar format version {meta['version']}")
+        self.n_rows: int = meta["n_rows"]
+        self._columns: dict[str, dict[str, str]] = {
+            col["name"]: col for col in meta["columns"]
+        }
+
+    @staticmethod
+    def open(file: Path) -> ColumnarTable | None:
+        """Open the sidecar of the given CSV file, if it exists."""
+        path = columns_path(file)
+        if not (path / "meta.json").exists():
+            return None
+        return ColumnarTable(path)
+
+    @property
+    def names(self) -> list[str]:
+        return list(self._columns)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def column(self, name: str) -> Column:
+        info = self._columns[name]
+        if info["type"] == "float":
+            values = self._mmap(f"{info['file']}.f8", FLOAT_DTYPE)
+            return Column(name=name, values=values)
+        codes = self._mmap(f"{info['file']}.i4", CODE_DTYPE)
+        dictionary = json.loads((self.path / f"{info['file']}.dict.json").read_text())
+        return Column(name=name, codes=codes, dictionary=dictionary)
+
+    def _mmap(self, file_name: str, dtype: np.dtype[Any]) -> np.ndarray[Any, Any]:
+        if self.n_rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(
+            self.path / file_name, dtype=dtype, mode="r", shape=(self.n_rows,)
+        )
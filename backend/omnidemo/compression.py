@@ -0,0 +1,143 @@
+from __future__ import annotations
+import gzip
+from collections import OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content codings that the responses are compressed with, in the order of
+# preference
+ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+# Media types of the responses worth compressing; the others (e.g. the
+# downloaded files) are binary, or compressed already
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    # The chart formats, see `omnidemo.chart_formats`
+    "application/vnd.omnidemo.",
+)
+
+
+class CompressionMiddleware:
+    """
+    Compresses the response bodies with brotli (when the `brotli` package is
+    installed) or gzip, whichever the client prefers per `Accept-Encoding`.
+
+    Only complete bodies of at least `minimum_size` bytes are compressed:
+    streaming responses (file downloads, event streams) and the responses
+    with a `Content-Encoding` already are passed through as they are. The
+    ETag of a compressed response is made weak, as the bytes differ from
+    those of the uncompressed one.
+
+    Immutable responses with an ETag (such as the charts) are the same every
+    time, so their compressed bodies are cached, within `cache_size` bytes.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int, cache_size: int):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+        self._cached_bytes = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message = {}
+        passthrough = False
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            headers = MutableHeaders(raw=start["headers"])
+            if message.get("more_body") or not self._compressible(headers, body):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            body = self._compress(encoding, body, headers)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = f"W/{etag}"
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _compressible(self, headers: MutableHeaders, body: bytes) -> bool:
+        return (
+            len(body) >= self.minimum_size
+            and "content-encoding" not in headers
+            and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+        )
+
+    def _compress(self, encoding: str, body: bytes, headers: MutableHeaders) -> bytes:
+        etag = headers.get("etag")
+        if not etag or "immutable" not in headers.get("cache-control", ""):
+            return compress(encoding, body)
+        key = (encoding, etag)
+        compressed = self._cache.get(key)
+        if compressed is not None:
+            self._cache.move_to_end(key)
+            return compressed
+        compressed = compress(encoding, body)
+        if len(compressed) <= self.cache_size:
+            self._cache[key] = compressed
+            self._cached_bytes += len(compressed)
+            while self._cached_bytes > self.cache_size:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+        return compressed
+
+
+def compress(encoding: str, body: bytes) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """The preferred one of `ENCODINGS` that the client accepts, if any."""
+    accepted = [e for e in ENCODINGS if accepts_encoding(accept_encoding, e)]
+    return max(accepted, key=lambda e: _quality(accept_encoding, e), default=None)
+
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """Whether the `Accept-Encoding` header allows the content coding."""
+    return _quality(accept_encoding, encoding) > 0
+
+
+def _quality(accept_encoding: str, encoding: str) -> float:
+    """The quality of the content coding per the `Accept-Encoding` header."""
+    quality = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        try:
+            q = float(params.strip().removeprefix("q=")) if params.strip() else 1.0
+        except ValueError:
+            q = 0.0
+        quality[name.strip().lower()] = q
+    return quality.get(encoding, quality.get("*", 0.0))
@@ -1,9 +1,16 @@
 from __future__ import annotations
+import asyncio
 import sqlite3
-from typing import Any
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, TypeVar
 import uuid
 from fastapi import FastAPI
 
+from omnidemo.migrations import migrate
+from omnidemo.notify import ChangeNotifier
 from omnidemo.settings import settings
 
 
@@ -13,24 +20,20 @@ class SqliteDatabase:
         self.conn.row_factory = sqlite3.Row
         self.storage = settings.storage_dir
 
-    @staticmethod
-    def from_app(app: FastAPI) -> SqliteDatabase:
-        """Get the database connection storeed in the app state."""
-        db = app.state.db
-        if db is None:
-            raise RuntimeError("Database connection is not established")
-        return db
-
     @staticmethod
     def connect() -> SqliteDatabase:
-        db_exists = settings.sqlite_db.exists()
-        conn = sqlite3.connect(settings.sqlite_db)
+        conn = sqlite3.connect(settings.sqlite_db, timeout=settings.sqlite_busy_timeout)
 
-        # If the db does not exist, populate it with the initial
-        # schema from the `initial.sql` file.
-        if not db_exists:
-            sql_script = settings.sqlite_sql.read_text()
-            conn.executescript(sql_script)
+        # WAL mode lets the readers proceed while a write is in progress.
+        # This setting is persistent, i.e. stored in the database file.
+        conn.execute("PRAGMA journal_mode = WAL")
+
+        # If the db does not exist, populate it with the initial schema from
+        # the `initial.sql` file (all statements there are idempotent). Then
+        # bring the schema up to date, see `omnidemo.migrations`.
+        sql_script = settings.sqlite_sql.read_text()
+        conn.executescript(sql_script)
+        migrate(conn)
 
         if not settings.storage_dir.exists():
             settings.storage_dir.mkdir(parents=True)
@@ -41,62 +44,215 @@ class SqliteDatabase:
         return str(uuid.uuid4())
 
     def insert_row(self, sql: str, params: tuple[Any, ...]) -> AnyDict:
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute(sql, params)
-            row_id = cursor.lastrowid
-            table = self._get_table_name_from_insert_sql(sql)
-            print(f"Row ID: {row_id}, Table: {table}")
-            if row_id and table:
-                select_query = f"SELECT * FROM {table} WHERE id = ?"
-                cursor.execute(select_query, (row_id,))
-                row = cursor.fetchone()
-                print(f"Row: {row}")
-                if row:
-                    self.conn.commit()
-                    return dict(row)
-            raise RuntimeError("Row not found after insert")
-        except sqlite3.Error as e:
-            raise RuntimeError(f"Failed to insert row: {e}")
+        row = _insert_row(self.conn, sql, params)
+        self.conn.commit()
+        return row
 
     def fetch_rows(self, sql: str, params: AnyTuple = ()) -> list[AnyDict]:
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute(sql, params)
-            rows = cursor.fetchall()
-            return [dict(row) for row in rows]
-        except sqlite3.Error as e:
-            raise RuntimeError(f"Failed to fetch rows: {e}")
+        return _fetch_rows(self.conn, sql, params)
 
     def fetch_one(self, sql: str, params: AnyTuple = ()) -> AnyDict:
-        rows = self.fetch_rows(sql, params)
-        if rows:
-            return rows[0]
-        raise RuntimeError("No rows found")
-
-    def execute(self, sql: str, params: AnyTuple = ()) -> None:
-        cursor = self.conn.cursor()
-        try:
-            cursor.execute(sql, params)
-            self.conn.commit()
-        except sqlite3.Error as e:
-            raise RuntimeError(f"Failed to execute SQL: {e}")
-
-    def close(self):
+        return _fetch_one(self.conn, sql, params)
+
+    def execute(self, sql: str, params: AnyTuple = ()) -> int:
+        """Execute a statement, and return the number of affected rows."""
+        rowcount = _execute(self.conn, sql, params)
+        self.conn.commit()
+        return rowcount
+
+    def close(self) -> None:
         self.conn.close()
 
-    def _get_table_name_from_insert_sql(self, sql: str) -> str | None:
-        """
-        Extract the table name from a simple INSERT INTO SQL statement:
 
-            INSERT INTO table_name (column1, column2) ...
+class AsyncSqliteDatabase:
+    """
+    Async access to the sqlite database, used by the API endpoints.
+
+    None of the queries run on the event loop. Reads are executed on a pool
+    of threads, each of which has its own connection; thanks to the WAL mode
+    they can proceed while a write is in progress. All writes go through a
+    single connection owned by a dedicated thread, which serializes them
+    within the process. Each write statement is committed on its own, unless
+    it is executed within a `transaction()` scope.
+    """
+
+    def __init__(self, path: Path, n_readers: int):
+        self.path = path
+        self.storage = settings.storage_dir
+        self.changes = ChangeNotifier(path, settings.db_watch_interval)
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._readers = ThreadPoolExecutor(n_readers, "sqlite-reader")
+        self._writer = ThreadPoolExecutor(1, "sqlite-writer")
+        self._write_lock = asyncio.Lock()
+
+    @staticmethod
+    def from_app(app: FastAPI) -> AsyncSqliteDatabase:
+        """Get the database connection storeed in the app state."""
+        db = app.state.db
+        if db is None:
+            raise RuntimeError("Database connection is not established")
+        return db
+
+    @staticmethod
+    def connect() -> AsyncSqliteDatabase:
+        # Create (or update) the schema using a regular connection
+        SqliteDatabase.connect().close()
+        return AsyncSqliteDatabase(settings.sqlite_db, settings.sqlite_readers)
+
+    def generate_uuid(self) -> str:
+        return str(uuid.uuid4())
+
+    async def fetch_rows(self, sql: str, params: AnyTuple = ()) -> list[AnyDict]:
+        return await self._read(lambda conn: _fetch_rows(conn, sql, params))
+
+    async def fetch_one(self, sql: str, params: AnyTuple = ()) -> AnyDict:
+        return await self._read(lambda conn: _fetch_one(conn, sql, params))
 
-        The table name should be unquoted.
+    async def execute(self, sql: str, params: AnyTuple = ()) -> int:
+        """Execute a statement, and return the number of affected rows."""
+        async with self._write_lock:
+            return await self._write(lambda conn: _execute(conn, sql, params))
+
+    async def insert_row(self, sql: str, params: AnyTuple) -> AnyDict:
+        async with self._write_lock:
+            return await self._write(lambda conn: _insert_row(conn, sql, params))
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[Transaction]:
         """
-        sql_words = sql.lower().split()
-        if sql_words[:2] == ["insert", "into"]:
-            return sql_words[2]
+        Run several statements as a single transaction on the writer
+        connection. The transaction is committed when the scope exits
+        normally, and rolled back if it raises an exception.
+        """
+        async with self._write_lock:
+            try:
+                await self._write(lambda conn: conn.execute("BEGIN IMMEDIATE"))
+                yield Transaction(self)
+                await self._write(lambda conn: conn.execute("COMMIT"))
+            except BaseException:
+                # The writer thread runs the statements in order, so this also
+                # covers a task cancelled while its BEGIN was still pending
+                await asyncio.shield(self._write(_rollback))
+                raise
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._readers.shutdown)
+        await asyncio.to_thread(self._writer.shutdown)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    async def _read(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run, fn)
+
+    async def _write(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, self._run, fn)
+
+    def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        """Run `fn` with the connection of the current (executor) thread."""
+        conn: sqlite3.Connection | None = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=settings.sqlite_busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return fn(conn)
+
+
+class Transaction:
+    """Statements executed within `AsyncSqliteDatabase.transaction()`."""
+
+    def __init__(self, db: AsyncSqliteDatabase):
+        self._db = db
+
+    async def fetch_rows(self, sql: str, params: AnyTuple = ()) -> list[AnyDict]:
+        return await self._db._write(lambda conn: _fetch_rows(conn, sql, params))
+
+    async def fetch_one(self, sql: str, params: AnyTuple = ()) -> AnyDict:
+        return await self._db._write(lambda conn: _fetch_one(conn, sql, params))
+
+    async def execute(self, sql: str, params: AnyTuple = ()) -> int:
+        return await self._db._write(lambda conn: _execute(conn, sql, params))
+
+    async def insert_row(self, sql: str, params: AnyTuple) -> AnyDict:
+        return await self._db._write(lambda conn: _insert_row(conn, sql, params))
+
+
+def _insert_row(conn: sqlite3.Connection, sql: str, params: AnyTuple) -> AnyDict:
+    """Execute an INSERT statement, and return the inserted row."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        row_id = cursor.lastrowid
+        table = _get_table_name_from_insert_sql(sql)
+        if row_id and table:
+            select_query = f"SELECT * FROM {table} WHERE id = ?"
+            cursor.execute(select_query, (row_id,))
+            row = cursor.fetchone()
+            if row:
+                return dict(row)
+        raise RuntimeError("Row not found after insert")
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Failed to insert row: {e}")
+
+
+def _rollback(conn: sqlite3.Connection) -> None:
+    if conn.in_transaction:
+        conn.execute("ROLLBACK")
+
+
+def _fetch_rows(conn: sqlite3.Connection, sql: str, params: AnyTuple) -> list[AnyDict]:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        return [dict(row) for row in rows]
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Failed to fetch rows: {e}")
+
+
+def _fetch_one(conn: sqlite3.Connection, sql: str, params: AnyTuple) -> AnyDict:
+    rows = _fetch_rows(conn, sql, params)
+    if rows:
+        return rows[0]
+    raise RuntimeError("No rows found")
+
+
+def _execute(conn: sqlite3.Connection, sql: str, params: AnyTuple) -> int:
+    cursor = conn.cursor()
+    try:
+        cursor.execute(sql, params)
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        raise RuntimeError(f"Failed to execute SQL: {e}")
+
+
+def _get_table_name_from_insert_sql(sql: str) -> str | None:
+    """
+    Extract the table name from a simple INSERT INTO SQL statement:
+
+        INSERT INTO table_name (column1, column2) ...
+
+    The table name should be unquoted.
+    """
+    sql_words = sql.lower().split()
+    if sql_words[:2] == ["insert", "into"]:
+        return sql_words[2]
+    return None
 
 
+T = TypeVar("T")
 AnyTuple = tuple[Any, ...]
 AnyDict = dict[str, Any]
@@ -0,0 +1,275 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import logging
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import FastAPI
+
+from omnidemo.chart_warmup import chart_warmup
+from omnidemo.db import AsyncSqliteDatabase, Transaction
+from omnidemo.forecast import remove_partial_outputs, run_forecast
+from omnidemo.notify import wait_event
+from omnidemo.settings import settings
+from omnidemo.singleflight import PROCESS_ID
+
+logger = logging.getLogger(__name__)
+
+# Moves a job back into the queue after a failed attempt, or fails it when
+# there are no attempts left. The retry delay doubles with every attempt.
+RETRY_JOBS = """
+    UPDATE jobs SET
+        status = CASE WHEN attempts < ? THEN 'queued' ELSE 'failed' END,
+        error = ?,
+        run_after = ? + ? * (1 << MAX(attempts - 1, 0)),
+        lease_owner = NULL,
+        lease_expires_at = NULL
+"""
+
+
+class ForecastExecutor:
+    """
+    Runs the queued forecasts in a pool of worker processes, so that the
+    CPU-heavy work does not block the event loop of the web server.
+
+    The queue is stored in the `jobs` table, and is shared by all server
+    processes: a forecast is queued by creating its job with the status
+    `queued`, and every process claims the oldest queued jobs whenever it has
+    fewer than `max_workers` forecasts running. The claim comes with a lease,
+    which the process keeps renewing while the forecast runs. If the process
+    dies, its lease expires and the job is re-queued by any other process (or
+    by the same one after a restart). Failed attempts are retried with an
+    exponential backoff, up to `forecast_max_attempts` in total.
+
+    A job is cancelled by changing its status in the database, which works
+    no matter which process runs it: a running forecast notices this at its
+    next progress update, and stops.
+    """
+
+    def __init__(self, db: AsyncSqliteDatabase, max_workers: int):
+        self.db = db
+        self.max_workers = max_workers
+        self._pool = self._create_pool()
+        self._running: dict[str, asyncio.Task[None]] = {}
+        self._tasks: list[asyncio.Task[None]] = []
+
+    @staticmethod
+    def from_app(app: FastAPI) -> ForecastExecutor:
+        executor = app.state.forecasts
+        if executor is None:
+            raise RuntimeError("Forecast executor is not running")
+        return executor
+
+    def start(self) -> None:
+        if not self._tasks:
+            self._tasks = [
+                asyncio.create_task(self._work()),
+                asyncio.create_task(self._heartbeat()),
+            ]
+
+    async def stop(self) -> None:
+        """
+        Stop the executor. The forecasts that are still running are put back
+        into the queue without counting as an attempt, so that they can be
+        picked up by another process right away.
+        """
+        for task in self._tasks:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        async with self.db.transaction() as tx:
+            await tx.execute(
+                """
+                UPDATE jobs SET status = 'queued', lease_owner = NULL,
+                    lease_expires_at = NULL, attempts = MAX(attempts - 1, 0)
+                WHERE lease_owner = ? AND status = 'running'
+                """,
+                (PROCESS_ID,),
+            )
+            await update_queue_positions(tx)
+        # The running forecasts stop at their next progress update
+        await asyncio.to_thread(self._pool.shutdown, wait=True, cancel_futures=True)
+        await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a queued or running job. Returns False if the job is not in
+        one of these states.
+        """
+        async with self.db.transaction() as tx:
+            changed = await tx.execute(
+                """
+                UPDATE jobs SET status = 'cancelled', queue_position = NULL,
+                    lease_owner = NULL, lease_expires_at = NULL
+                WHERE id = ? AND status IN ('queued', 'running')
+                """,
+                (job_id,),
+            )
+            await update_queue_positions(tx)
+        self.db.changes.notify()
+        return changed > 0
+
+    async def _work(self) -> None:
+        requeued_at = -math.inf
+        change = self.db.changes.next_change()
+        while True:
+            try:
+                if time.monotonic() - requeued_at >= settings.forecast_lease_ttl / 2:
+                    await self._requeue_expired()
+                    requeued_at = time.monotonic()
+                while len(self._running) < self.max_workers:
+                    claimed = await self._claim()
+                    if claimed is None:
+                        break
+                    job_id, forecast_id = claimed
+                    self._running[job_id] = asyncio.create_task(
+                        self._run(job_id, forecast_id)
+                    )
+            except Exception:
+                logger.exception("Failed to claim the queued forecasts")
+            # Jobs are queued by the database writes, so wait for the next one
+            await wait_event(change, settings.forecast_poll_interval)
+            change = self.db.changes.next_change()
+
+    async def _claim(self) -> tuple[str, int] | None:
+        """Take the oldest job that is ready to run, if there is any."""
+        claimable = """
+            SELECT jobs.id, forecasts.id AS forecast_id
+            FROM jobs JOIN forecasts ON forecasts.job_id = jobs.id
+            WHERE jobs.status = 'queued'
+                AND (jobs.run_after IS NULL OR jobs.run_after <= ?)
+            ORDER BY jobs.rowid
+            LIMIT 1
+        """
+        # Check on a reader first, in order not to take the write lock for
+        # nothing: this runs after every change in the database
+        now = time.time()
+        if not await self.db.fetch_rows(claimable, (now,)):
+            return None
+        async with self.db.transaction() as tx:
+            rows = await tx.fetch_rows(claimable, (now,))
+            if not rows:
+                return None
+            await tx.execute(
+                """
+                UPDATE jobs SET status = 'running', progress = 0,
+                    queue_position = NULL, lease_owner = ?,
+                    lease_expires_at = ?, attempts = attempts + 1
+                WHERE id = ?
+                """,
+                (PROCESS_ID, now + settings.forecast_lease_ttl, rows[0]["id"]),
+            )
+            await update_queue_positions(tx)
+        return rows[0]["id"], rows[0]["forecast_id"]
+
+    async def _run(self, job_id: str, forecast_id: int) -> None:
+        loop = asyncio.get_running_loop()
+        pool = self._pool
+        try:
+            await loop.run_in_executor(
+                pool, run_forecast, job_id, forecast_id, PROCESS_ID
+            )
+            # Compute the users' saved charts, unless the forecast has failed
+            # or was cancelled
+            rows = await self.db.fetch_rows(
+                "SELECT status FROM jobs WHERE id = ?", (job_id,)
+            )
+            if rows and rows[0]["status"] == "completed":
+                chart_warmup.enqueue(forecast_id)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool) and pool is self._pool:
+                # A worker process has died; the pool cannot be used anymore
+                pool.shutdown(wait=False)
+                self._pool = self._create_pool()
+            await self.db.execute(
+                RETRY_JOBS + "WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (*retry_params(f"{type(e).__name__}: {e}"), job_id, PROCESS_ID),
+            )
+        finally:
+            del self._running[job_id]
+            # Wake up whoever waits for this forecast, including `_work()`
+            self.db.changes.notify()
+
+    async def _heartbeat(self) -> None:
+        """Keep renewing the leases of the running forecasts."""
+        while True:
+            await asyncio.sleep(settings.forecast_lease_ttl / 3)
+            if not self._running:
+                continue
+            try:
+                await self.db.execute(
+                    """
+                    UPDATE jobs SET lease_expires_at = ?
+                    WHERE lease_owner = ? AND status = 'running'
+                    """,
+                    (time.time() + settings.forecast_lease_ttl, PROCESS_ID),
+                )
+            except Exception:
+                logger.exception("Failed to renew the leases of the forecasts")
+
+    async def _requeue_expired(self) -> None:
+        """
+        Re-queue the forecasts whose process has died. This also covers the
+        forecasts left running without a lease by older server versions.
+        """
+        now = time.time()
+        async with self.db.transaction() as tx:
+            rows = await tx.fetch_rows(
+                """
+                SELECT id FROM jobs
+                WHERE status = 'running'
+                    AND (lease_expires_at IS NULL OR lease_expires_at < ?)
+                    AND id IN (SELECT job_id FROM forecasts)
+                """,
+                (now,),
+            )
+            for row in rows:
+                await tx.execute(
+                    RETRY_JOBS + "WHERE id = ?",
+                    (
+                        *retry_params("The forecast's server process has stopped"),
+                        row["id"],
+                    ),
+                )
+            if rows:
+                await update_queue_positions(tx)
+
+        # Remove the files left behind by the dead attempts
+        for row in rows:
+            target = self.db.storage / f"forecasts~{row['id']}.csv"
+            await asyncio.to_thread(remove_partial_outputs, target)
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        # The workers are spawned rather than forked, since the server
+        # process runs several threads
+        return ProcessPoolExecutor(
+            self.max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+
+def retry_params(error: str) -> tuple[object, ...]:
+    """Parameters of `RETRY_JOBS`."""
+    return (
+        settings.forecast_max_attempts,
+        error,
+        time.time(),
+        settings.forecast_retry_delay,
+    )
+
+
+async def update_queue_positions(tx: Transaction) -> None:
+    """Renumber the queued jobs, in the order in which they will run."""
+    await tx.execute(
+        """
+        UPDATE jobs SET queue_position = (
+            SELECT COUNT(*) FROM jobs AS earlier
+            WHERE earlier.status = 'queued' AND earlier.rowid <= jobs.rowid
+        )
+        WHERE status = 'queued'
+        """
+    )
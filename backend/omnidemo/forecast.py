@@ -0,0 +1,270 @@
+from __future__ import annotations
+import contextlib
+import csv
+import hashlib
+import io
+import itertools
+import json
+import random
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Generator, cast
+
+from omnidemo.columnar import ColumnarWriter, columns_path
+from omnidemo.db import SqliteDatabase
+from omnidemo.settings import settings
+from omnidemo.storage import (
+    Codec,
+    codec_name,
+    codec_named,
+    compress,
+    decompress,
+    storage_codec,
+)
+
+# Number of rows that are read, transformed and written at a time
+BATCH_SIZE = 10_000
+
+# Version of the forecast computation. Increment it whenever a change in the
+# code changes the results, so that the earlier forecasts are not reused.
+FORECAST_VERSION = 1
+
+# The inputs of the forecast, as they are read by `run_forecast()` and by
+# `start_forecast` when looking for a forecast to reuse
+LATEST_INPUT_SQL = """
+    SELECT stored_name, codec, sha256 FROM inputs ORDER BY seq DESC LIMIT 1
+"""
+INSIGHTS_SQL = "SELECT message FROM insights ORDER BY created_at, id"
+
+
+class ForecastCancelled(Exception):
+    """The forecast's job was cancelled, or taken over by someone else."""
+
+
+def run_forecast(job_id: str, forecast_id: int, owner: str) -> None:
+    """
+    Run the forecast for the given job. This is executed in a worker process
+    of the `ForecastExecutor`, with its own connection to the database.
+
+    The job is expected to be claimed by `owner` already. The progress is
+    written directly into the `jobs` table, and each write also checks that
+    the job is still running under the same owner: once the job is cancelled
+    (or re-queued), the forecast stops and removes its partial output.
+
+    Errors in the input data fail the job right away. Any other exception is
+    re-raised, and the executor decides whether the job should be retried.
+    """
+    db = SqliteDatabase.connect()
+    codec = storage_codec()
+    suffix = codec.suffix if codec else ""
+    target = db.storage / f"forecasts~{job_id}.csv{suffix}"
+    # Each attempt writes its own files, which replace the target only when
+    # the job is completed. Thus a stale attempt that still runs after its
+    # job was taken over cannot interfere with the new one.
+    partial = target.with_name(f"{target.name}.{uuid.uuid4().hex}.partial")
+    progress = JobProgress(db, job_id, owner)
+    try:
+        # Locate the input file for the forecast
+        rows = db.fetch_rows(LATEST_INPUT_SQL)
+        if not rows:
+            raise ValueError("No input files found")
+        storage_id = cast(str, rows[0]["stored_name"])
+        source_codec = codec_named(rows[0]["codec"])
+        input_sha256 = rows[0]["sha256"]
+        progress.milestone(0.1)
+
+        # Collect the notes for the forecast
+        rows = db.fetch_rows(INSIGHTS_SQL)
+        notes = [row["message"] for row in rows]
+        progress.milestone(0.2)
+
+        # Compute the forecast, streaming the input file through the pipeline
+        # one batch of rows at a time. The progress from 0.2 to 0.9 reflects
+        # the share of the input consumed.
+        FORECAST_FACTOR = 3 if notes else 2
+        pipeline = forecast_file(
+            db.storage / storage_id,
+            partial,
+            FORECAST_FACTOR,
+            codec=codec,
+            source_codec=source_codec,
+        )
+        with contextlib.closing(pipeline):
+            for consumed in pipeline:
+                progress.update(0.2 + 0.7 * consumed)
+        progress.milestone(0.9)
+
+        # Complete the job, and publish the results in the forecasts table.
+        # The files are moved into place within the transaction: the write
+        # lock that it holds guarantees that the job stays ours meanwhile.
+        with db.conn:
+            cursor = db.conn.execute(
+                f"""
+                UPDATE jobs SET progress = 1, status = 'completed', error = NULL,
+                    lease_owner = NULL, lease_expires_at = NULL
+                WHERE {OWNED_JOB}
+                """,
+                (job_id, owner),
+            )
+            if cursor.rowcount == 0:
+                raise ForecastCancelled
+            db.conn.execute(
+                "UPDATE forecasts SET file_id = ?, codec = ?, memo_key = ? WHERE id = ?",
+                (
+                    target.name,
+                    codec_name(codec),
+                    forecast_memo_key(input_sha256, notes),
+                    forecast_id,
+                ),
+            )
+            replace_output(partial, target)
+    except ForecastCancelled:
+        remove_output(partial)
+    except ValueError as e:
+        remove_output(partial)
+        db.execute(
+            f"""
+            UPDATE jobs SET status = 'failed', error = ?,
+                lease_owner = NULL, lease_expires_at = NULL
+            WHERE {OWNED_JOB}
+            """,
+            (str(e), job_id, owner),
+        )
+    except BaseException:
+        remove_output(partial)
+        raise
+    finally:
+        db.close()
+
+
+def forecast_memo_key(input_sha256: str | None, notes: list[str]) -> str | None:
+    """
+    The forecast depends only on the content of the input file, on the
+    insights and on the code, so these make the key by which a completed
+    forecast can be reused. The input files that were uploaded before the
+    content-addressed storage have no hash, and their forecasts no key.
+    """
+    if input_sha256 is None:
+        return None
+    payload = json.dumps([FORECAST_VERSION, input_sha256, notes])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# Condition that the job is still running under the given owner
+OWNED_JOB = "id = ? AND status = 'running' AND lease_owner = ?"
+
+
+class JobProgress:
+    """
+    Writes the progress of a running job into the database, at most every
+    `job_flush_interval` seconds unless it has moved by `job_flush_delta`.
+    Raises `ForecastCancelled` if the job is no longer running under the
+    given owner.
+    """
+
+    def __init__(self, db: SqliteDatabase, job_id: str, owner: str):
+        self.db = db
+        self.job_id = job_id
+        self.owner = owner
+        self._progress = 0.0
+        self._time = time.monotonic()
+
+    def update(self, progress: float, force: bool = False) -> None:
+        now = time.monotonic()
+        if (
+            force
+            or progress - self._progress >= settings.job_flush_delta
+            or now - self._time >= settings.job_flush_interval
+        ):
+            changed = self.db.execute(
+                f"UPDATE jobs SET progress = ? WHERE {OWNED_JOB}",
+                (progress, self.job_id, self.owner),
+            )
+            if not changed:
+                raise ForecastCancelled
+            self._progress = progress
+            self._time = now
+
+    def milestone(self, progress: float) -> None:
+        self.update(progress, force=True)
+        # Add random delays to make it look like we work really hard
+        time.sleep((1 + random.random()) * 0.5)  # ~ U[0.5, 1]
+
+
+def replace_output(source: Path, target: Path) -> None:
+    """Move the forecast file and its sidecar to the new location."""
+    shutil.rmtree(columns_path(target), ignore_errors=True)
+    columns_path(source).rename(columns_path(target))
+    source.replace(target)
+
+
+def remove_output(target: Path) -> None:
+    """Remove the forecast file and its sidecar."""
+    target.unlink(missing_ok=True)
+    shutil.rmtree(columns_path(target), ignore_errors=True)
+
+
+def remove_partial_outputs(target: Path) -> None:
+    """Remove the files of all the unfinished attempts to produce `target`."""
+    for path in target.parent.glob(f"{target.name}.*.partial*"):
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+
+def forecast_file(
+    source: Path,
+    target: Path,
+    factor: float,
+    batch_size: int = BATCH_SIZE,
+    codec: Codec | None = None,
+    source_codec: Codec | None = None,
+) -> Generator[float, None, None]:
+    """
+    Compute the forecast for the `source` CSV file, and write the results
+    into the `target` CSV file together with its columnar sidecar. The
+    source is decompressed with `source_codec`, and the target is
+    compressed with `codec`.
+
+    This is a generator: the input is processed one batch of rows at a time,
+    and after each batch it yields the fraction of the input file consumed
+    so far. Only a single batch is held in memory, regardless of the size of
+    the input.
+    """
+    size = source.stat().st_size or 1
+    with open(source, "rb") as raw, decompress(raw, source_codec) as inp:
+        reader = csv.reader(io.TextIOWrapper(inp, encoding="utf-8", newline=""))
+        header = next(reader, None)
+        if not header:
+            raise ValueError("The input file is empty")
+        if "forecast" not in header:
+            raise ValueError("The input file has no `forecast` column")
+        forecast_index = header.index("forecast")
+        headers = [h for h in header if h != "forecast"] + ["forecast"]
+
+        raw_out = open(target, "wb")
+        out = io.TextIOWrapper(compress(raw_out, codec), encoding="utf-8", newline="")
+        with raw_out, out, ColumnarWriter(columns_path(target), headers) as columns:
+            writer = csv.writer(out)
+            writer.writerow(headers)
+            rows = (row for row in reader if row)  # skip blank lines
+            while batch := list(itertools.islice(rows, batch_size)):
+                out_rows = [
+                    _forecast_row(row, len(header), forecast_index, factor)
+                    for row in batch
+                ]
+                writer.writerows(out_rows)
+                columns.write_rows(out_rows)
+                yield raw.tell() / size
+
+
+def _forecast_row(
+    row: list[str], n_fields: int, forecast_index: int, factor: float
+) -> list[str]:
+    """Move the forecast to the end of the row, and scale it by `factor`."""
+    row = row[:n_fields] + [""] * (n_fields - len(row))
+    value = row.pop(forecast_index)
+    return row + [str(float(value) * factor)]
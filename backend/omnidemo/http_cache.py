@@ -0,0 +1,60 @@
+from __future__ import annotations
+import hashlib
+
+from fastapi import HTTPException, Request, Response
+
+from omnidemo.db import AsyncSqliteDatabase
+
+# Responses that may change at any time: the client keeps them, but has to
+# revalidate them (with `If-None-Match`) before every use
+REVALIDATE = "no-cache"
+# Responses that never change for the same URL
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+async def tables_etag(db: AsyncSqliteDatabase, tables: list[str], *args: object) -> str:
+    """
+    Weak ETag of a response that is derived from the given tables, and from
+    the request `args`. It is based on the versions of the tables (see the
+    `table_versions` migration), so it is known before running the actual
+    queries.
+    """
+    placeholders = ", ".join("?" for _ in tables)
+    rows = await db.fetch_rows(
+        f"SELECT name, version FROM table_versions WHERE name IN ({placeholders})",
+        tuple(tables),
+    )
+    versions = sorted((row["name"], row["version"]) for row in rows)
+    return f'W/"{digest(repr((versions, args)).encode())}"'
+
+
+def content_etag(body: bytes) -> str:
+    """Strong ETag of a response body."""
+    return f'"{digest(body)}"'
+
+
+def digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def check_etag(
+    request: Request, response: Response, etag: str, cache_control: str = REVALIDATE
+) -> None:
+    """
+    Respond with 304 Not Modified if the client already has the current
+    version of the response, otherwise add the caching headers to `response`.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        raise HTTPException(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Weak comparison of the ETag with the `If-None-Match` header."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
@@ -0,0 +1,249 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import logging
+from typing import Any
+
+from omnidemo.db import AnyDict, AsyncSqliteDatabase
+from omnidemo.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class JobSubscription:
+    """
+    Receives the updates of a single job from the `JobHub`. Only the latest
+    state of the job is kept: if the subscriber falls behind, the states that
+    it has not consumed yet are replaced by the newer ones.
+    """
+
+    def __init__(self, hub: JobHub, job_id: str):
+        self.hub = hub
+        self.job_id = job_id
+        self._queue: asyncio.Queue[AnyDict] = asyncio.Queue(maxsize=1)
+
+    async def get(self, timeout: float) -> AnyDict | None:
+        """Wait for the next state of the job, return None on timeout."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def put(self, job: AnyDict) -> None:
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(job)
+
+    def close(self) -> None:
+        self.hub._unsubscribe(self)
+
+
+class JobHub:
+    """
+    In-process pub/sub for the job updates: the new states of a job are
+    delivered to everyone who has subscribed to it.
+    """
+
+    def __init__(self) -> None:
+        self._subscriptions: dict[str, set[JobSubscription]] = {}
+
+    def subscribe(self, job_id: str) -> JobSubscription:
+        subscription = JobSubscription(self, job_id)
+        self._subscriptions.setdefault(job_id, set()).add(subscription)
+        return subscription
+
+    def publish(self, job: AnyDict) -> None:
+        for subscription in self._subscriptions.get(job["id"], ()):
+            subscription.put(job)
+
+    @property
+    def job_ids(self) -> list[str]:
+        """Ids of the jobs that have subscribers."""
+        return list(self._subscriptions)
+
+    def _unsubscribe(self, subscription: JobSubscription) -> None:
+        subscriptions = self._subscriptions.get(subscription.job_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.job_id]
+
+
+class JobRegistry:
+    """
+    Keeps the latest state of the jobs that are running in this process.
+
+    Progress updates are applied in memory and published to the `JobHub`
+    right away, but they reach the `jobs` table only in batches: every
+    `job_flush_interval` seconds, or sooner when the progress of some job
+    has moved by `job_flush_delta` since it was last written. All pending
+    updates are then written in a single transaction. Terminal states
+    (completed / failed) are always written through immediately.
+
+    The jobs may also be updated by other server processes. For those, the
+    registry re-reads the subscribed jobs from the database whenever the
+    database signals a change (see `ChangeNotifier`), which is a single
+    query per change no matter how many subscribers there are.
+    """
+
+    def __init__(self, hub: JobHub):
+        self.hub = hub
+        self._jobs: dict[str, AnyDict] = {}
+        # Progress of each job as it was last written into the database
+        self._flushed: dict[str, float] = {}
+        self._tasks: list[asyncio.Task[None]] = []
+        self._db: AsyncSqliteDatabase | None = None
+        self._flush_lock = asyncio.Lock()
+
+    def get(self, job_id: str) -> AnyDict | None:
+        return self._jobs.get(job_id)
+
+    def add(self, job: AnyDict) -> None:
+        """Start tracking a job that was just created in the database."""
+        if job["status"] == "running":
+            self._jobs[job["id"]] = job
+            self._flushed[job["id"]] = job["progress"]
+        self.hub.publish(job)
+
+    def remove(self, job: AnyDict) -> None:
+        """Stop tracking a job whose final state was written by the caller."""
+        self._jobs.pop(job["id"], None)
+        self._flushed.pop(job["id"], None)
+        self.hub.publish(job)
+
+    async def update(
+        self,
+        db: AsyncSqliteDatabase,
+        job_id: str,
+        *,
+        progress: float | None = None,
+        status: str | None = None,
+        error: str | None = None,
+    ) -> AnyDict:
+        fields = {"progress": progress, "status": status, "error": error}
+        updates = {k: v for k, v in fields.items() if v is not None}
+        job = self._jobs.get(job_id)
+        if job is None or updates.get("status", "running") != "running":
+            # Write through: the job is not tracked here, or it is finished
+            if job is not None:
+                updates = {"progress": job["progress"], **updates}
+            row = await write_job(db, job_id, **updates)
+            if row["status"] == "running":
+                self.add(row)
+            else:
+                self.remove(row)
+            return row
+
+        job = {**job, **updates}
+        self._jobs[job_id] = job
+        self.hub.publish(job)
+        if abs(job["progress"] - self._flushed[job_id]) >= settings.job_flush_delta:
+            await self.flush(db)
+        return job
+
+    async def flush(self, db: AsyncSqliteDatabase) -> None:
+        """Write the progress of all jobs that has not been written yet."""
+        async with self._flush_lock:
+            pending = [
+                (job["progress"], job_id)
+                for job_id, job in list(self._jobs.items())
+                if job["progress"] != self._flushed.get(job_id)
+            ]
+            if not pending:
+                return
+            async with db.transaction() as tx:
+                for progress, job_id in pending:
+                    # A job could have been finished by someone else
+                    await tx.execute(
+                        """
+                        UPDATE jobs SET progress = ?
+                        WHERE id = ? AND status = 'running'
+                        """,
+                        (progress, job_id),
+                    )
+            for progress, job_id in pending:
+                if job_id in self._flushed:
+                    self._flushed[job_id] = progress
+
+    def start(self, db: AsyncSqliteDatabase) -> None:
+        if not self._tasks:
+            self._db = db
+            self._tasks = [
+                asyncio.create_task(self._flush_periodically(db)),
+                asyncio.create_task(self._watch(db)),
+            ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        if self._db is not None:
+            await self.flush(self._db)
+            self._db = None
+
+    async def _flush_periodically(self, db: AsyncSqliteDatabase) -> None:
+        while True:
+            await asyncio.sleep(settings.job_flush_interval)
+            try:
+                await self.flush(db)
+            except Exception:
+                logger.exception("Failed to flush the progress of the jobs")
+
+    async def _watch(self, db: AsyncSqliteDatabase) -> None:
+        change = db.changes.next_change()
+        while True:
+            await change.wait()
+            # Take the next event before querying, so that the changes made
+            # while the query runs are not missed
+            change = db.changes.next_change()
+            try:
+                await self._publish_changes(db)
+            except Exception:
+                logger.exception("Failed to read the updates of the jobs")
+
+    async def _publish_changes(self, db: AsyncSqliteDatabase) -> None:
+        """Publish the current state of the jobs that other processes run."""
+        # The jobs running in this process are already up to date
+        job_ids = [i for i in self.hub.job_ids if i not in self._jobs]
+        if not job_ids:
+            return
+        placeholders = ", ".join("?" for _ in job_ids)
+        rows = await db.fetch_rows(
+            f"SELECT * FROM jobs WHERE id IN ({placeholders})", tuple(job_ids)
+        )
+        for row in rows:
+            self.hub.publish(row)
+
+
+async def write_job(db: AsyncSqliteDatabase, job_id: str, **updates: Any) -> AnyDict:
+    """Update the given fields of the job in the database, and return its row."""
+    assignments = ", ".join(f"{k} = ?" for k in updates)
+    async with db.transaction() as tx:
+        await tx.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?",
+            (*updates.values(), job_id),
+        )
+        return await tx.fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+
+
+job_hub = JobHub()
+job_registry = JobRegistry(job_hub)
+
+
+async def update_job(
+    db: AsyncSqliteDatabase,
+    job_id: str,
+    *,
+    progress: float | None = None,
+    status: str | None = None,
+    error: str | None = None,
+) -> AnyDict:
+    """
+    Update the given fields of the job, and publish its new state to the
+    subscribers. Returns the updated job.
+    """
+    return await job_registry.update(
+        db, job_id, progress=progress, status=status, error=error
+    )
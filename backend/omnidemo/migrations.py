@@ -0,0 +1,326 @@
+"""
+Schema migrations of the sqlite database.
+
+A new database is created from `db/initial.sql`, which is the schema as it
+was before the first migration, and is then brought up to date by the same
+migrations as the existing databases. The number of migrations applied to
+the database is stored in `PRAGMA user_version`.
+
+Migrations are only ever appended to `MIGRATIONS`: once released, they must
+not be modified. Databases that were created before the migrations existed
+may already have some of the changes, so the early migrations tolerate that.
+"""
+
+from __future__ import annotations
+import sqlite3
+from typing import Callable
+
+Migration = Callable[[sqlite3.Connection], None]
+
+
+def migrate(conn: sqlite3.Connection) -> None:
+    """Apply the migrations that the database doesn't have yet."""
+    if _user_version(conn) >= len(MIGRATIONS):
+        return
+    # Several server processes may start at the same time: the write lock
+    # makes sure that each migration is applied only once
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = _user_version(conn)
+        for migration in MIGRATIONS[version:]:
+            migration(conn)
+        conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+
+
+def _charts_unique(conn: sqlite3.Connection) -> None:
+    """
+    Allow only one chart per forecast and chart key. Older databases may
+    contain duplicates, which are removed first.
+    """
+    conn.execute(
+        """
+        DELETE FROM charts WHERE id NOT IN (
+            SELECT MIN(id) FROM charts GROUP BY forecast_id, chart_key
+        )
+        """
+    )
+    # This index also serves the lookups of charts by forecast and chart key
+    conn.execute(
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS charts_forecast_id_chart_key
+            ON charts (forecast_id, chart_key)
+        """
+    )
+
+
+def _leases(conn: sqlite3.Connection) -> None:
+    """
+    Short-lived locks that are shared between the server processes. A lease
+    is held by its `owner` until `expires_at` (unix time, in seconds); after
+    that it may be taken over by anyone else.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+            key TEXT PRIMARY KEY NOT NULL,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """
+    )
+
+
+def _jobs_queue(conn: sqlite3.Connection) -> None:
+    """Columns of the forecast queue, which is stored in the `jobs` table."""
+    # 1-based position of a queued job in the forecast queue
+    _add_column(conn, "jobs", "queue_position", "INTEGER NULL")
+    # The server process that runs the job holds a lease on it until
+    # `lease_expires_at` (unix time), and keeps extending it while alive
+    _add_column(conn, "jobs", "lease_owner", "TEXT NULL")
+    _add_column(conn, "jobs", "lease_expires_at", "REAL NULL")
+    # Number of times the job was started, and the earliest time (unix)
+    # when a queued job may be started again after a failed attempt
+    _add_column(conn, "jobs", "attempts", "INTEGER NOT NULL DEFAULT 0")
+    _add_column(conn, "jobs", "run_after", "REAL NULL")
+
+
+def _hot_query_indexes(conn: sqlite3.Connection) -> None:
+    """Indexes for the queries that would otherwise scan whole tables."""
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS user_charts_username ON user_charts (username)"
+    )
+    # The latest forecast / input file
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS forecasts_created_at ON forecasts (created_at)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS inputs_created_at ON inputs (created_at)")
+    # The forecast queue: the queued and running jobs, and their forecasts
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS forecasts_job_id ON forecasts (job_id)")
+
+
+def _list_indexes(conn: sqlite3.Connection) -> None:
+    """
+    Indexes for the keyset pagination of the list endpoints, which order the
+    rows by `(created_at, id)`. In `insights`, the id is the rowid, which
+    every index includes already.
+    """
+    conn.execute("DROP INDEX IF EXISTS inputs_created_at")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS inputs_created_at_id ON inputs (created_at, id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS insights_created_at ON insights (created_at)"
+    )
+
+
+# Tables whose changes are counted in `table_versions`
+VERSIONED_TABLES = ["forecasts", "inputs", "insights", "jobs", "user_charts"]
+
+
+def _table_versions(conn: sqlite3.Connection) -> None:
+    """
+    A version of each table, which is incremented by triggers on every
+    change, in any process. The versions start at random values, so that
+    they are not repeated if the database is re-created.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY NOT NULL,
+            version INTEGER NOT NULL
+        )
+        """
+    )
+    for table in VERSIONED_TABLES:
+        _count_changes(conn, table, ["INSERT", "UPDATE", "DELETE"])
+
+
+def _blobs(conn: sqlite3.Connection) -> None:
+    """
+    Content-addressed storage of the uploaded files, see `omnidemo.blobs`.
+    The `refcount` of a blob is the number of inputs that point to it, and
+    is maintained by the triggers. The inputs uploaded before this migration
+    have no `sha256`, and keep their own files.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY NOT NULL,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    _add_column(conn, "inputs", "sha256", "TEXT NULL")
+    _count_blob_refs(conn)
+
+
+def _forecast_memo(conn: sqlite3.Connection) -> None:
+    """
+    Key of the forecast's result, by which the completed forecasts are
+    reused, see `forecast_memo_key()`.
+    """
+    _add_column(conn, "forecasts", "memo_key", "TEXT NULL")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS forecasts_memo_key ON forecasts (memo_key)"
+    )
+
+
+def _chart_partials(conn: sqlite3.Connection) -> None:
+    """
+    Partial aggregates of the `avg` charts, by which the coarser charts are
+    rolled up from them, see `ChartData`. JSON, or NULL for other charts.
+    """
+    _add_column(conn, "charts", "partials", "TEXT NULL")
+
+
+def _chart_versions(conn: sqlite3.Connection) -> None:
+    """
+    A version of the `charts` table as well, for `ChartCache`. Only updates
+    and deletes increment it: a new chart doesn't make the cached ones stale.
+    """
+    _count_changes(conn, "charts", ["UPDATE", "DELETE"])
+
+
+def _inputs_seq(conn: sqlite3.Connection) -> None:
+    """
+    Number the inputs in the order in which they were uploaded, for the
+    keyset pagination: `created_at` has a resolution of one second, and the
+    ids are random UUIDs, so they cannot order the uploads made within the
+    same second. AUTOINCREMENT never reuses the numbers of deleted rows.
+
+    SQLite can only add such a column by rebuilding the table. The triggers
+    of the old table are dropped with it, and created again. Its index on
+    `(created_at, id)`, see `_list_indexes()`, is not: the inputs are now
+    listed by `seq`, which is the rowid, and looked up by `id`, which has the
+    index of its UNIQUE constraint.
+    """
+    columns = "id, file_name, stored_name, username, size, created_at, sha256"
+    conn.execute(
+        """
+        CREATE TABLE inputs_seq (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+            id TEXT UNIQUE NOT NULL,
+            file_name TEXT NOT NULL,
+            stored_name TEXT NOT NULL,
+            username TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            sha256 TEXT NULL
+        )
+        """
+    )
+    conn.execute(
+        f"""
+        INSERT INTO inputs_seq ({columns})
+        SELECT {columns} FROM inputs ORDER BY created_at, rowid
+        """
+    )
+    conn.execute("DROP TABLE inputs")
+    conn.execute("ALTER TABLE inputs_seq RENAME TO inputs")
+    _count_changes(conn, "inputs", ["INSERT", "UPDATE", "DELETE"])
+    _count_blob_refs(conn)
+    # The rows have changed: they have a `seq` now
+    conn.execute(
+        "UPDATE table_versions SET version = version + 1 WHERE name = 'inputs'"
+    )
+
+
+def _storage_codecs(conn: sqlite3.Connection) -> None:
+    """
+    The codec of each stored file, see `omnidemo.storage`, or NULL if the
+    file is not compressed. Until now it was told by the suffix of the file
+    name, which is only reliable for the names that we chose: those of the
+    blobs (the inputs with a `sha256`) and of the forecast outputs. The
+    older inputs keep their users' names, and were never compressed.
+    """
+    _add_column(conn, "inputs", "codec", "TEXT NULL")
+    _add_column(conn, "forecasts", "codec", "TEXT NULL")
+    suffixes = {"gzip": ".gz", "lzma": ".xz", "zstd": ".zst"}
+    for table, column, condition in [
+        ("inputs", "stored_name", "sha256 IS NOT NULL"),
+        ("forecasts", "file_id", "file_id LIKE 'forecasts~%'"),
+    ]:
+        for codec, suffix in suffixes.items():
+            conn.execute(
+                f"""
+                UPDATE {table} SET codec = ?
+                WHERE {condition} AND {column} LIKE ?
+                """,
+                (codec, f"%{suffix}"),
+            )
+
+
+MIGRATIONS: list[Migration] = [
+    _charts_unique,
+    _leases,
+    _jobs_queue,
+    _hot_query_indexes,
+    _list_indexes,
+    _table_versions,
+    _blobs,
+    _forecast_memo,
+    _chart_partials,
+    _chart_versions,
+    _inputs_seq,
+    _storage_codecs,
+]
+
+
+def _user_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _count_changes(conn: sqlite3.Connection, table: str, events: list[str]) -> None:
+    """Increment the version of the table in `table_versions` on the events."""
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO table_versions (name, version)
+        VALUES (?, ABS(RANDOM() >> 1))
+        """,
+        (table,),
+    )
+    for event in events:
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_version
+            AFTER {event} ON {table} BEGIN
+                UPDATE table_versions SET version = version + 1
+                WHERE name = '{table}';
+            END
+            """
+        )
+
+
+def _count_blob_refs(conn: sqlite3.Connection) -> None:
+    """Maintain the `refcount` of the blobs as the inputs come and go."""
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS inputs_insert_blob
+        AFTER INSERT ON inputs WHEN NEW.sha256 IS NOT NULL BEGIN
+            UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = NEW.sha256;
+        END
+        """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS inputs_delete_blob
+        AFTER DELETE ON inputs WHEN OLD.sha256 IS NOT NULL BEGIN
+            UPDATE blobs SET refcount = refcount - 1 WHERE sha256 = OLD.sha256;
+        END
+        """
+    )
+
+
+def _add_column(
+    conn: sqlite3.Connection, table: str, column: str, definition: str
+) -> None:
+    """Add a column to the table, unless it already exists."""
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
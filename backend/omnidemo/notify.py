@@ -0,0 +1,106 @@
+from __future__ import annotations
+import asyncio
+import contextlib
+import sqlite3
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, TypeVar
+
+T = TypeVar("T")
+
+
+async def wait_event(event: asyncio.Event, timeout: float) -> bool:
+    """
+    Wait until the event is set, for at most `timeout` seconds, and return
+    whether it is set. Unlike `asyncio.wait_for()` (before Python 3.12), this
+    never swallows a cancellation that arrives just as the event is set: the
+    background tasks could not be stopped then.
+    """
+    waiter = asyncio.ensure_future(event.wait())
+    try:
+        await asyncio.wait([waiter], timeout=timeout)
+    finally:
+        waiter.cancel()
+    return event.is_set()
+
+
+class ChangeNotifier:
+    """
+    Wakes up coroutines that are waiting for something to change in the
+    database, without having them poll the database.
+
+    Changes made by the current process are announced with `notify()`, and
+    wake the waiters immediately. Changes made by other server processes are
+    detected by a background task that watches `PRAGMA data_version` on its
+    own connection: this value changes whenever another connection commits
+    a transaction, and reading it does not touch any tables.
+    """
+
+    def __init__(self, db_path: Path, interval: float):
+        self.db_path = db_path
+        self.interval = interval
+        self._event = asyncio.Event()
+        self._task: asyncio.Task[None] | None = None
+
+    def notify(self) -> None:
+        """Wake up everyone who is currently waiting."""
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def next_change(self) -> asyncio.Event:
+        """Return an event that will be set by the next change notification."""
+        return self._event
+
+    async def wait_for(
+        self, check: Callable[[], Awaitable[T | None]], timeout: float
+    ) -> T:
+        """
+        Wait until `check()` returns a value other than None, and return it.
+        The check is re-run after every change notification. Raises
+        `asyncio.TimeoutError` if the value doesn't appear within `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            # The event must be taken before the check, otherwise we could
+            # miss a notification that arrives in between
+            event = self._event
+            result = await check()
+            if result is not None:
+                return result
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError
+            await wait_event(event, remaining)
+
+    def start(self) -> None:
+        """Start watching for the changes made by other processes."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _watch(self) -> None:
+        # The queries run in a thread: while another process holds the write
+        # lock, they may block, and they must not block the event loop
+        conn = await asyncio.to_thread(
+            sqlite3.connect, self.db_path, check_same_thread=False
+        )
+        try:
+            version = await asyncio.to_thread(_data_version, conn)
+            while True:
+                await asyncio.sleep(self.interval)
+                new_version = await asyncio.to_thread(_data_version, conn)
+                if new_version != version:
+                    version = new_version
+                    self.notify()
+        finally:
+            conn.close()
+
+
+def _data_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA data_version").fetchone()[0]
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+from fastapi import HTTPException
+
+from omnidemo.db import AnyDict, AsyncSqliteDatabase
+
+# Page size of the list endpoints, unless requested otherwise
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def make_cursor(row: AnyDict, key: str) -> str:
+    """
+    The cursor of a row is its `key`: a number that increases with every new
+    row, and is never reused. The creation times can't serve as the cursors,
+    since they have a resolution of one second.
+    """
+    return str(row[key])
+
+
+def parse_cursor(cursor: str) -> int:
+    try:
+        return int(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {cursor}")
+
+
+async def fetch_page(
+    db: AsyncSqliteDatabase,
+    table: str,
+    *,
+    key: str,
+    limit: int,
+    after: str | None,
+    since: str | None,
+) -> tuple[list[AnyDict], str | None]:
+    """
+    Fetch a page of rows from the table, using keyset pagination over the
+    `key` of the table, which must be an AUTOINCREMENT primary key:
+
+    - by default, the newest rows come first, and `after` continues from
+      the cursor of the last row of the previous page towards older rows;
+    - with `since`, only the rows created after that cursor are returned,
+      oldest first: this lets the clients fetch just the new rows.
+
+    Returns the rows, and the cursor to pass as `after` / `since` to get the
+    next page, or None if there are no more rows.
+    """
+    if after is not None and since is not None:
+        raise HTTPException(
+            status_code=400, detail="Parameters `after` and `since` are exclusive"
+        )
+    cursor = after if since is None else since
+    where = ""
+    params: tuple[object, ...] = ()
+    if cursor is not None:
+        where = f"WHERE {key} {'<' if since is None else '>'} ?"
+        params = (parse_cursor(cursor),)
+    order = "DESC" if since is None else "ASC"
+    rows = await db.fetch_rows(
+        f"SELECT * FROM {table} {where} ORDER BY {key} {order} LIMIT ?",
+        (*params, limit),
+    )
+    next_cursor = make_cursor(rows[-1], key) if len(rows) == limit else None
+    return rows, next_cursor
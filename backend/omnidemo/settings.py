@@ -1,6 +1,7 @@
 from __future__ import annotations
 import os
 from pathlib import Path
+from typing import Literal
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -48,6 +49,55 @@ class Settings(BaseSettings):
     sqlite_db: Path = project_root / "db" / "omnidemo.db"
     sqlite_sql: Path = project_root / "db" / "initial.sql"
     storage_dir: Path = project_root / "db" / "storage"
+    # Number of reader connections (and threads) per server process
+    sqlite_readers: int = 2
+    # How long (in seconds) to wait for a lock held by another connection
+    sqlite_busy_timeout: float = 30.0
+    # Compression of the uploaded files and the forecast outputs at rest:
+    # "none", "gzip", "lzma", or "zstd" (requires the `zstandard` package)
+    storage_compression: Literal["none", "gzip", "lzma", "zstd"] = "none"
+
+    # How often (in seconds) to check whether other server processes have
+    # modified the database, while someone is waiting for a change
+    db_watch_interval: float = 0.2
+    # Maximum number of forecasts that run at the same time in each server
+    # process; the others wait in a queue
+    forecast_workers: int = 1
+    # A server process holds a lease on each forecast that it runs, and
+    # renews it every third of this time (in seconds). When the process dies,
+    # its forecasts are re-queued once the lease expires.
+    forecast_lease_ttl: float = 30.0
+    # Failed forecast attempts are retried up to `forecast_max_attempts` in
+    # total, after a delay that starts at `forecast_retry_delay` seconds and
+    # doubles with each attempt
+    forecast_max_attempts: int = 3
+    forecast_retry_delay: float = 5.0
+    # How often (in seconds) to look for the forecasts that became ready to
+    # run without any change in the database (e.g. after a retry delay)
+    forecast_poll_interval: float = 5.0
+    # How long (in seconds) `get_chart` waits for a forecast to complete
+    forecast_wait_timeout: float = 600.0
+    # How long (in seconds) a server process may hold the lease for computing
+    # a chart, before other processes assume it has crashed and take over
+    chart_lease_ttl: float = 60.0
+    # Memory budget (in bytes) of the in-process cache of chart responses
+    chart_cache_size: int = 64 * 2**20
+    # Responses of at least this many bytes are compressed, if the client
+    # accepts gzip (or brotli, when the `brotli` package is installed)
+    compression_min_size: int = 1024
+    # Memory budget (in bytes) of the cached compressed immutable responses
+    compression_cache_size: int = 16 * 2**20
+    # Interval (in seconds) between keep-alive comments in the job event
+    # streams, so that proxies don't close idle connections
+    job_stream_keepalive: float = 15.0
+    # How long (in seconds) the job event stream waits for a job to appear,
+    # since the client may subscribe before the job is created
+    job_stream_start_timeout: float = 10.0
+    # The progress of running jobs is kept in memory, and written into the
+    # database every `job_flush_interval` seconds, or as soon as it has moved
+    # by `job_flush_delta` since the last write
+    job_flush_interval: float = 1.0
+    job_flush_delta: float = 0.1
 
 
 settings = Settings()
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import asyncio
+import time
+import uuid
+from typing import Awaitable, Callable, Generic, Hashable, TypeVar
+
+from omnidemo.db import AsyncSqliteDatabase
+
+K = TypeVar("K", bound=Hashable)
+T = TypeVar("T")
+
+# Identifies the current server process as the owner of a lease
+PROCESS_ID = str(uuid.uuid4())
+
+
+class SingleFlight(Generic[K, T]):
+    """
+    Coalesces concurrent calls with the same key into a single execution.
+
+    The first caller for a key (the "leader") starts the computation, and
+    all callers that arrive while it is still running ("followers") await
+    the same result. The computation runs as a separate task, so that it is
+    not aborted when the leader's request gets cancelled.
+    """
+
+    def __init__(self) -> None:
+        self._tasks: dict[K, asyncio.Task[T]] = {}
+
+    async def run(self, key: K, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return await asyncio.shield(task)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._tasks
+
+
+class SqliteLease:
+    """
+    A lock shared between all server processes, stored as a row in the
+    `leases` table. The lease expires after `ttl` seconds, so that a crashed
+    process cannot hold it forever.
+    """
+
+    def __init__(self, db: AsyncSqliteDatabase, key: str, ttl: float):
+        self.db = db
+        self.key = key
+        self.ttl = ttl
+
+    async def acquire(self) -> bool:
+        """Try to take the lease, return True if successful."""
+        now = time.time()
+        changed = await self.db.execute(
+            """
+            INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE
+            SET owner = excluded.owner, expires_at = excluded.expires_at
+            WHERE leases.expires_at < ?
+            """,
+            (self.key, PROCESS_ID, now + self.ttl, now),
+        )
+        return changed > 0
+
+    async def release(self) -> None:
+        await self.db.execute(
+            "DELETE FROM leases WHERE key = ? AND owner = ?",
+            (self.key, PROCESS_ID),
+        )
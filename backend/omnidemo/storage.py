@@ -0,0 +1,127 @@
+"""
+Compression of the files in the storage.
+
+When `settings.storage_compression` is set, the uploaded files and the
+forecast outputs are compressed as they are written. The codec of each file
+is recorded in the database next to it (`inputs.codec`, `forecasts.codec`),
+so the files written with other settings (or before the compression
+existed) remain readable. The codec's suffix is appended to the names of the
+compressed files, but it is never used to tell their codec: the names of
+the uploaded files are chosen by the users, who may upload compressed files.
+
+The columnar sidecars of the forecasts are not compressed: they are
+memory-mapped by `get_chart`.
+"""
+
+from __future__ import annotations
+import abc
+import gzip
+import lzma
+from typing import BinaryIO, cast
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from omnidemo.settings import settings
+
+
+class Codec(abc.ABC):
+    """
+    A compression format of the stored files. The levels favour speed over
+    the ratio: the files are compressed while they are being uploaded, or
+    while the forecast runs.
+    """
+
+    name: str
+    # Suffix that is appended to the names of the compressed files
+    suffix: str
+    # The HTTP content coding of the format, if there is one
+    content_encoding: str | None = None
+
+    @abc.abstractmethod
+    def reader(self, raw: BinaryIO) -> BinaryIO:
+        """Wrap the raw file, decompressing what is read from it."""
+
+    @abc.abstractmethod
+    def writer(self, raw: BinaryIO) -> BinaryIO:
+        """Wrap the raw file, compressing what is written into it."""
+
+
+class GzipCodec(Codec):
+    name = "gzip"
+    suffix = ".gz"
+    content_encoding = "gzip"
+
+    def reader(self, raw: BinaryIO) -> BinaryIO:
+        return cast(BinaryIO, gzip.GzipFile(fileobj=raw, mode="rb"))
+
+    def writer(self, raw: BinaryIO) -> BinaryIO:
+        return cast(BinaryIO, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=1))
+
+
+class LzmaCodec(Codec):
+    name = "lzma"
+    suffix = ".xz"
+
+    def reader(self, raw: BinaryIO) -> BinaryIO:
+        return cast(BinaryIO, lzma.LZMAFile(raw, mode="rb"))
+
+    def writer(self, raw: BinaryIO) -> BinaryIO:
+        return cast(BinaryIO, lzma.LZMAFile(raw, mode="wb", preset=0))
+
+
+class ZstdCodec(Codec):
+    name = "zstd"
+    suffix = ".zst"
+    content_encoding = "zstd"
+
+    def reader(self, raw: BinaryIO) -> BinaryIO:
+        return zstandard.ZstdDecompressor().stream_reader(raw, closefd=False)
+
+    def writer(self, raw: BinaryIO) -> BinaryIO:
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=False)
+
+
+CODECS: dict[str, Codec] = {
+    codec.name: codec for codec in [GzipCodec(), LzmaCodec(), ZstdCodec()]
+}
+
+
+def storage_codec() -> Codec | None:
+    """The codec of the newly written files, per the settings."""
+    if settings.storage_compression == "none":
+        return None
+    return codec_named(settings.storage_compression)
+
+
+def codec_named(name: str | None) -> Codec | None:
+    """The codec recorded for a stored file, or None if it is not compressed."""
+    if name is None:
+        return None
+    if name == "zstd" and zstandard is None:
+        raise RuntimeError("Compression `zstd` requires the `zstandard` package")
+    return CODECS[name]
+
+
+def codec_name(codec: Codec | None) -> str | None:
+    """What is recorded in the database for a file stored with `codec`."""
+    return codec.name if codec else None
+
+
+def decompress(raw: BinaryIO, codec: Codec | None) -> BinaryIO:
+    """
+    Wrap the raw file opened for reading, if it is compressed. Closing the
+    wrapper does not close the raw file, whose position still tells how much
+    of the file has been consumed.
+    """
+    return codec.reader(raw) if codec else raw
+
+
+def compress(raw: BinaryIO, codec: Codec | None) -> BinaryIO:
+    """
+    Wrap the raw file opened for writing, if it should be compressed. The
+    wrapper must be closed before the raw file, to write out the trailer.
+    """
+    return codec.writer(raw) if codec else raw
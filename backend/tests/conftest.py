@@ -1,10 +1,13 @@
+from pathlib import Path
 from typing import Any, AsyncGenerator
 
 import pytest
 from fastapi import FastAPI
 from httpx import AsyncClient
 
-from omnidemo.web.application import get_app
+from omnidemo.app import get_app
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.settings import settings
 
 
 @pytest.fixture(scope="session")
@@ -41,3 +44,71 @@ async def client(
     """
     async with AsyncClient(app=fastapi_app, base_url="http://test", timeout=2.0) as ac:
         yield ac
+
+
+@pytest.fixture
+def db_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """
+    Point the settings to a database in a temporary directory.
+
+    The environment is set as well, for the worker processes.
+
+    :return: path of the database file, which doesn't exist yet.
+    """
+    path = tmp_path / "omnidemo.db"
+    storage = tmp_path / "storage"
+    monkeypatch.setattr(settings, "sqlite_db", path)
+    monkeypatch.setattr(settings, "storage_dir", storage)
+    monkeypatch.setenv("OMNIDEMO_SQLITE_DB", str(path))
+    monkeypatch.setenv("OMNIDEMO_STORAGE_DIR", str(storage))
+    return path
+
+
+@pytest.fixture
+async def async_db(
+    db_path: Path,
+    anyio_backend: Any,
+) -> AsyncGenerator[AsyncSqliteDatabase, None]:
+    """
+    Fresh database with all the migrations applied.
+
+    :yield: the database.
+    """
+    db = AsyncSqliteDatabase.connect()
+    yield db
+    await db.close()
+
+
+@pytest.fixture
+def app_db(fastapi_app: FastAPI, async_db: AsyncSqliteDatabase) -> AsyncSqliteDatabase:
+    """
+    Fresh database, used by the endpoints of the app.
+
+    The client doesn't run the app's lifespan, which would open it.
+
+    :return: the database.
+    """
+    fastapi_app.state.db = async_db
+    return async_db
+
+
+@pytest.fixture
+async def forecast_db(app_db: AsyncSqliteDatabase) -> AsyncSqliteDatabase:
+    """
+    Database with the draft forecast 1, whose output file is written.
+
+    The file has the rows `sku,region,forecast`: `sku0,eu,1.5`, `sku1,us,2`
+    and `sku0,us,0.5`. There are no charts yet.
+
+    :return: the database.
+    """
+    (app_db.storage / "forecasts~a.csv").write_text(
+        "sku,region,forecast\nsku0,eu,1.5\nsku1,us,2\nsku0,us,0.5\n",
+    )
+    await app_db.execute(
+        """
+        INSERT INTO forecasts (id, file_id, status)
+        VALUES (1, 'forecasts~a.csv', 'draft')
+        """,
+    )
+    return app_db
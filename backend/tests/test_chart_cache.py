@@ -0,0 +1,96 @@
+import asyncio
+from typing import AsyncGenerator
+
+import pytest
+
+from omnidemo.chart_cache import ChartCache
+from omnidemo.db import AnyDict, AsyncSqliteDatabase
+
+
+@pytest.fixture
+async def cache(async_db: AsyncSqliteDatabase) -> AsyncGenerator[ChartCache, None]:
+    """
+    Cache that watches the database, with a chart of the forecast 1.
+
+    :yield: the cache.
+    """
+    await async_db.execute(
+        "INSERT INTO forecasts (id, file_id, status) VALUES (1, 'a', 'draft')",
+    )
+    cache = ChartCache(1_000_000)
+    cache.put(1, "sku,sum/forecast", "a", b"{}", cache.version)
+    cache.start(async_db)
+    await asyncio.sleep(0)
+    await changed(async_db)
+    yield cache
+    await cache.stop()
+
+
+async def changed(db: AsyncSqliteDatabase) -> None:
+    """Announce a change, and give the cache the time to check it."""
+    db.changes.notify()
+    await asyncio.sleep(0.05)
+
+
+@pytest.mark.anyio
+async def test_unrelated_changes(
+    cache: ChartCache,
+    async_db: AsyncSqliteDatabase,
+) -> None:
+    """
+    The charts that are being read stay cached after unrelated changes.
+
+    Neither the changes of the other tables nor new charts evict them.
+    """
+    version = cache.version
+    await async_db.execute(
+        "INSERT INTO insights (message, username) VALUES ('hi', 'ann')",
+    )
+    await changed(async_db)
+    await async_db.execute(
+        """
+        INSERT INTO charts (forecast_id, chart_key, data)
+        VALUES (1, 'sku,sum/forecast', '[]')
+        """,
+    )
+    await changed(async_db)
+    assert cache.version == version
+    assert cache.get(1, "sku,sum/forecast") == b"{}"
+
+
+@pytest.mark.anyio
+async def test_forecast_changes(
+    cache: ChartCache,
+    async_db: AsyncSqliteDatabase,
+) -> None:
+    """The charts of a forecast whose file has changed are dropped."""
+    version = cache.version
+    await async_db.execute("UPDATE forecasts SET status = 'published'")
+    await changed(async_db)
+    assert cache.version == version + 1
+    assert cache.get(1, "sku,sum/forecast") == b"{}"
+
+    await async_db.execute("UPDATE forecasts SET file_id = 'b'")
+    await changed(async_db)
+    assert cache.get(1, "sku,sum/forecast") is None
+
+
+@pytest.mark.anyio
+async def test_watch_errors(
+    cache: ChartCache,
+    async_db: AsyncSqliteDatabase,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """The cache keeps watching the database after a failed check."""
+    fetch_rows = async_db.fetch_rows
+
+    async def locked(sql: str, params: tuple[object, ...] = ()) -> list[AnyDict]:
+        raise RuntimeError("Failed to fetch rows: database is locked")
+
+    monkeypatch.setattr(async_db, "fetch_rows", locked)
+    await changed(async_db)
+    monkeypatch.setattr(async_db, "fetch_rows", fetch_rows)
+
+    await async_db.execute("UPDATE forecasts SET file_id = 'b'")
+    await changed(async_db)
+    assert cache.get(1, "sku,sum/forecast") is None
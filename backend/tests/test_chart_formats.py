@@ -0,0 +1,111 @@
+import json
+import struct
+from typing import Any
+
+import numpy as np
+import pytest
+
+from omnidemo.chart_formats import (
+    BINARY_TYPE,
+    COLUMNS_TYPE,
+    chart_format,
+    encode_chart,
+    encode_charts,
+)
+
+ROWS = [["a", "eu", 1.5], ["b", "eu", 2.0], ["a", None, 3.0]]
+ROW = {
+    "id": 1,
+    "forecast_id": 2,
+    "chart_key": "sku,region,sum/forecast",
+    "data": json.dumps(ROWS).encode(),
+    "created_at": "2025-01-01 00:00:00",
+    "file_id": "forecasts~x.csv",
+}
+COLUMNS = [
+    {"name": "sku", "dictionary": ["a", "b"], "codes": [0, 1, 0]},
+    {"name": "region", "dictionary": ["eu", None], "codes": [0, 0, 1]},
+    {"name": "forecast", "values": [1.5, 2.0, 3.0]},
+]
+
+
+def test_rows() -> None:
+    """The stored rows are spliced into the response."""
+    body = encode_chart("rows", ROW)
+    assert ROW["data"] in body
+    chart = json.loads(body)["chart"]
+    assert chart["data"] == ROWS
+    assert chart["chart_key"] == ROW["chart_key"]
+    assert "file_id" not in chart
+
+
+def test_charts() -> None:
+    """The charts of a batch are sent in order, as many times as given."""
+    body = encode_chart("rows", ROW)
+    charts = json.loads(encode_charts("rows", [body, body]))["charts"]
+    assert charts == [json.loads(body)["chart"]] * 2
+
+
+def test_columns() -> None:
+    """The columns format encodes the strings as dictionaries and codes."""
+    chart = json.loads(encode_chart("columns", ROW))["chart"]
+    assert chart["chart_key"] == ROW["chart_key"]
+    assert chart["data"] == {"n_rows": 3, "columns": COLUMNS}
+
+
+def test_binary() -> None:
+    """The binary format is the columns format, with the arrays outside."""
+    body = encode_chart("binary", ROW)
+    (length,) = struct.unpack_from("<I", body)
+    chart = json.loads(body[4 : 4 + length])["chart"]
+    base = (4 + length + 7) // 8 * 8
+
+    columns: list[dict[str, Any]] = []
+    for column in chart["data"]["columns"]:
+        field = "codes" if "codes" in column else "values"
+        buffer = column[field]
+        assert buffer["offset"] % 8 == 0
+        array = np.frombuffer(
+            body,
+            dtype=f"<{buffer['type']}",
+            count=3,
+            offset=base + buffer["offset"],
+        )
+        columns.append({**column, field: array.tolist()})
+    assert columns == COLUMNS
+
+
+@pytest.mark.parametrize(
+    "format, accept, expected",
+    [
+        (None, "", "rows"),
+        (None, "application/json", "rows"),
+        (None, COLUMNS_TYPE, "columns"),
+        (None, f"{BINARY_TYPE}, application/json;q=0.5", "binary"),
+        ("rows", BINARY_TYPE, "rows"),
+    ],
+)
+def test_chart_format(format: str | None, accept: str, expected: str) -> None:
+    """
+    The format parameter wins over the `Accept` header, which is the default.
+
+    :param format: the format parameter.
+    :param accept: the `Accept` header.
+    :param expected: the chosen format.
+    """
+    assert chart_format(format, accept) == expected
+
+
+def test_charts_binary() -> None:
+    """The binary charts are framed so that their arrays stay aligned."""
+    bodies = [encode_chart("binary", ROW), b"x", encode_chart("binary", ROW)]
+    batch = encode_charts("binary", bodies)
+    count, *lengths = struct.unpack_from("<4I", batch)
+    assert count == 3 and lengths == [len(body) for body in bodies]
+
+    offset = 16
+    for body in bodies:
+        offset = (offset + 7) // 8 * 8
+        assert batch[offset : offset + len(body)] == body
+        offset += len(body)
+    assert offset == len(batch)
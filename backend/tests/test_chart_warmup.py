@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+import pytest
+
+from omnidemo.chart_warmup import ChartWarmup, chart_lease, warm_up_charts
+from omnidemo.db import AsyncSqliteDatabase
+
+
+async def save_charts(db: AsyncSqliteDatabase, *chart_keys: str) -> None:
+    """Save the given charts for `ann`."""
+    for chart_key in chart_keys:
+        await db.execute(
+            "INSERT INTO user_charts (username, chart_key) VALUES ('ann', ?)",
+            (chart_key,),
+        )
+
+
+async def stored_charts(db: AsyncSqliteDatabase) -> dict[str, object]:
+    """Data of the stored charts of forecast 1, by chart key."""
+    rows = await db.fetch_rows(
+        "SELECT chart_key, data FROM charts WHERE forecast_id = 1",
+    )
+    return {row["chart_key"]: json.loads(row["data"]) for row in rows}
+
+
+@pytest.mark.anyio
+async def test_warm_up(forecast_db: AsyncSqliteDatabase) -> None:
+    """
+    The saved charts that are missing are computed.
+
+    The invalid ones, and those stored already, are left alone.
+    """
+    await save_charts(
+        forecast_db,
+        "sku,sum/forecast",
+        "region,sum/forecast",
+        "sku,median/forecast",
+    )
+    await save_charts(forecast_db, "sku,sum/region", "sku,sum/forecast")
+    await forecast_db.execute(
+        """
+        INSERT INTO charts (forecast_id, chart_key, data)
+        VALUES (1, 'region,sum/forecast', '[]')
+        """,
+    )
+
+    await warm_up_charts(forecast_db, 1)
+
+    assert await stored_charts(forecast_db) == {
+        "sku,sum/forecast": [["sku0", 2.0], ["sku1", 2.0]],
+        "region,sum/forecast": [],
+    }
+    assert await forecast_db.fetch_rows("SELECT * FROM leases") == []
+
+
+@pytest.mark.anyio
+async def test_leased(forecast_db: AsyncSqliteDatabase) -> None:
+    """The charts that someone else is computing are skipped."""
+    await save_charts(forecast_db, "sku,sum/forecast", "region,sum/forecast")
+    lease = chart_lease(forecast_db, 1, "sku,sum/forecast")
+    assert await lease.acquire()
+
+    await warm_up_charts(forecast_db, 1)
+
+    assert list(await stored_charts(forecast_db)) == ["region,sum/forecast"]
+    rows = await forecast_db.fetch_rows("SELECT key FROM leases")
+    assert rows == [{"key": "chart:1:sku,sum/forecast"}]
+
+
+@pytest.mark.anyio
+async def test_not_completed(forecast_db: AsyncSqliteDatabase) -> None:
+    """A forecast that has no file yet has no charts to warm up."""
+    await save_charts(forecast_db, "sku,sum/forecast")
+    await forecast_db.execute("INSERT INTO forecasts (id, status) VALUES (2, 'draft')")
+
+    await warm_up_charts(forecast_db, 2)
+    await warm_up_charts(forecast_db, 3)
+
+    assert await forecast_db.fetch_rows("SELECT * FROM charts") == []
+
+
+@pytest.mark.anyio
+async def test_worker(forecast_db: AsyncSqliteDatabase) -> None:
+    """The worker goes on with the next forecast after a failed one."""
+    await save_charts(forecast_db, "sku,sum/forecast")
+    await forecast_db.execute(
+        """
+        INSERT INTO forecasts (id, file_id, status)
+        VALUES (2, 'forecasts~missing.csv', 'draft')
+        """,
+    )
+    warmup = ChartWarmup()
+    warmup.start(forecast_db)
+    try:
+        warmup.enqueue(2)
+        warmup.enqueue(1)
+        for _ in range(100):
+            if await stored_charts(forecast_db):
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await warmup.stop()
+
+    assert list(await stored_charts(forecast_db)) == ["sku,sum/forecast"]
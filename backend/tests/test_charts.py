@@ -0,0 +1,214 @@
+import csv
+import random
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pytest
+
+from omnidemo.chart_views import OTHER_LABEL, ChartView, lttb
+from omnidemo.charts import (
+    AGGREGATIONS,
+    ChartData,
+    ChartKey,
+    compute_chart,
+    rollup_chart,
+)
+from omnidemo.columnar import ColumnarTable, convert_csv
+
+
+@pytest.fixture
+def forecast_csv(tmp_path: Path) -> Path:
+    """
+    Forecast with a few categorical and numeric columns, some values empty.
+
+    :return: path of the forecast's CSV file.
+    """
+    rng = random.Random(0)  # noqa: S311
+    file = tmp_path / "forecast.csv"
+    with file.open("w", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(["sku", "region", "week", "price", "forecast"])
+        for _ in range(5000):
+            writer.writerow(
+                [
+                    f"sku{rng.randrange(40)}",
+                    rng.choice(["eu", "us", "asia", ""]),
+                    rng.choice(["1", "2", "3", ""]),
+                    rng.choice(["0.5", "1.25", "2.0", ""]),
+                    rng.choice([str(rng.uniform(0, 100)), ""]),
+                ],
+            )
+    return file
+
+
+@pytest.fixture
+def table(forecast_csv: Path) -> ColumnarTable:
+    """
+    The forecast of `forecast_csv`.
+
+    :return: the columnar table of the forecast.
+    """
+    return convert_csv(forecast_csv)
+
+
+def legacy_chart(file: Path, key: ChartKey) -> list[list[Any]]:
+    """The chart as it was computed before the columnar engine."""
+    fields = [*key.x_fields, key.y_field]
+    with file.open(newline="") as inp:
+        data = [[row.get(f) for f in fields] for row in csv.DictReader(inp)]
+    groups: dict[tuple[Any, ...], list[str]] = defaultdict(list)
+    for row in data:
+        if row[-1]:
+            groups[tuple(row[:-1])].append(row[-1])
+    aggregate = {
+        "sum": lambda v: sum(float(x) for x in v),
+        "avg": lambda v: sum(float(x) for x in v) / len(v),
+        "min": lambda v: min(float(x) for x in v),
+        "max": lambda v: max(float(x) for x in v),
+        "count": len,
+    }[key.agg]
+    return [[*k, aggregate(v)] for k, v in groups.items()]
+
+
+@pytest.mark.parametrize("agg", AGGREGATIONS)
+@pytest.mark.parametrize(
+    "x_fields, y_field",
+    [
+        (("sku",), "forecast"),
+        (("region", "week"), "forecast"),
+        (("week", "sku", "region"), "forecast"),
+        (("price",), "forecast"),
+        (("region", "missing"), "forecast"),
+        (("sku",), "price"),
+        (("region",), "week"),
+    ],
+)
+def test_compute_chart(
+    forecast_csv: Path,
+    table: ColumnarTable,
+    agg: str,
+    x_fields: tuple[str, ...],
+    y_field: str,
+) -> None:
+    """
+    The charts are the same as those of the original aggregation.
+
+    They have the same groups, in the order of their first appearance (empty
+    x-values included, missing fields as None), with the empty y-values
+    skipped.
+    """
+    key = ChartKey(x_fields, y_field, agg)
+
+    expected = legacy_chart(forecast_csv, key)
+    actual = compute_chart(table, key).rows
+
+    assert [row[:-1] for row in actual] == [row[:-1] for row in expected]
+    assert [row[-1] for row in actual] == pytest.approx([row[-1] for row in expected])
+
+
+@pytest.mark.parametrize("agg", AGGREGATIONS)
+@pytest.mark.parametrize(
+    "x_fields, finer_x_fields",
+    [
+        (("region",), ("sku", "region")),
+        (("week", "sku"), ("sku", "region", "week")),
+        (("week",), ("week", "missing")),
+    ],
+)
+def test_rollup(
+    table: ColumnarTable,
+    agg: str,
+    x_fields: tuple[str, ...],
+    finer_x_fields: tuple[str, ...],
+) -> None:
+    """
+    Charts rolled up from finer charts are the same as if computed directly.
+
+    They only differ by the rounding of the aggregates.
+    """
+    key = ChartKey(x_fields, "forecast", agg)
+    finer = ChartKey(finer_x_fields, "forecast", agg)
+    assert key.rolls_up(finer)
+
+    expected = compute_chart(table, key)
+    actual = rollup_chart(key, finer, compute_chart(table, finer))
+
+    assert [row[:-1] for row in actual.rows] == [row[:-1] for row in expected.rows]
+    assert [row[-1] for row in actual.rows] == pytest.approx(
+        [row[-1] for row in expected.rows],
+    )
+    if agg == "avg":
+        assert actual.partials is not None and expected.partials is not None
+        for partial, expected_partial in zip(actual.partials, expected.partials):
+            assert partial == pytest.approx(expected_partial)
+
+
+def test_rolls_up() -> None:
+    """A chart rolls up from the finer charts of the same aggregation."""
+    key = ChartKey.parse("region,avg/forecast")
+    assert key.rolls_up(ChartKey.parse("sku,region,avg/forecast"))
+    assert not key.rolls_up(key)
+    assert not key.rolls_up(ChartKey.parse("sku,region,sum/forecast"))
+    assert not key.rolls_up(ChartKey.parse("sku,region,avg/price"))
+    assert not key.rolls_up(ChartKey.parse("sku,week,avg/forecast"))
+
+
+def test_view_top() -> None:
+    """The groups outside of the top are merged into the "other" group."""
+    key = ChartKey.parse("sku,avg/forecast")
+    data = ChartData(
+        [["a", 1.0], ["b", 4.0], ["c", 2.0], ["d", 3.0]],
+        [[1.0, 1], [8.0, 2], [2.0, 1], [9.0, 3]],
+    )
+
+    assert ChartView(top=2).apply(key, data) == [
+        ["b", 4.0],
+        ["d", 3.0],
+        [OTHER_LABEL, 1.5],
+    ]
+    assert ChartView(top=2, sort="x").apply(key, data)[:2] == [["b", 4.0], ["d", 3.0]]
+    assert ChartView(top=4).apply(key, data) == data.rows
+    assert ChartView(sort="-y").apply(key, data) == [
+        ["b", 4.0],
+        ["d", 3.0],
+        ["c", 2.0],
+        ["a", 1.0],
+    ]
+
+
+@pytest.mark.parametrize("downsample", ["lttb", "bucket"])
+def test_view_downsample(downsample: str) -> None:
+    """Downsampling orders the points by the numeric or date x-axis."""
+    key = ChartKey.parse("date,sum/forecast")
+    rows: list[list[Any]] = [
+        [f"2024-01-{day:02d}", float(day % 7)] for day in range(31, 0, -1)
+    ]
+    data = ChartData([*rows, ["", 100.0]])
+
+    result = ChartView(points=10, downsample=downsample).apply(key, data)
+
+    assert len(result) == 10
+    assert [row[0] for row in result] == sorted(row[0] for row in result)
+    assert result[0][0] == "2024-01-01"
+    if downsample == "lttb":
+        assert result[-1] == ["2024-01-31", 3.0]
+        assert all(row in rows for row in result)
+    else:
+        assert sum(row[1] for row in result) == sum(row[1] for row in rows)
+
+    with pytest.raises(ValueError):
+        ChartView(points=10).apply(key, ChartData([["x", 1.0], ["2024-01-01", 1.0]]))
+
+
+def test_lttb() -> None:
+    """The peaks of the line are kept."""
+    x = np.arange(1000, dtype=np.float64)
+    y = np.zeros(1000)
+    y[[250, 500, 750]] = [5, -5, 5]
+
+    indices = lttb(x, y, 10)
+
+    assert len(indices) == 10
+    assert {0, 250, 500, 750, 999} <= set(indices.tolist())
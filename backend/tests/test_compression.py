@@ -0,0 +1,105 @@
+import gzip
+from typing import Iterator
+
+import pytest
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from omnidemo.compression import CompressionMiddleware, choose_encoding
+
+BODY = {"data": [[f"sku{i}", i * 1.5] for i in range(200)]}
+
+
+def large(request: Request) -> Response:
+    """Response large enough to be compressed, and cacheable."""
+    return JSONResponse(BODY, headers={"ETag": '"abc"', "Cache-Control": "immutable"})
+
+
+def small(request: Request) -> Response:
+    """Response too small to be worth compressing."""
+    return JSONResponse({"status": "ok"})
+
+
+def stream(request: Request) -> Response:
+    """Streamed response, which is sent as it is."""
+
+    def chunks() -> Iterator[bytes]:
+        yield b"x" * 4096
+        yield b"y" * 4096
+
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+@pytest.fixture
+def client() -> TestClient:
+    """
+    Client of an app with the compression middleware.
+
+    :return: the test client, which sends `Accept-Encoding: gzip`.
+    """
+    app = Starlette(
+        routes=[
+            Route("/large", large),
+            Route("/small", small),
+            Route("/stream", stream),
+        ],
+    )
+    app.add_middleware(CompressionMiddleware, minimum_size=1024, cache_size=2**20)
+    return TestClient(app, headers={"Accept-Encoding": "gzip"})
+
+
+def test_compressed(client: TestClient) -> None:
+    """The large responses are compressed, and their ETag made weak."""
+    response = client.get("/large")
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"abc"'
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json() == BODY
+
+
+def test_not_compressed(client: TestClient) -> None:
+    """The small and streamed responses, or those not accepted, are not."""
+    assert "content-encoding" not in client.get("/small").headers
+    assert "content-encoding" not in client.get("/stream").headers
+    response = client.get("/large", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"abc"'
+
+
+def test_cached(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    """The compressed immutable responses are reused."""
+    calls = []
+    original = gzip.compress
+
+    def compress(data: bytes, **kwargs: int) -> bytes:
+        calls.append(data)
+        return original(data, **kwargs)
+
+    monkeypatch.setattr(gzip, "compress", compress)
+    for _ in range(3):
+        assert client.get("/large").json() == BODY
+    assert len(calls) == 1
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate", "gzip"),
+        ("*", "gzip"),
+        ("gzip;q=0, deflate", None),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_choose_encoding(accept_encoding: str, expected: str | None) -> None:
+    """
+    Gzip is chosen when the client accepts it.
+
+    :param accept_encoding: the `Accept-Encoding` header.
+    :param expected: the chosen encoding, if any.
+    """
+    assert choose_encoding(accept_encoding) == expected
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from omnidemo.db import AsyncSqliteDatabase
+
+
+@pytest.fixture
+async def items(async_db: AsyncSqliteDatabase) -> AsyncSqliteDatabase:
+    """
+    The database, with a scratch table.
+
+    :return: the database.
+    """
+    await async_db.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)")
+    return async_db
+
+
+@pytest.mark.anyio
+async def test_statements(items: AsyncSqliteDatabase) -> None:
+    """Each statement is committed on its own."""
+    row = await items.insert_row("INSERT INTO items (name) VALUES (?)", ("a",))
+    assert row == {"id": 1, "name": "a"}
+    await items.insert_row("INSERT INTO items (name) VALUES (?)", ("b",))
+
+    assert await items.execute("UPDATE items SET name = name || '!'") == 2
+    assert await items.fetch_rows("SELECT name FROM items ORDER BY id") == [
+        {"name": "a!"},
+        {"name": "b!"},
+    ]
+    assert await items.fetch_one("SELECT name FROM items WHERE id = 2") == {
+        "name": "b!",
+    }
+    with pytest.raises(RuntimeError):
+        await items.fetch_one("SELECT name FROM items WHERE id = 3")
+
+
+@pytest.mark.anyio
+async def test_transaction(items: AsyncSqliteDatabase) -> None:
+    """
+    The readers don't see the transaction until it is committed.
+
+    They are not blocked by it either.
+    """
+    async with items.transaction() as tx:
+        await tx.insert_row("INSERT INTO items (name) VALUES (?)", ("a",))
+        assert await tx.fetch_one("SELECT COUNT(*) AS n FROM items") == {"n": 1}
+        assert await items.fetch_one("SELECT COUNT(*) AS n FROM items") == {"n": 0}
+    assert await items.fetch_one("SELECT COUNT(*) AS n FROM items") == {"n": 1}
+
+
+@pytest.mark.anyio
+async def test_rollback(items: AsyncSqliteDatabase) -> None:
+    """An exception within the transaction rolls back all its statements."""
+    with pytest.raises(ValueError):
+        async with items.transaction() as tx:
+            await tx.insert_row("INSERT INTO items (name) VALUES (?)", ("a",))
+            await tx.execute("UPDATE items SET name = 'b'")
+            raise ValueError
+    assert await items.fetch_rows("SELECT * FROM items") == []
+
+    # The writer connection is usable afterwards
+    await items.insert_row("INSERT INTO items (name) VALUES (?)", ("c",))
+    assert await items.fetch_rows("SELECT name FROM items") == [{"name": "c"}]
+
+
+@pytest.mark.anyio
+async def test_concurrent_writes(items: AsyncSqliteDatabase) -> None:
+    """
+    Plain writes issued while a transaction is open wait for it.
+
+    They don't join it, so they are not rolled back with it.
+    """
+    with pytest.raises(ValueError):
+        async with items.transaction() as tx:
+            await tx.insert_row("INSERT INTO items (name) VALUES (?)", ("tx",))
+            writes = [
+                asyncio.ensure_future(
+                    items.insert_row("INSERT INTO items (name) VALUES (?)", (str(i),)),
+                )
+                for i in range(5)
+            ]
+            await asyncio.sleep(0.01)
+            assert not any(w.done() for w in writes)
+            raise ValueError
+    await asyncio.gather(*writes)
+    rows = await items.fetch_rows("SELECT name FROM items ORDER BY id")
+    assert [row["name"] for row in rows] == ["0", "1", "2", "3", "4"]
+
+
+@pytest.mark.anyio
+async def test_cancelled(items: AsyncSqliteDatabase) -> None:
+    """A transaction cancelled at any point doesn't stay open."""
+    for delay in [0, 0.001, 0.01]:
+        transaction = asyncio.ensure_future(insert_slowly(items))
+        await asyncio.sleep(delay)
+        transaction.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await transaction
+        async with items.transaction() as tx:
+            await tx.execute("DELETE FROM items")
+    assert await items.fetch_rows("SELECT * FROM items") == []
+
+
+async def insert_slowly(db: AsyncSqliteDatabase) -> None:
+    """Insert a row in a transaction that stays open for a second."""
+    async with db.transaction() as tx:
+        await tx.insert_row("INSERT INTO items (name) VALUES (?)", ("a",))
+        await asyncio.sleep(1)
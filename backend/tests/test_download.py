@@ -0,0 +1,112 @@
+import gzip
+
+import pytest
+from httpx import AsyncClient
+
+from omnidemo.db import AsyncSqliteDatabase
+
+DATA = b"sku,forecast\n" + b"".join(b"sku%d,%d\n" % (i, i) for i in range(1000))
+
+
+@pytest.fixture
+async def input_id(app_db: AsyncSqliteDatabase) -> str:
+    """
+    An uploaded input file.
+
+    :return: id of the input.
+    """
+    (app_db.storage / "sales~a.csv").write_bytes(DATA)
+    await app_db.execute(
+        """
+        INSERT INTO inputs (id, file_name, stored_name, username, size)
+        VALUES ('a', 'sales.csv', 'sales~a.csv', 'ann', ?)
+        """,
+        (len(DATA),),
+    )
+    return "a"
+
+
+@pytest.mark.anyio
+async def test_download(client: AsyncClient, input_id: str) -> None:
+    """The file is sent whole, and its ranges may be requested."""
+    response = await client.get("/api/inputs/download-file", params={"id": input_id})
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["accept-ranges"] == "bytes"
+    assert 'filename="sales.csv"' in response.headers["content-disposition"]
+
+
+@pytest.mark.anyio
+async def test_range(client: AsyncClient, input_id: str) -> None:
+    """An interrupted download is resumed from where it stopped."""
+    url = "/api/inputs/download-file"
+    first = await client.get(url, params={"id": input_id})
+    etag = first.headers["etag"]
+
+    response = await client.get(
+        url,
+        params={"id": input_id},
+        headers={"Range": "bytes=100-", "If-Range": etag},
+    )
+    assert response.status_code == 206
+    assert response.content == DATA[100:]
+    assert response.headers["content-range"] == f"bytes 100-{len(DATA) - 1}/{len(DATA)}"
+
+    response = await client.get(
+        url,
+        params={"id": input_id},
+        headers={"Range": "bytes=10-19"},
+    )
+    assert response.status_code == 206
+    assert response.content == DATA[10:20]
+
+
+@pytest.mark.anyio
+async def test_range_changed(client: AsyncClient, input_id: str) -> None:
+    """If the file has changed since, the whole file is sent again."""
+    response = await client.get(
+        "/api/inputs/download-file",
+        params={"id": input_id},
+        headers={"Range": "bytes=100-", "If-Range": '"outdated"'},
+    )
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+@pytest.mark.anyio
+async def test_forecast_file(client: AsyncClient, app_db: AsyncSqliteDatabase) -> None:
+    """The output files of the forecasts are downloaded by their name."""
+    (app_db.storage / "forecasts~job.csv").write_bytes(DATA)
+    response = await client.get(
+        "/api/inputs/download-file",
+        params={"id": "forecasts~job.csv"},
+        headers={"Range": "bytes=-5"},
+    )
+    assert response.status_code == 206
+    assert response.content == DATA[-5:]
+
+
+@pytest.mark.anyio
+async def test_codec(client: AsyncClient, app_db: AsyncSqliteDatabase) -> None:
+    """
+    A file is decompressed according to the codec recorded for it.
+
+    One that the user uploaded compressed is sent as it is, whatever its name.
+    """
+    (app_db.storage / "blob.gz").write_bytes(gzip.compress(DATA))
+    (app_db.storage / "sales~b.csv.gz").write_bytes(DATA)
+    await app_db.execute(
+        """
+        INSERT INTO inputs (id, file_name, stored_name, codec, username, size)
+        VALUES ('a', 'sales.csv', 'blob.gz', 'gzip', 'ann', 10),
+            ('b', 'sales.csv.gz', 'sales~b.csv.gz', NULL, 'ann', 10)
+        """,
+    )
+    url = "/api/inputs/download-file"
+    headers = {"Accept-Encoding": "identity"}
+
+    response = await client.get(url, params={"id": "a"}, headers=headers)
+    assert response.content == DATA
+    response = await client.get(url, params={"id": "b"}, headers=headers)
+    assert response.content == DATA
+    assert 'filename="sales.csv.gz"' in response.headers["content-disposition"]
@@ -0,0 +1,260 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncGenerator, Callable
+
+import pytest
+
+from omnidemo.chart_warmup import ChartWarmup
+from omnidemo.db import AnyDict, AsyncSqliteDatabase, SqliteDatabase
+from omnidemo.executor import ForecastExecutor
+from omnidemo.forecast import OWNED_JOB
+from omnidemo.settings import settings
+from omnidemo.singleflight import PROCESS_ID
+
+RunForecast = Callable[[str, int, str], None]
+
+
+@pytest.fixture
+async def executor(
+    async_db: AsyncSqliteDatabase,
+    monkeypatch: pytest.MonkeyPatch,
+) -> AsyncGenerator[ForecastExecutor, None]:
+    """
+    Executor that runs the forecasts in threads rather than processes.
+
+    The tests may then replace `run_forecast`, and the delays are short.
+
+    :yield: the running executor.
+    """
+    monkeypatch.setattr(settings, "forecast_lease_ttl", 0.3)
+    monkeypatch.setattr(settings, "forecast_max_attempts", 2)
+    monkeypatch.setattr(settings, "forecast_retry_delay", 0.01)
+    monkeypatch.setattr(settings, "forecast_poll_interval", 0.05)
+    monkeypatch.setattr(
+        ForecastExecutor,
+        "_create_pool",
+        lambda self: ThreadPoolExecutor(self.max_workers),
+    )
+    monkeypatch.setattr("omnidemo.executor.chart_warmup", ChartWarmup())
+    # As in the app, the waiters also learn about the writes of the executor
+    async_db.changes.start()
+    executor = ForecastExecutor(async_db, 1)
+    executor.start()
+    yield executor
+    await executor.stop()
+    await async_db.changes.stop()
+
+
+def use_forecast(monkeypatch: pytest.MonkeyPatch, run_forecast: RunForecast) -> None:
+    """Run the given function in place of the forecasts."""
+    monkeypatch.setattr("omnidemo.executor.run_forecast", run_forecast)
+
+
+def complete_forecast(job_id: str, forecast_id: int, owner: str) -> None:
+    """Forecast that completes its job right away."""
+    db = SqliteDatabase.connect()
+    try:
+        db.execute(
+            f"UPDATE jobs SET status = 'completed', progress = 1 WHERE {OWNED_JOB}",  # noqa: S608
+            (job_id, owner),
+        )
+    finally:
+        db.close()
+
+
+async def queue_forecast(db: AsyncSqliteDatabase, **job: object) -> str:
+    """Queue a forecast, as `start_forecast` does, and return its job id."""
+    job = {"id": db.generate_uuid(), "status": "queued", **job}
+    await db.execute(
+        f"INSERT INTO jobs ({', '.join(job)}) VALUES ({', '.join('?' * len(job))})",  # noqa: S608
+        tuple(job.values()),
+    )
+    await db.execute(
+        "INSERT INTO forecasts (job_id, status) VALUES (?, 'draft')",
+        (job["id"],),
+    )
+    db.changes.notify()
+    return str(job["id"])
+
+
+async def wait_for_job(db: AsyncSqliteDatabase, job_id: str, *status: str) -> AnyDict:
+    """Wait until the job has one of the given statuses, and return it."""
+
+    async def check() -> AnyDict | None:
+        job = await db.fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return job if job["status"] in status else None
+
+    return await db.changes.wait_for(check, timeout=5)
+
+
+@pytest.mark.anyio
+async def test_claim(
+    executor: ForecastExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """The queued jobs are claimed in order, one at a time per worker."""
+    runs: list[str] = []
+
+    def run_forecast(job_id: str, forecast_id: int, owner: str) -> None:
+        assert owner == PROCESS_ID
+        runs.append(job_id)
+        time.sleep(0.05)
+        complete_forecast(job_id, forecast_id, owner)
+
+    use_forecast(monkeypatch, run_forecast)
+    job_ids = [await queue_forecast(executor.db) for _ in range(3)]
+
+    for job_id in job_ids:
+        job = await wait_for_job(executor.db, job_id, "completed")
+        assert job["attempts"] == 1
+    assert runs == job_ids
+
+
+@pytest.mark.anyio
+async def test_retry(
+    executor: ForecastExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Failed attempts are retried, until there are no attempts left."""
+    runs: list[str] = []
+
+    def run_forecast(job_id: str, forecast_id: int, owner: str) -> None:
+        runs.append(job_id)
+        raise RuntimeError("Worker crashed")
+
+    use_forecast(monkeypatch, run_forecast)
+    job_id = await queue_forecast(executor.db)
+
+    job = await wait_for_job(executor.db, job_id, "failed")
+    assert job["error"] == "RuntimeError: Worker crashed"
+    assert job["attempts"] == settings.forecast_max_attempts
+    assert job["lease_owner"] is None
+    assert runs == [job_id] * settings.forecast_max_attempts
+
+
+@pytest.mark.anyio
+async def test_expired_lease(
+    executor: ForecastExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    The job of a process that has died is queued again once its lease expires.
+
+    The files of the dead attempt are removed.
+    """
+    use_forecast(monkeypatch, complete_forecast)
+    job_id = await queue_forecast(
+        executor.db,
+        status="running",
+        attempts=1,
+        lease_owner="dead",
+        lease_expires_at=time.time() + 0.1,
+    )
+    partial = executor.db.storage / f"forecasts~{job_id}.csv.0123.partial"
+    partial.write_text("sku,forecast\n")
+
+    job = await wait_for_job(executor.db, job_id, "completed")
+    assert job["attempts"] == 2
+    assert not partial.exists()
+
+
+@pytest.mark.anyio
+async def test_cancel(
+    executor: ForecastExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A running job stops at its next progress update once cancelled."""
+    started = threading.Event()
+    stopped = threading.Event()
+
+    def run_forecast(job_id: str, forecast_id: int, owner: str) -> None:
+        db = SqliteDatabase.connect()
+        try:
+            started.set()
+            while db.execute(
+                f"UPDATE jobs SET progress = 0.5 WHERE {OWNED_JOB}",  # noqa: S608
+                (job_id, owner),
+            ):
+                time.sleep(0.01)
+            stopped.set()
+        finally:
+            db.close()
+
+    use_forecast(monkeypatch, run_forecast)
+    job_id = await queue_forecast(executor.db)
+    queued_id = await queue_forecast(executor.db)
+    await wait_for_job(executor.db, job_id, "running")
+
+    # Renewed by the heartbeat while the forecast runs
+    await asyncio.sleep(settings.forecast_lease_ttl)
+    job = await executor.db.fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    assert job["lease_expires_at"] > time.time()
+
+    assert await executor.cancel(queued_id)
+    assert await executor.cancel(job_id)
+    assert not await executor.cancel(job_id)
+    await asyncio.to_thread(stopped.wait, 5)
+    assert started.is_set() and stopped.is_set()
+    job = await executor.db.fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    assert job["status"] == "cancelled"
+    job = await executor.db.fetch_one("SELECT * FROM jobs WHERE id = ?", (queued_id,))
+    assert job["status"] == "cancelled" and job["attempts"] == 0
+
+
+@pytest.mark.anyio
+async def test_database_errors(
+    executor: ForecastExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """The executor keeps claiming the jobs after a failed claim."""
+    claim = executor._claim  # noqa: SLF001
+    failures = 0
+
+    async def failing_claim() -> tuple[str, int] | None:
+        nonlocal failures
+        if failures < 2:
+            failures += 1
+            raise RuntimeError("Failed to execute SQL: database is locked")
+        return await claim()
+
+    monkeypatch.setattr(executor, "_claim", failing_claim)
+    use_forecast(monkeypatch, complete_forecast)
+    job_id = await queue_forecast(executor.db)
+
+    await wait_for_job(executor.db, job_id, "completed")
+    assert failures == 2
+
+
+@pytest.mark.anyio
+async def test_chart_warmup(
+    executor: ForecastExecutor,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """The charts are warmed up for the completed forecasts only."""
+    enqueued: list[int] = []
+    monkeypatch.setattr("omnidemo.executor.chart_warmup.enqueue", enqueued.append)
+
+    def run_forecast(job_id: str, forecast_id: int, owner: str) -> None:
+        if forecast_id == 2:
+            complete_forecast(job_id, forecast_id, owner)
+            return
+        db = SqliteDatabase.connect()
+        try:
+            db.execute(
+                f"UPDATE jobs SET status = 'failed' WHERE {OWNED_JOB}",  # noqa: S608
+                (job_id, owner),
+            )
+        finally:
+            db.close()
+
+    use_forecast(monkeypatch, run_forecast)
+    await wait_for_job(executor.db, await queue_forecast(executor.db), "failed")
+    await wait_for_job(executor.db, await queue_forecast(executor.db), "completed")
+
+    for _ in range(100):
+        if enqueued:
+            break
+        await asyncio.sleep(0.01)
+    assert enqueued == [2]
@@ -0,0 +1,189 @@
+import csv
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from omnidemo.columnar import ColumnarTable, columns_path
+from omnidemo.db import SqliteDatabase
+from omnidemo.forecast import JobProgress, forecast_file, run_forecast
+
+N_ROWS = 100
+
+
+@pytest.fixture
+def source(tmp_path: Path) -> Path:
+    """
+    Input file with blank lines, and rows of the wrong length.
+
+    Some rows are shorter than the header, and others longer.
+
+    :return: path of the file.
+    """
+    path = tmp_path / "input.csv"
+    with path.open("w", newline="") as out:
+        writer = csv.writer(out)
+        writer.writerow(["sku", "forecast", "region"])
+        for i in range(N_ROWS):
+            if i % 10 == 0:
+                writer.writerow([])
+            if i % 7 == 0:
+                writer.writerow([f"sku{i}", i])
+            else:
+                writer.writerow([f"sku{i}", i, "eu", "extra"])
+    return path
+
+
+def test_forecast_file(source: Path, tmp_path: Path) -> None:
+    """
+    The progress is reported after each batch.
+
+    The output is the same as if the file was processed at once.
+    """
+    target = tmp_path / "output.csv"
+    progress = list(forecast_file(source, target, 2, batch_size=8))
+
+    assert len(progress) == -(-N_ROWS // 8)
+    assert progress == sorted(progress)
+    assert progress[-1] == 1
+
+    with target.open(newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == ["sku", "region", "forecast"]
+    assert rows[1:] == [
+        [f"sku{i}", "" if i % 7 == 0 else "eu", str(2.0 * i)] for i in range(N_ROWS)
+    ]
+
+    table = ColumnarTable.open(target)
+    assert table is not None and table.n_rows == N_ROWS
+    values = table.column("forecast").values
+    assert values is not None and values.tolist() == [2.0 * i for i in range(N_ROWS)]
+
+
+def test_stopped(source: Path, tmp_path: Path) -> None:
+    """The pipeline can be stopped between two batches, e.g. when cancelled."""
+    target = tmp_path / "output.csv"
+    pipeline = forecast_file(source, target, 2, batch_size=8)
+    next(pipeline)
+    pipeline.close()
+    with target.open(newline="") as file:
+        assert len(list(csv.reader(file))) == 1 + 8
+    assert not columns_path(target).exists()
+
+
+@pytest.mark.parametrize(
+    "content, error",
+    [
+        ("", "The input file is empty"),
+        ("sku,region\nsku0,eu\n", "The input file has no `forecast` column"),
+        ("sku,forecast\nsku0,lots\n", "could not convert string to float"),
+    ],
+)
+def test_invalid(tmp_path: Path, content: str, error: str) -> None:
+    """Errors in the input data are raised as `ValueError`."""
+    source = tmp_path / "input.csv"
+    source.write_text(content)
+    with pytest.raises(ValueError, match=error):
+        list(forecast_file(source, tmp_path / "output.csv", 2))
+
+
+@pytest.fixture
+def db(db_path: Path, monkeypatch: pytest.MonkeyPatch) -> SqliteDatabase:
+    """
+    Database with an input file, and a forecast whose job "worker" claimed.
+
+    The milestones of the forecast don't pretend to work hard.
+
+    :return: the database.
+    """
+    db = SqliteDatabase.connect()
+    (db.storage / "input.csv").write_text("sku,forecast\nsku0,1.5\nsku1,2\n")
+    db.execute(
+        """
+        INSERT INTO inputs (id, file_name, stored_name, username, size)
+        VALUES ('input', 'input.csv', 'input.csv', 'ann', 0)
+        """,
+    )
+    db.execute("INSERT INTO forecasts (id, status) VALUES (1, 'draft')")
+    db.execute(
+        """
+        INSERT INTO jobs (id, status, lease_owner)
+        VALUES ('job', 'running', 'worker')
+        """,
+    )
+    monkeypatch.setattr(
+        JobProgress,
+        "milestone",
+        lambda self, p: self.update(p, force=True),
+    )
+    return db
+
+
+def on_milestone(
+    monkeypatch: pytest.MonkeyPatch,
+    progress: float,
+    action: Callable[[], object],
+) -> None:
+    """Run `action` just before the given milestone of the forecast."""
+    milestone = JobProgress.milestone
+
+    def patched(self: JobProgress, p: float) -> None:
+        if p == progress:
+            action()
+        milestone(self, p)
+
+    monkeypatch.setattr(JobProgress, "milestone", patched)
+
+
+def storage_files(db: SqliteDatabase) -> list[str]:
+    """Names of the files in the storage, sorted."""
+    return sorted(path.name for path in db.storage.iterdir())
+
+
+def test_run_forecast(db: SqliteDatabase) -> None:
+    """The forecast is written, and its job completed and released."""
+    run_forecast("job", 1, "worker")
+
+    job = db.fetch_one("SELECT * FROM jobs WHERE id = 'job'")
+    assert job["status"] == "completed" and job["progress"] == 1
+    assert job["lease_owner"] is None
+    forecast = db.fetch_one("SELECT * FROM forecasts WHERE id = 1")
+    target = db.storage / forecast["file_id"]
+    assert storage_files(db) == sorted(
+        ["input.csv", target.name, columns_path(target).name],
+    )
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        "UPDATE jobs SET status = 'cancelled'",
+        # The lease expired, and the job was claimed by another worker
+        "UPDATE jobs SET lease_owner = 'other'",
+    ],
+)
+def test_cancelled(
+    db: SqliteDatabase,
+    monkeypatch: pytest.MonkeyPatch,
+    update: str,
+) -> None:
+    """A forecast whose job is no longer its own stops, and leaves no output."""
+    on_milestone(monkeypatch, 0.9, lambda: db.execute(update))
+    run_forecast("job", 1, "worker")
+
+    forecast = db.fetch_one("SELECT * FROM forecasts WHERE id = 1")
+    assert forecast["file_id"] is None
+    job = db.fetch_one("SELECT * FROM jobs WHERE id = 'job'")
+    assert job["status"] != "completed"
+    assert storage_files(db) == ["input.csv"]
+
+
+def test_invalid_input(db: SqliteDatabase) -> None:
+    """Errors in the input data fail the job right away."""
+    (db.storage / "input.csv").write_text("sku,region\nsku0,eu\n")
+    run_forecast("job", 1, "worker")
+
+    job = db.fetch_one("SELECT * FROM jobs WHERE id = 'job'")
+    assert job["status"] == "failed"
+    assert job["error"] == "The input file has no `forecast` column"
+    assert storage_files(db) == ["input.csv"]
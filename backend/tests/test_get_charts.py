@@ -0,0 +1,78 @@
+import json
+import struct
+
+import pytest
+from httpx import AsyncClient
+
+from omnidemo.chart_cache import ChartCache
+from omnidemo.chart_formats import BINARY_TYPE
+from omnidemo.db import AsyncSqliteDatabase
+
+KEYS = ["sku,sum/forecast", "region,sum/forecast"]
+
+
+@pytest.fixture(autouse=True)
+def chart_cache(monkeypatch: pytest.MonkeyPatch) -> ChartCache:
+    """
+    An empty chart cache for `get_charts`.
+
+    :return: the cache.
+    """
+    cache = ChartCache(1_000_000)
+    monkeypatch.setattr("omnidemo.api.forecasts.get_charts.chart_cache", cache)
+    return cache
+
+
+async def get_charts(client: AsyncClient, **params: str) -> bytes:
+    """Body of `get-charts` with the `KEYS` of forecast 1."""
+    response = await client.get(
+        "/api/forecasts/get-charts",
+        params={"forecast_id": 1, "chart_key": KEYS, **params},
+    )
+    assert response.status_code == 200
+    return response.content
+
+
+@pytest.mark.anyio
+async def test_formats(client: AsyncClient, forecast_db: AsyncSqliteDatabase) -> None:
+    """The charts come in the order requested, in any format of `get-chart`."""
+    charts = json.loads(await get_charts(client))["charts"]
+    assert [chart["chart_key"] for chart in charts] == KEYS
+    assert charts[0]["data"] == [["sku0", 2.0], ["sku1", 2.0]]
+
+    charts = json.loads(await get_charts(client, format="columns"))["charts"]
+    assert charts[1]["data"]["columns"][0] == {
+        "name": "region",
+        "dictionary": ["eu", "us"],
+        "codes": [0, 1],
+    }
+
+    batch = await get_charts(client, format="binary")
+    (count,) = struct.unpack_from("<I", batch)
+    assert count == 2  # the header of the batch ends at 12, aligned to 16
+    (length,) = struct.unpack_from("<I", batch, 16)
+    assert json.loads(batch[20 : 20 + length])["chart"]["chart_key"] == KEYS[0]
+
+    # The format may be negotiated as well
+    response = await client.get(
+        "/api/forecasts/get-charts",
+        params={"forecast_id": 1, "chart_key": KEYS},
+        headers={"Accept": BINARY_TYPE},
+    )
+    assert response.content == batch
+    assert response.headers["content-type"] == BINARY_TYPE
+
+
+@pytest.mark.anyio
+async def test_repeated_keys(
+    client: AsyncClient,
+    forecast_db: AsyncSqliteDatabase,
+) -> None:
+    """A repeated chart key is sent once per request of it."""
+    keys = [KEYS[0], KEYS[1], KEYS[0]]
+    response = await client.get(
+        "/api/forecasts/get-charts",
+        params={"forecast_id": 1, "chart_key": keys},
+    )
+    charts = response.json()["charts"]
+    assert [chart["chart_key"] for chart in charts] == keys
@@ -0,0 +1,137 @@
+import pytest
+from httpx import AsyncClient
+
+from omnidemo.chart_cache import ChartCache
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.http_cache import IMMUTABLE, REVALIDATE, tables_etag
+
+
+async def revalidate(client: AsyncClient, url: str, **params: object) -> str:
+    """
+    Get the response, and check that it is not sent again while current.
+
+    :return: the ETag of the response.
+    """
+    response = await client.get(url, params=params)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    response = await client.get(url, params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert not response.content
+    return etag
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    ("url", "params", "write"),
+    [
+        (
+            "/api/forecasts/get-latest-forecast",
+            {},
+            "INSERT INTO forecasts (status) VALUES ('draft')",
+        ),
+        (
+            "/api/inputs/list-inputs",
+            {},
+            """
+            INSERT INTO inputs (id, file_name, stored_name, username, size)
+            VALUES ('a', 'sales.csv', 'sales~a.csv', 'ann', 10)
+            """,
+        ),
+        (
+            "/api/insights/list-insights",
+            {"limit": 10},
+            "INSERT INTO insights (message, username) VALUES ('hi', 'ann')",
+        ),
+        (
+            "/api/forecasts/get-user-charts",
+            {"username": "ann"},
+            """
+            INSERT INTO user_charts (username, chart_key)
+            VALUES ('ann', 'sku,sum/forecast')
+            """,
+        ),
+    ],
+)
+async def test_revalidate(
+    client: AsyncClient,
+    app_db: AsyncSqliteDatabase,
+    url: str,
+    params: dict[str, object],
+    write: str,
+) -> None:
+    """
+    The read endpoints answer 304 while their tables don't change.
+
+    A write to the table gives the response a new ETag.
+
+    :param url: the endpoint.
+    :param params: parameters of the request.
+    :param write: SQL that changes the response.
+    """
+    etag = await revalidate(client, url, **params)
+    response = await client.get(url, params=params)
+    assert response.headers["cache-control"] == REVALIDATE
+
+    await app_db.execute(write)
+    response = await client.get(url, params=params, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert await revalidate(client, url, **params) == response.headers["etag"]
+
+
+@pytest.mark.anyio
+async def test_job(client: AsyncClient, app_db: AsyncSqliteDatabase) -> None:
+    """The ETag of a job changes with its progress."""
+    await app_db.execute("INSERT INTO jobs (id, status) VALUES ('a', 'running')")
+    etag = await revalidate(client, "/api/jobs/get-job", id="a")
+
+    await app_db.execute("UPDATE jobs SET progress = 0.5 WHERE id = 'a'")
+    assert await revalidate(client, "/api/jobs/get-job", id="a") != etag
+
+
+@pytest.mark.anyio
+async def test_chart(
+    client: AsyncClient,
+    forecast_db: AsyncSqliteDatabase,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A chart has a strong ETag, and may be kept for good."""
+    monkeypatch.setattr(
+        "omnidemo.api.forecasts.get_chart.chart_cache",
+        ChartCache(1_000_000),
+    )
+    url = "/api/forecasts/get-chart"
+    params = {"forecast_id": 1, "chart_key": "sku,sum/forecast"}
+    etag = await revalidate(client, url, **params)
+    assert not etag.startswith("W/")
+    response = await client.get(url, params=params)
+    assert response.headers["cache-control"] == IMMUTABLE
+
+
+@pytest.mark.anyio
+async def test_tables_etag(async_db: AsyncSqliteDatabase) -> None:
+    """
+    The ETag changes with the arguments, and with every write to its tables.
+
+    The versions of the tables are incremented by the triggers.
+    """
+    etag = await tables_etag(async_db, ["inputs", "insights"], 10)
+    assert await tables_etag(async_db, ["insights", "inputs"], 10) == etag
+    assert await tables_etag(async_db, ["inputs", "insights"], 20) != etag
+
+    await async_db.execute(
+        "INSERT INTO user_charts (username, chart_key) VALUES ('ann', 'a,b')",
+    )
+    assert await tables_etag(async_db, ["inputs", "insights"], 10) == etag
+
+    for write in [
+        "INSERT INTO insights (message, username) VALUES ('hi', 'ann')",
+        "UPDATE insights SET message = 'hello'",
+        "DELETE FROM insights",
+    ]:
+        await async_db.execute(write)
+        new_etag = await tables_etag(async_db, ["inputs", "insights"], 10)
+        assert new_etag != etag
+        etag = new_etag
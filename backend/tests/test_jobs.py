@@ -0,0 +1,157 @@
+import asyncio
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+from httpx import AsyncClient
+
+from omnidemo.db import AnyDict, AsyncSqliteDatabase
+from omnidemo.jobs import JobHub, JobRegistry, job_hub, update_job
+from omnidemo.settings import settings
+
+
+async def insert_job(db: AsyncSqliteDatabase, job_id: str) -> AnyDict:
+    """Insert a running job, and return its row."""
+    await db.execute(
+        "INSERT INTO jobs (id, status, progress) VALUES (?, 'running', 0)",
+        (job_id,),
+    )
+    return await db.fetch_one("SELECT * FROM jobs WHERE id = ?", (job_id,))
+
+
+@pytest.mark.anyio
+async def test_latest_state() -> None:
+    """A subscriber that falls behind only gets the latest state of the job."""
+    hub = JobHub()
+    subscription = hub.subscribe("a")
+    for progress in [0.1, 0.2, 0.3]:
+        hub.publish({"id": "a", "progress": progress})
+    hub.publish({"id": "b", "progress": 0.5})
+
+    assert await subscription.get(timeout=1) == {"id": "a", "progress": 0.3}
+    assert await subscription.get(timeout=0.01) is None
+
+
+@pytest.mark.anyio
+async def test_unsubscribe() -> None:
+    """A closed subscription gets no more updates, and the others still do."""
+    hub = JobHub()
+    first = hub.subscribe("a")
+    second = hub.subscribe("a")
+    first.close()
+    assert hub.job_ids == ["a"]
+    hub.publish({"id": "a", "progress": 0.1})
+    assert await second.get(timeout=1) == {"id": "a", "progress": 0.1}
+    assert await first.get(timeout=0.01) is None
+    second.close()
+    assert hub.job_ids == []
+
+
+@pytest.mark.anyio
+async def test_batched_progress(
+    async_db: AsyncSqliteDatabase,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """
+    The progress is published right away, but written once it moved enough.
+
+    The final state is written through.
+    """
+    monkeypatch.setattr(settings, "job_flush_delta", 0.5)
+    registry = JobRegistry(JobHub())
+    subscription = registry.hub.subscribe("a")
+    registry.add(await insert_job(async_db, "a"))
+
+    async def stored_progress() -> float:
+        row = await async_db.fetch_one("SELECT * FROM jobs WHERE id = 'a'")
+        return row["progress"]
+
+    await registry.update(async_db, "a", progress=0.2)
+    assert (await subscription.get(timeout=1) or {})["progress"] == 0.2
+    assert await stored_progress() == 0
+    await registry.update(async_db, "a", progress=0.6)
+    assert await stored_progress() == 0.6
+    await registry.update(async_db, "a", progress=0.7)
+    await registry.flush(async_db)
+    assert await stored_progress() == 0.7
+
+    job = await registry.update(async_db, "a", status="failed", error="bad file")
+    assert job["status"] == "failed" and job["progress"] == 0.7
+    assert registry.get("a") is None
+    assert await subscription.get(timeout=1) == job
+
+
+@pytest.mark.anyio
+async def test_watch(async_db: AsyncSqliteDatabase, db_path: Path) -> None:
+    """The updates made by other processes reach the subscribers."""
+    registry = JobRegistry(JobHub())
+    await insert_job(async_db, "a")
+    subscription = registry.hub.subscribe("a")
+    async_db.changes.start()
+    registry.start(async_db)
+    try:
+        await asyncio.sleep(0.01)
+        conn = sqlite3.connect(db_path)
+        conn.execute("UPDATE jobs SET progress = 0.5 WHERE id = 'a'")
+        conn.commit()
+        conn.close()
+        job = await subscription.get(timeout=2)
+        assert job is not None and job["progress"] == 0.5
+    finally:
+        await registry.stop()
+        await async_db.changes.stop()
+
+
+@pytest.mark.anyio
+async def test_flush_errors(
+    async_db: AsyncSqliteDatabase,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """The periodic flush goes on after a failed one."""
+    monkeypatch.setattr(settings, "job_flush_interval", 0.01)
+    registry = JobRegistry(JobHub())
+    flushes = 0
+
+    async def flush(db: AsyncSqliteDatabase) -> None:
+        nonlocal flushes
+        flushes += 1
+        if flushes == 1:
+            raise RuntimeError("Failed to execute SQL: database is locked")
+
+    monkeypatch.setattr(registry, "flush", flush)
+    registry.start(async_db)
+    try:
+        await asyncio.sleep(0.1)
+        assert flushes > 1
+    finally:
+        await registry.stop()
+
+
+@pytest.mark.anyio
+async def test_stream(client: AsyncClient, app_db: AsyncSqliteDatabase) -> None:
+    """
+    The stream sends the job, then every change of it.
+
+    It ends once the job is finished.
+    """
+    await insert_job(app_db, "a")
+    request = asyncio.create_task(
+        client.get("/api/jobs/stream", params={"id": "a"}),
+    )
+    while "a" not in job_hub.job_ids:
+        await asyncio.sleep(0.01)
+    await update_job(app_db, "a", progress=0.5)
+    await update_job(app_db, "a", status="completed")
+
+    response = await request
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        json.loads(line.removeprefix("data: "))["job"]
+        for line in response.text.splitlines()
+        if line.startswith("data: ")
+    ]
+    # A subscriber that falls behind may skip to the latest state
+    assert [job["status"] for job in events[:-1]] == ["running"] * (len(events) - 1)
+    assert (events[-1]["status"], events[-1]["progress"]) == ("completed", 0.5)
+    assert job_hub.job_ids == []
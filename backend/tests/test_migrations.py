@@ -0,0 +1,241 @@
+import sqlite3
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from omnidemo.db import SqliteDatabase
+from omnidemo.migrations import MIGRATIONS
+from omnidemo.settings import settings
+
+
+@pytest.fixture
+def db(db_path: Path) -> Iterator[SqliteDatabase]:
+    """
+    Fresh database with all the migrations applied.
+
+    :yield: the database.
+    """
+    db = SqliteDatabase.connect()
+    yield db
+    db.close()
+
+
+def user_version(conn: sqlite3.Connection) -> int:
+    """Version of the schema of the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def query_plan(db: SqliteDatabase, sql: str, params: tuple[object, ...]) -> str:
+    """Plan of the query, one step per line."""
+    rows = db.conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return "\n".join(row["detail"] for row in rows)
+
+
+def test_new_database(db: SqliteDatabase) -> None:
+    """Checks that a new database gets all the migrations."""
+    assert user_version(db.conn) == len(MIGRATIONS)
+    columns = [row[1] for row in db.conn.execute("PRAGMA table_info(jobs)")]
+    assert "lease_owner" in columns
+
+
+def test_existing_database(db_path: Path) -> None:
+    """Checks that a database created before the migrations is upgraded."""
+    conn = sqlite3.connect(db_path)
+    conn.executescript(settings.sqlite_sql.read_text())
+    conn.execute("INSERT INTO forecasts (status) VALUES ('draft')")
+    conn.executemany(
+        """
+        INSERT INTO inputs (id, file_name, stored_name, username, size, created_at)
+        VALUES (?, 'sales.csv', ?, 'ann', 10, '2024-01-01 00:00:00')
+        """,
+        [("zzz", "sales~zzz.csv"), ("aaa", "sales~aaa.csv")],
+    )
+    conn.executemany(
+        "INSERT INTO charts (forecast_id, chart_key, data) VALUES (1, ?, ?)",
+        [("sku,sum/forecast", "[1]"), ("sku,sum/forecast", "[2]")],
+    )
+    conn.commit()
+    conn.close()
+
+    db = SqliteDatabase.connect()
+    try:
+        assert user_version(db.conn) == len(MIGRATIONS)
+        rows = db.fetch_rows("SELECT data FROM charts")
+        assert rows == [{"data": "[1]"}]
+        # The inputs are numbered in the order of their upload
+        rows = db.fetch_rows("SELECT seq, id FROM inputs ORDER BY seq")
+        assert rows == [{"seq": 1, "id": "zzz"}, {"seq": 2, "id": "aaa"}]
+        with pytest.raises(RuntimeError):
+            db.execute(
+                "INSERT INTO charts (forecast_id, chart_key) VALUES (1, ?)",
+                ("sku,sum/forecast",),
+            )
+    finally:
+        db.close()
+
+    # Connecting again does not re-apply anything
+    db = SqliteDatabase.connect()
+    assert user_version(db.conn) == len(MIGRATIONS)
+    db.close()
+
+
+@pytest.mark.parametrize(
+    ("sql", "params", "index"),
+    [
+        (
+            """
+            SELECT * FROM charts WHERE chart_key = ? AND forecast_id = ?
+            """,
+            ("sku,sum/forecast", 1),
+            "charts_forecast_id_chart_key",
+        ),
+        (
+            "SELECT * FROM user_charts WHERE username = ?",
+            ("bob",),
+            "user_charts_username",
+        ),
+        (
+            "SELECT * FROM forecasts ORDER BY created_at DESC LIMIT 1",
+            (),
+            "forecasts_created_at",
+        ),
+        (
+            """
+            SELECT jobs.id, forecasts.id AS forecast_id
+            FROM jobs JOIN forecasts ON forecasts.job_id = jobs.id
+            WHERE jobs.status = 'queued' ORDER BY jobs.rowid LIMIT 1
+            """,
+            (),
+            "forecasts_job_id",
+        ),
+    ],
+)
+def test_query_uses_index(
+    db: SqliteDatabase,
+    sql: str,
+    params: tuple[object, ...],
+    index: str,
+) -> None:
+    """
+    Checks that the hot queries use the indexes.
+
+    They may scan an index in order, but never a whole table.
+
+    :param sql: the query.
+    :param params: parameters of the query.
+    :param index: name of the index that the query should use.
+    """
+    plan = query_plan(db, sql, params)
+    assert f"INDEX {index}" in plan
+    assert "TEMP B-TREE" not in plan
+    # An ordered scan through an index is fine, a scan of the table is not
+    for line in plan.splitlines():
+        assert not line.startswith("SCAN") or "USING" in line
+
+
+def test_inputs_schema(db: SqliteDatabase) -> None:
+    """
+    Checks that the rebuilt `inputs` table has its triggers back.
+
+    The list and lookup queries don't need the dropped indexes.
+    """
+    rows = db.fetch_rows(
+        """
+        SELECT type, name FROM sqlite_master
+        WHERE tbl_name = 'inputs' AND type IN ('index', 'trigger')
+        ORDER BY type, name
+        """,
+    )
+    assert [(row["type"], row["name"]) for row in rows] == [
+        ("index", "sqlite_autoindex_inputs_1"),
+        ("trigger", "inputs_delete_blob"),
+        ("trigger", "inputs_delete_version"),
+        ("trigger", "inputs_insert_blob"),
+        ("trigger", "inputs_insert_version"),
+        ("trigger", "inputs_update_version"),
+    ]
+    plan = query_plan(db, "SELECT * FROM inputs WHERE id = ?", ("a",))
+    assert "INDEX sqlite_autoindex_inputs_1 (id=?)" in plan
+    plan = query_plan(
+        db,
+        "SELECT * FROM inputs WHERE seq < ? ORDER BY seq DESC LIMIT ?",
+        (5, 10),
+    )
+    assert plan.startswith("SEARCH inputs USING INTEGER PRIMARY KEY")
+    assert "TEMP B-TREE" not in plan
+
+
+def test_table_versions(db: SqliteDatabase) -> None:
+    """Checks that every change of a table increments its version."""
+
+    def version(table: str) -> int:
+        row = db.fetch_one(
+            "SELECT version FROM table_versions WHERE name = ?",
+            (table,),
+        )
+        return row["version"]
+
+    before = version("insights")
+    db.execute("INSERT INTO insights (message, username) VALUES ('hi', 'bob')")
+    db.execute("UPDATE insights SET message = 'hello'")
+    db.execute("DELETE FROM insights")
+    assert version("insights") == before + 3
+
+    # New charts don't count, since they don't make the cached ones stale
+    before = version("charts")
+    db.execute("INSERT INTO charts (forecast_id, chart_key, data) VALUES (1, 'k', '')")
+    assert version("charts") == before
+    db.execute("UPDATE charts SET data = '[]'")
+    db.execute("DELETE FROM charts")
+    assert version("charts") == before + 2
+
+
+def test_blob_refcount(db: SqliteDatabase) -> None:
+    """Checks that the blobs count the inputs that point to them."""
+    db.execute("INSERT INTO blobs (sha256, size) VALUES ('abc', 10)")
+    for id in ["a", "b"]:
+        db.execute(
+            """
+            INSERT INTO inputs (id, file_name, stored_name, username, size, sha256)
+            VALUES (?, 'in.csv', 'blobs/ab/abc', 'bob', 10, 'abc')
+            """,
+            (id,),
+        )
+    db.execute("DELETE FROM inputs WHERE id = 'a'")
+    assert db.fetch_one("SELECT refcount FROM blobs")["refcount"] == 1
+
+
+def test_storage_codecs(db_path: Path) -> None:
+    """
+    Checks that the codecs of the stored files are told by their names.
+
+    Only the names that we chose count, not those of the users.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.executescript(settings.sqlite_sql.read_text())
+    for migration in MIGRATIONS[:-1]:
+        migration(conn)
+    conn.execute(f"PRAGMA user_version = {len(MIGRATIONS) - 1}")
+    conn.executemany(
+        """
+        INSERT INTO inputs (id, file_name, stored_name, username, size, sha256)
+        VALUES (?, 'sales.csv.gz', ?, 'ann', 10, ?)
+        """,
+        [("a", "blobs/ab/abc.gz", "abc"), ("b", "sales~b.csv.gz", None)],
+    )
+    conn.executemany(
+        "INSERT INTO forecasts (file_id, status) VALUES (?, 'draft')",
+        [("forecasts~a.csv.xz",), ("forecasts~b.csv",)],
+    )
+    conn.commit()
+    conn.close()
+
+    db = SqliteDatabase.connect()
+    try:
+        rows = db.fetch_rows("SELECT id, codec FROM inputs ORDER BY id")
+        assert rows == [{"id": "a", "codec": "gzip"}, {"id": "b", "codec": None}]
+        rows = db.fetch_rows("SELECT codec FROM forecasts ORDER BY id")
+        assert rows == [{"codec": "lzma"}, {"codec": None}]
+    finally:
+        db.close()
@@ -0,0 +1,73 @@
+import asyncio
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from omnidemo.notify import ChangeNotifier, wait_event
+
+
+@pytest.mark.anyio
+async def test_wait_for(tmp_path: Path) -> None:
+    """The check is re-run after each notification, until it returns a value."""
+    notifier = ChangeNotifier(tmp_path / "omnidemo.db", interval=60)
+    values: list[int | None] = [None, None, 3]
+    checks = 0
+
+    async def check() -> int | None:
+        nonlocal checks
+        checks += 1
+        return values[checks - 1]
+
+    waiter = asyncio.ensure_future(notifier.wait_for(check, timeout=5))
+    for check_count in range(1, 3):
+        while checks < check_count:
+            await asyncio.sleep(0)
+        notifier.notify()
+    assert await waiter == 3
+    assert checks == 3
+
+
+@pytest.mark.anyio
+async def test_wait_for_timeout(tmp_path: Path) -> None:
+    """The timeout is raised as `asyncio.TimeoutError`, as on Python 3.10."""
+    notifier = ChangeNotifier(tmp_path / "omnidemo.db", interval=60)
+
+    async def check() -> None:
+        return None
+
+    with pytest.raises(asyncio.TimeoutError):
+        await notifier.wait_for(check, timeout=0.05)
+
+
+@pytest.mark.anyio
+async def test_watch(tmp_path: Path) -> None:
+    """The commits of other connections are announced."""
+    path = tmp_path / "omnidemo.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+
+    notifier = ChangeNotifier(path, interval=0.01)
+    notifier.start()
+    try:
+        await asyncio.sleep(0.05)
+        change = notifier.next_change()
+        conn.execute("INSERT INTO t VALUES (1)")
+        conn.commit()
+        await asyncio.wait_for(change.wait(), 1)
+    finally:
+        await notifier.stop()
+        conn.close()
+
+
+@pytest.mark.anyio
+async def test_wait_event_cancelled() -> None:
+    """A cancellation that arrives as the event is set is not lost."""
+    event = asyncio.Event()
+    waiter = asyncio.ensure_future(wait_event(event, 5))
+    await asyncio.sleep(0)
+    event.set()
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
@@ -0,0 +1,66 @@
+import pytest
+from httpx import AsyncClient
+
+from omnidemo.db import AsyncSqliteDatabase
+
+
+async def upload(db: AsyncSqliteDatabase, id: str) -> None:
+    """Insert an input, uploaded within the same second as all the others."""
+    await db.execute(
+        """
+        INSERT INTO inputs (id, file_name, stored_name, username, size, created_at)
+        VALUES (?, 'sales.csv', ?, 'ann', 10, '2024-01-01 00:00:00')
+        """,
+        (id, f"sales~{id}.csv"),
+    )
+
+
+async def list_ids(
+    client: AsyncClient,
+    **params: str | int | None,
+) -> tuple[list[str], str | None]:
+    """Ids of a page of the inputs, and the cursor of the next page."""
+    response = await client.get("/api/inputs/list-inputs", params=params)
+    assert response.status_code == 200
+    body = response.json()
+    return [row["id"] for row in body["inputs"]], body["next_cursor"]
+
+
+@pytest.mark.anyio
+async def test_since(client: AsyncClient, app_db: AsyncSqliteDatabase) -> None:
+    """The uploads made within the same second are not skipped."""
+    await upload(app_db, "zzz")
+    (row,) = (await client.get("/api/inputs/list-inputs")).json()["inputs"]
+    await upload(app_db, "aaa")
+    await upload(app_db, "mmm")
+
+    assert await list_ids(client, since=row["seq"]) == (["aaa", "mmm"], None)
+
+
+@pytest.mark.anyio
+async def test_pages(client: AsyncClient, app_db: AsyncSqliteDatabase) -> None:
+    """The pages come newest first, and the cursors connect them."""
+    for id in ["zzz", "aaa", "mmm", "bbb", "yyy"]:
+        await upload(app_db, id)
+
+    ids, cursor = await list_ids(client, limit=2)
+    assert ids == ["yyy", "bbb"]
+    ids, cursor = await list_ids(client, limit=2, after=cursor)
+    assert ids == ["mmm", "aaa"]
+    ids, cursor = await list_ids(client, limit=2, after=cursor)
+    assert ids == ["zzz"] and cursor is None
+
+    # A deleted row doesn't give its number to the next one
+    await app_db.execute("DELETE FROM inputs WHERE id = 'yyy'")
+    await upload(app_db, "ccc")
+    assert await list_ids(client, since=5) == (["ccc"], None)
+
+
+@pytest.mark.anyio
+async def test_invalid_cursor(client: AsyncClient, app_db: AsyncSqliteDatabase) -> None:
+    """A cursor that is not a sequence number, like the old ones, is rejected."""
+    response = await client.get(
+        "/api/insights/list-insights",
+        params={"since": "2024-01-01 00:00:00/1"},
+    )
+    assert response.status_code == 400
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.singleflight import SingleFlight, SqliteLease
+
+
+@pytest.mark.anyio
+async def test_coalesced() -> None:
+    """Concurrent calls with the same key share a single execution."""
+    flights: SingleFlight[str, str] = SingleFlight()
+    calls: list[str] = []
+    release = asyncio.Event()
+
+    async def compute(key: str) -> str:
+        calls.append(key)
+        await release.wait()
+        return f"{key}{len(calls)}"
+
+    tasks = [
+        asyncio.ensure_future(flights.run(key, lambda key=key: compute(key)))
+        for key in ["a", "a", "b", "a"]
+    ]
+    await asyncio.sleep(0.01)
+    assert "a" in flights
+    release.set()
+
+    assert await asyncio.gather(*tasks) == ["a2", "a2", "b2", "a2"]
+    assert sorted(calls) == ["a", "b"]
+    assert "a" not in flights
+
+    # Once done, the next call computes anew
+    assert await flights.run("a", lambda: compute("a")) == "a3"
+
+
+@pytest.mark.anyio
+async def test_leader_cancelled() -> None:
+    """The computation goes on for the followers when the leader is cancelled."""
+    flights: SingleFlight[str, str] = SingleFlight()
+    release = asyncio.Event()
+
+    async def compute() -> str:
+        await release.wait()
+        return "done"
+
+    leader = asyncio.ensure_future(flights.run("a", compute))
+    follower = asyncio.ensure_future(flights.run("a", compute))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await follower == "done"
+    assert leader.cancelled()
+
+
+@pytest.mark.anyio
+async def test_error() -> None:
+    """All callers get the error of the shared computation."""
+    flights: SingleFlight[str, str] = SingleFlight()
+
+    async def compute() -> str:
+        await asyncio.sleep(0)
+        raise ValueError("bad chart")
+
+    results = await asyncio.gather(
+        flights.run("a", compute),
+        flights.run("a", compute),
+        return_exceptions=True,
+    )
+    assert [str(e) for e in results] == ["bad chart", "bad chart"]
+    assert "a" not in flights
+
+
+@pytest.mark.anyio
+async def test_lease(async_db: AsyncSqliteDatabase) -> None:
+    """Only one holder at a time, until the lease is released or expires."""
+    lease = SqliteLease(async_db, "chart:1:sku,sum/forecast", ttl=60)
+    other = SqliteLease(async_db, "chart:1:sku,sum/forecast", ttl=60)
+    unrelated = SqliteLease(async_db, "chart:2:sku,sum/forecast", ttl=60)
+
+    assert await lease.acquire()
+    assert not await other.acquire()
+    assert await unrelated.acquire()
+
+    await lease.release()
+    assert await other.acquire()
+
+    # A lease whose holder has died is taken over once it expires
+    await async_db.execute("UPDATE leases SET expires_at = 0, owner = 'dead'")
+    assert await lease.acquire()
@@ -0,0 +1,119 @@
+import pytest
+from httpx import AsyncClient
+
+from omnidemo.chart_warmup import ChartWarmup
+from omnidemo.db import AnyDict, AsyncSqliteDatabase
+from omnidemo.forecast import forecast_memo_key
+
+
+@pytest.fixture
+async def db(
+    app_db: AsyncSqliteDatabase,
+    monkeypatch: pytest.MonkeyPatch,
+) -> AsyncSqliteDatabase:
+    """
+    Database with an uploaded input file.
+
+    :return: the database.
+    """
+    monkeypatch.setattr(
+        "omnidemo.api.forecasts.start_forecast.chart_warmup",
+        ChartWarmup(),
+    )
+    await app_db.execute(
+        """
+        INSERT INTO inputs (id, file_name, stored_name, username, size, sha256)
+        VALUES ('a', 'sales.csv', 'sales~a.csv', 'ann', 10, 'abc')
+        """,
+    )
+    return app_db
+
+
+async def start_forecast(client: AsyncClient, force: bool = False) -> AnyDict:
+    """Start a forecast, and return the response of the endpoint."""
+    response = await client.post("/api/forecasts/start-forecast", json={"force": force})
+    assert response.status_code == 200
+    return response.json()
+
+
+async def complete_forecast(db: AsyncSqliteDatabase, started: AnyDict) -> None:
+    """Complete the forecast with a chart, as `run_forecast` would."""
+    forecast_id = started["forecast"]["id"]
+    file_id = f"forecasts~{started['job']['id']}.csv"
+    (db.storage / file_id).write_text("sku,forecast\nsku0,3.0\n")
+    await db.execute(
+        "UPDATE jobs SET status = 'completed', progress = 1 WHERE id = ?",
+        (started["job"]["id"],),
+    )
+    await db.execute(
+        "UPDATE forecasts SET file_id = ?, memo_key = ? WHERE id = ?",
+        (file_id, forecast_memo_key("abc", []), forecast_id),
+    )
+    await db.execute(
+        """
+        INSERT INTO charts (forecast_id, chart_key, data)
+        VALUES (?, 'sku,sum/forecast', '[["sku0", 3.0]]')
+        """,
+        (forecast_id,),
+    )
+
+
+@pytest.mark.anyio
+async def test_reuse(client: AsyncClient, db: AsyncSqliteDatabase) -> None:
+    """
+    A forecast of the same input content and insights is completed right away.
+
+    It gets the file and the charts of the earlier one.
+    """
+    first = await start_forecast(client)
+    assert first["job"]["status"] == "queued"
+    await complete_forecast(db, first)
+
+    second = await start_forecast(client)
+    assert second["job"]["status"] == "completed"
+    assert second["forecast"]["file_id"] == f"forecasts~{first['job']['id']}.csv"
+    charts = await db.fetch_rows(
+        "SELECT chart_key, data FROM charts WHERE forecast_id = ?",
+        (second["forecast"]["id"],),
+    )
+    assert charts == [{"chart_key": "sku,sum/forecast", "data": '[["sku0", 3.0]]'}]
+
+
+@pytest.mark.anyio
+async def test_no_reuse(client: AsyncClient, db: AsyncSqliteDatabase) -> None:
+    """The forecast is computed again when forced, or when the inputs change."""
+    await complete_forecast(db, await start_forecast(client))
+
+    assert (await start_forecast(client, force=True))["job"]["status"] == "queued"
+
+    await db.execute(
+        "INSERT INTO insights (message, username) VALUES ('Sales up', 'ann')",
+    )
+    assert (await start_forecast(client))["job"]["status"] == "queued"
+
+
+@pytest.mark.anyio
+async def test_in_progress(client: AsyncClient, db: AsyncSqliteDatabase) -> None:
+    """
+    The same request made while the forecast is queued or running gets it.
+
+    No second forecast is started, until the first one fails.
+    """
+    first = await start_forecast(client)
+    assert await start_forecast(client) == first
+
+    await db.execute(
+        "UPDATE jobs SET status = 'running' WHERE id = ?",
+        (first["job"]["id"],),
+    )
+    second = await start_forecast(client)
+    assert second["forecast"]["id"] == first["forecast"]["id"]
+    assert second["job"]["status"] == "running"
+
+    await db.execute(
+        "UPDATE jobs SET status = 'failed' WHERE id = ?",
+        (first["job"]["id"],),
+    )
+    third = await start_forecast(client)
+    assert third["forecast"]["id"] != first["forecast"]["id"]
+    assert third["job"]["status"] == "queued"
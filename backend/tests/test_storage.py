@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import pytest
+
+from omnidemo.forecast import forecast_file
+from omnidemo.storage import CODECS, Codec, compress, decompress
+
+INPUT = b"sku,forecast,region\nsku0,1.5,eu\n\nsku1,2,us\n"
+OUTPUT = b"sku,region,forecast\r\nsku0,eu,3.0\r\nsku1,us,4.0\r\n"
+
+
+def write_stored(path: Path, data: bytes, codec: Codec | None) -> None:
+    """Write the data to the file, compressed by the codec."""
+    with path.open("wb") as raw, compress(raw, codec) as file:
+        file.write(data)
+
+
+def read_stored(path: Path, codec: Codec | None) -> bytes:
+    """Read the data of the file, compressed by the codec."""
+    with path.open("rb") as raw, decompress(raw, codec) as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("source_codec", [None, "gzip", "lzma"])
+@pytest.mark.parametrize("target_codec", [None, "gzip", "lzma"])
+def test_forecast_compressed(
+    tmp_path: Path,
+    source_codec: str | None,
+    target_codec: str | None,
+) -> None:
+    """
+    Forecast files are read and written through any codec.
+
+    The names of the files don't matter.
+    """
+    source = tmp_path / "input.csv"
+    input_codec = CODECS[source_codec] if source_codec else None
+    write_stored(source, INPUT, input_codec)
+    codec = CODECS[target_codec] if target_codec else None
+    target = tmp_path / "output.csv"
+
+    progress = list(
+        forecast_file(
+            source,
+            target,
+            2,
+            batch_size=1,
+            codec=codec,
+            source_codec=input_codec,
+        ),
+    )
+
+    assert progress[-1] == 1
+    assert read_stored(target, codec) == OUTPUT
+    if codec is not None:
+        assert target.read_bytes() != OUTPUT
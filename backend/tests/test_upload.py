@@ -0,0 +1,94 @@
+import pytest
+from httpx import AsyncClient
+
+from omnidemo.blobs import BLOBS_DIR, BlobWriter
+from omnidemo.db import AsyncSqliteDatabase
+from omnidemo.jobs import job_registry
+
+
+@pytest.mark.anyio
+async def test_upload(client: AsyncClient, app_db: AsyncSqliteDatabase) -> None:
+    """The uploaded file completes its job, which is no longer tracked."""
+    response = await client.post(
+        "/api/inputs/upload-file",
+        data={"username": "ann", "job_id": "a"},
+        files={"file": ("sales.csv", b"sku,forecast\nsku0,1.5\n")},
+    )
+    assert response.json() == {"file_id": "a", "file_size": 22}
+    job = await app_db.fetch_one("SELECT * FROM jobs WHERE id = 'a'")
+    assert job["status"] == "completed"
+    assert job_registry.get("a") is None
+
+
+@pytest.mark.anyio
+async def test_upload_failed(
+    client: AsyncClient,
+    app_db: AsyncSqliteDatabase,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """A failed upload fails its job, and leaves no partial file behind."""
+
+    def write(self: BlobWriter, chunk: bytes) -> None:
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(BlobWriter, "write", write)
+    with pytest.raises(OSError):
+        await client.post(
+            "/api/inputs/upload-file",
+            data={"username": "ann", "job_id": "a"},
+            files={"file": ("sales.csv", b"sku,forecast\nsku0,1.5\n")},
+        )
+
+    job = await app_db.fetch_one("SELECT * FROM jobs WHERE id = 'a'")
+    assert job["status"] == "failed"
+    assert job["error"] == "No space left on device"
+    assert job_registry.get("a") is None
+    assert list((app_db.storage / BLOBS_DIR).iterdir()) == []
+    assert await app_db.fetch_rows("SELECT * FROM inputs") == []
+
+
+async def upload(client: AsyncClient, job_id: str, data: bytes) -> None:
+    """Upload the data as an input file, under the id `job_id`."""
+    response = await client.post(
+        "/api/inputs/upload-file",
+        data={"username": "ann", "job_id": job_id},
+        files={"file": ("sales.csv", data)},
+    )
+    assert response.status_code == 200
+
+
+async def delete(client: AsyncClient, input_id: str) -> None:
+    """Delete the input file."""
+    response = await client.post("/api/inputs/delete-file", json={"id": input_id})
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_deduplicated(client: AsyncClient, app_db: AsyncSqliteDatabase) -> None:
+    """
+    The same content uploaded twice is stored once.
+
+    The stored blob is removed with the last input that points to it.
+    """
+    data = b"sku,forecast\nsku0,1.5\n"
+    await upload(client, "a", data)
+    await upload(client, "b", data)
+    await upload(client, "c", b"sku,forecast\nsku1,2\n")
+
+    inputs = await app_db.fetch_rows("SELECT id, stored_name FROM inputs ORDER BY id")
+    assert inputs[0]["stored_name"] == inputs[1]["stored_name"]
+    assert inputs[0]["stored_name"] != inputs[2]["stored_name"]
+    blob = app_db.storage / inputs[0]["stored_name"]
+    blobs = await app_db.fetch_rows("SELECT refcount FROM blobs ORDER BY refcount")
+    assert blobs == [{"refcount": 1}, {"refcount": 2}]
+
+    await delete(client, "a")
+    assert blob.exists()
+    blobs = await app_db.fetch_rows("SELECT refcount FROM blobs ORDER BY refcount")
+    assert blobs == [{"refcount": 1}, {"refcount": 1}]
+    response = await client.get("/api/inputs/download-file", params={"id": "b"})
+    assert response.content == data
+
+    await delete(client, "b")
+    assert not blob.exists()
+    assert len(await app_db.fetch_rows("SELECT * FROM blobs")) == 1
@@ -27,6 +27,27 @@ class Api {
     return this._fetchRequest(request);
   }
 
+  /**
+   * Fetch all pages of a list endpoint, following the `next_cursor` of each
+   * page. The rows come newest first, or oldest first when `since` is given.
+   */
+  async getPages<T extends { next_cursor?: string | null }>(
+    endpoint: string,
+    searchParams: Record<string, string>,
+    schema: ZodSchema<T>,
+  ): Promise<T[]> {
+    const pages: T[] = [];
+    const direction = "since" in searchParams ? "since" : "after";
+    let params = searchParams;
+    while (true) {
+      const response = await this.get(endpoint, params);
+      const page = await response.json(schema);
+      pages.push(page);
+      if (!page.next_cursor) return pages;
+      params = { ...searchParams, [direction]: page.next_cursor };
+    }
+  }
+
   async post(endpoint: string, body?: object): Promise<ApiResponse> {
     const url = this.makeUrl(endpoint);
     console.log(`API request: POST ${url}, body:`, body);
@@ -42,6 +63,25 @@ class Api {
     return this._fetchRequest(request);
   }
 
+  /**
+   * Open a Server-Sent Events stream, and call `onMessage` with the payload
+   * of every message. The caller must `close()` the returned EventSource.
+   */
+  events<T>(
+    endpoint: string,
+    searchParams: Record<string, string>,
+    schema: ZodSchema<T>,
+    onMessage: (data: T) => void,
+  ): EventSource {
+    const url = this.makeUrl(endpoint, searchParams);
+    console.log(`API request: EVENTS ${url}`);
+    const source = new EventSource(url);
+    source.onmessage = (event) => {
+      onMessage(schema.parse(JSON.parse(event.data)));
+    };
+    return source;
+  }
+
   private async _fetchRequest(request: Request): Promise<ApiResponse> {
     const user = await useCurrentUserA();
     if (user.authKey) {
@@ -67,10 +107,15 @@ class Api {
     return new ApiResponse(response);
   }
 
-  makeUrl(endpoint: string, searchParams?: Record<string, string>) {
+  /** The array values of `searchParams` are sent as repeated parameters. */
+  makeUrl(endpoint: string, searchParams?: Record<string, any>) {
     const url = new URL("/api" + endpoint, this._prefix);
     if (searchParams) {
-      url.search = new URLSearchParams(searchParams).toString();
+      for (const [name, value] of Object.entries(searchParams)) {
+        for (const item of Array.isArray(value) ? value : [value]) {
+          url.searchParams.append(name, String(item));
+        }
+      }
     }
     return url.toString();
   }
@@ -96,6 +141,10 @@ class ApiResponse {
     return this._response.text();
   }
 
+  arrayBuffer(): Promise<ArrayBuffer> {
+    return this._response.arrayBuffer();
+  }
+
   async *stream<T = string>(schema?: ZodSchema<T>): AsyncGenerator<T> {
     if (!this._response.body) {
       throw new Error("Response body is not readable");
@@ -123,4 +172,12 @@ class ApiResponse {
 
 export const api = new Api();
 
+/**
+ * Cursor of a row returned by a list endpoint, for its `after` / `since`:
+ * the number by which the endpoint orders the rows (e.g. `seq` of an input).
+ */
+export function cursorOf(key: number): string {
+  return String(key);
+}
+
 export { ApiResponse, HTTPError };
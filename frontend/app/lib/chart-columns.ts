@@ -0,0 +1,87 @@
+/**
+ * Decoding of the `binary` format of the `get-chart` responses: a uint32
+ * (little-endian) length of the JSON header, the header, and the typed
+ * arrays, each aligned to 8 bytes, that the header points into.
+ *
+ * A `get-charts` response is a uint32 count of the charts and a uint32
+ * length of each, followed by the charts, each aligned to 8 bytes.
+ */
+
+const ARRAY_TYPES = {
+  u1: Uint8Array,
+  u2: Uint16Array,
+  u4: Uint32Array,
+  f8: Float64Array,
+};
+
+type TBufferRef = { type: keyof typeof ARRAY_TYPES; offset: number };
+
+type TColumnHeader =
+  | { name: string; dictionary: unknown[]; codes: TBufferRef }
+  | { name: string; values: TBufferRef };
+
+type TChartHeader = {
+  id: number;
+  forecast_id: number;
+  chart_key: string;
+  created_at: string;
+  data: { n_rows: number; columns: TColumnHeader[] };
+};
+
+type TChartColumns = Omit<TChartHeader, "data"> & {
+  nRows: number;
+  columns: { name: string; values: ArrayLike<unknown> }[];
+};
+
+function decodeChartColumns(buffer: ArrayBuffer, offset = 0): TChartColumns {
+  const headerLength = new DataView(buffer).getUint32(offset, true);
+  const headerBytes = new Uint8Array(buffer, offset + 4, headerLength);
+  const { chart } = JSON.parse(new TextDecoder().decode(headerBytes)) as {
+    chart: TChartHeader;
+  };
+  const base = offset + align8(4 + headerLength);
+  const nRows = chart.data.n_rows;
+  const view = (ref: TBufferRef) =>
+    new ARRAY_TYPES[ref.type](buffer, base + ref.offset, nRows);
+
+  const columns = chart.data.columns.map((column) => {
+    if ("codes" in column) {
+      const codes = view(column.codes);
+      return {
+        name: column.name,
+        values: Array.from(codes, (code) => column.dictionary[code]),
+      };
+    }
+    return { name: column.name, values: view(column.values) };
+  });
+  const { data, ...meta } = chart;
+  return { ...meta, nRows, columns };
+}
+
+function decodeChartsColumns(buffer: ArrayBuffer): TChartColumns[] {
+  const view = new DataView(buffer);
+  const count = view.getUint32(0, true);
+  const charts: TChartColumns[] = [];
+  let offset = 4 + 4 * count;
+  for (let i = 0; i < count; i++) {
+    offset = align8(offset);
+    charts.push(decodeChartColumns(buffer, offset));
+    offset += view.getUint32(4 + 4 * i, true);
+  }
+  return charts;
+}
+
+/** The rows `[...xValues, y]` of the decoded chart. */
+function chartRows(chart: TChartColumns): unknown[][] {
+  const rows: unknown[][] = [];
+  for (let i = 0; i < chart.nRows; i++) {
+    rows.push(chart.columns.map((column) => column.values[i]));
+  }
+  return rows;
+}
+
+function align8(offset: number): number {
+  return Math.ceil(offset / 8) * 8;
+}
+
+export { chartRows, decodeChartColumns, decodeChartsColumns, type TChartColumns };
@@ -55,9 +55,10 @@ const ListForecastsPage = observer(() => {
 
 const StartForecastButton = () => {
   const [open, setOpen] = useState(false);
+  const [force, setForce] = useState(false);
   const onSubmit = (e: React.FormEvent<HTMLFormElement>) => {
     e.preventDefault();
-    forecastStore.startForecast();
+    forecastStore.startForecast(force);
     setOpen(false);
   };
 
@@ -75,6 +76,17 @@ const StartForecastButton = () => {
           </DialogDescription>
         </DialogHeader>
         <form onSubmit={onSubmit}>
+          <div className="flex items-center gap-2 mb-4">
+            <input
+              id="force-forecast"
+              type="checkbox"
+              checked={force}
+              onChange={(e) => setForce(e.target.checked)}
+            />
+            <Label htmlFor="force-forecast">
+              Recompute even if the input file and insights have not changed
+            </Label>
+          </div>
           <DialogFooter className="sm:justify-start">
             <Button type="submit" className="cursor-pointer">
               Start
@@ -100,9 +112,13 @@ const ForecastWidget = observer(() => {
     job?.status === "completed" &&
     forecast?.status === "draft" &&
     useCurrentUser().username === "admin";
+  const canCancel = job?.status === "queued" || job?.status === "running";
   const publish = () => {
     forecastStore.publishForecast();
   };
+  const cancel = () => {
+    forecastStore.cancelForecast();
+  };
 
   return (
     <div className="border rounded-lg px-4 py-3 flex items-center">
@@ -116,6 +132,12 @@ const ForecastWidget = observer(() => {
             Error: {job.error} (progress: {job.progress})
           </div>
         )}
+        {job?.status === "cancelled" && <div className="text-stone-400">Cancelled</div>}
+        {job?.status === "queued" && (
+          <div className="text-stone-400">
+            Queued (position in queue: {job.queue_position ?? "?"})
+          </div>
+        )}
         {job?.status === "running" && (
           <Progress value={job.progress * 100} className="my-2" />
         )}
@@ -127,7 +149,14 @@ const ForecastWidget = observer(() => {
           </div>
         )}
       </div>
-      <div>{canPublish && <Button onClick={publish}>Publish</Button>}</div>
+      <div>
+        {canPublish && <Button onClick={publish}>Publish</Button>}
+        {canCancel && (
+          <Button variant="secondary" onClick={cancel}>
+            Cancel
+          </Button>
+        )}
+      </div>
     </div>
   );
 });
@@ -268,7 +297,7 @@ const ChartWidget = observer(({ chart }: { chart: Chart }) => {
     );
   }
   const fields = chart.fields;
-  const chartData = JSON.parse(chart.chartData).map((row: any) => ({
+  const chartData = (chart.chartData ?? []).map((row) => ({
     x: row[0],
     y: row[1],
   }));
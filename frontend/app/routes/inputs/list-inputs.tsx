@@ -1,5 +1,5 @@
 import { observer } from "mobx-react-lite";
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import { Spinner } from "~/components/custom/spinner";
 import { Button } from "~/components/ui/button";
 import {
@@ -24,6 +24,11 @@ const ListInputsPage = observer(() => {
   const files = new Set(inputs.map((input) => input.file_name));
   const filesInProgress = inputsStore.filesInProgress;
 
+  // Pick up what was added while the page was not shown
+  useEffect(() => {
+    inputsStore.refresh();
+  }, []);
+
   return (
     <div>
       <div className="flex items-center mb-2 ">
@@ -1,6 +1,6 @@
 import { SendHorizonal } from "lucide-react";
 import { observer } from "mobx-react-lite";
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import { Spinner } from "~/components/custom/spinner";
 import { Avatar, AvatarFallback } from "~/components/ui/avatar";
 import { Button } from "~/components/ui/button";
@@ -14,6 +14,11 @@ import { insightsStore, type TInsight } from "~/state/insights-store";
 const ListInsightsPage = observer(() => {
   const insights = insightsStore.insights;
 
+  // Pick up what was added while the page was not shown
+  useEffect(() => {
+    insightsStore.refresh();
+  }, []);
+
   return (
     <div className="h-full max-h-dvh flex flex-col relative">
       <div className="grow shrink max-h-[calc(100dvh-3.5rem)]">
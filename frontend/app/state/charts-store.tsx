@@ -1,9 +1,18 @@
 import { makeAutoObservable, reaction, runInAction } from "mobx";
 import { z } from "zod";
 import { api } from "~/lib/api";
+import {
+  chartRows,
+  decodeChartColumns,
+  decodeChartsColumns,
+} from "~/lib/chart-columns";
 import { useCurrentUser } from "./current-user";
 import { forecastStore } from "./forecasts-store";
 
+// The bar charts show at most this many bars, plus the "other" bar that
+// collects the rest
+const MAX_BARS = 50;
+
 class ChartsStore {
   private _charts: Chart[] | null;
   private _loading: boolean = true;
@@ -11,6 +20,13 @@ class ChartsStore {
   constructor() {
     this._charts = null;
     makeAutoObservable(this);
+
+    // Refetch the data of all charts when the forecast changes
+    reaction(
+      () => forecastStore.forecast?.id,
+      () => this._fetchData(this._charts ?? []),
+      { fireImmediately: false },
+    );
   }
 
   get loading(): boolean {
@@ -34,23 +50,49 @@ class ChartsStore {
     runInAction(() => {
       this._charts = [...(this._charts ?? []), chart];
     });
+    chart._fetchData();
   }
 
   async _fetchCharts(): Promise<void> {
     const username = useCurrentUser().username;
     const response = await api.get("/forecasts/get-user-charts", { username });
     const data = await response.json(ZListChartsResponse);
+    const charts = data.charts.map((chart) => new Chart(chart));
     runInAction(() => {
-      this._charts = data.charts.map((chart) => new Chart(chart));
+      this._charts = charts;
       this._loading = false;
     });
+    this._fetchData(charts);
+  }
+
+  /**
+   * Fetch the data of all the charts in one request, so that the charts
+   * that are not computed yet are computed together on the server.
+   */
+  async _fetchData(charts: Chart[]): Promise<void> {
+    const forecastId = forecastStore.forecast?.id;
+    if (!forecastId || !charts.length) return;
+    charts.forEach((chart) => chart.setLoading(forecastId));
+    const response = await api.get("/forecasts/get-charts", {
+      forecast_id: forecastId,
+      chart_key: charts.map((chart) => chart.chartKey),
+      top: MAX_BARS,
+      format: "binary",
+    });
+    const data = decodeChartsColumns(await response.arrayBuffer());
+    const rows = new Map(data.map((chart) => [chart.chart_key, chartRows(chart)]));
+    runInAction(() => {
+      for (const chart of charts) {
+        chart.setData(rows.get(chart.chartKey) ?? []);
+      }
+    });
   }
 }
 
 class Chart {
   private _dataLoading: boolean = true;
   chartKey: string;
-  chartData: any;
+  chartData: unknown[][] | null;
   forecastId: number | null;
 
   constructor(data: TUserChart) {
@@ -58,19 +100,6 @@ class Chart {
     this.chartData = null;
     this.forecastId = forecastStore.forecast?.id ?? null;
     makeAutoObservable(this);
-    this._fetchData();
-
-    // Use reaction to refetch data when forecastId changes
-    reaction(
-      () => forecastStore.forecast?.id,
-      (newForecastId) => {
-        this.forecastId = newForecastId ?? null;
-        this.chartData = null;
-        this._dataLoading = true;
-        this._fetchData();
-      },
-      { fireImmediately: false },
-    );
   }
 
   get isLoading(): boolean {
@@ -86,18 +115,28 @@ class Chart {
     return fields;
   }
 
+  setLoading(forecastId: number) {
+    this.forecastId = forecastId;
+    this.chartData = null;
+    this._dataLoading = true;
+  }
+
+  setData(rows: unknown[][]) {
+    this.chartData = rows;
+    this._dataLoading = false;
+  }
+
   async _fetchData() {
     console.log("fetching chart data", this.forecastId, this.chartKey);
     if (!this.forecastId) return;
     const response = await api.get("/forecasts/get-chart", {
       chart_key: this.chartKey,
       forecast_id: this.forecastId,
+      top: MAX_BARS,
+      format: "binary",
     });
-    const data = await response.json(ZGetChartResponse);
-    runInAction(() => {
-      this._dataLoading = false;
-      this.chartData = data.chart.data;
-    });
+    const chart = decodeChartColumns(await response.arrayBuffer());
+    this.setData(chartRows(chart));
   }
 }
 
@@ -109,22 +148,10 @@ const ZUserChart = z.object({
 });
 type TUserChart = z.infer<typeof ZUserChart>;
 
-const ZChart = z.object({
-  id: z.number(),
-  chart_key: z.string(),
-  forecast_id: z.number().int(),
-  data: z.any(),
-});
-type TChart = z.infer<typeof ZChart>;
-
 const ZListChartsResponse = z.object({
   charts: z.array(ZUserChart),
 });
 
-const ZGetChartResponse = z.object({
-  chart: ZChart,
-});
-
 const ZAddUserChartResponse = z.object({
   chart: ZUserChart,
 });
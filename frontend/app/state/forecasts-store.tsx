@@ -1,13 +1,13 @@
 import { makeAutoObservable, runInAction } from "mobx";
 import { z } from "zod";
-import { ZGetJobResponse, ZJob, type TJob } from "./inputs-store";
+import { followJob, isJobFinished, ZJob, type TJob } from "./inputs-store";
 import { api } from "~/lib/api";
 
 class ForecastsStore {
   private _forecast: TForecast | null;
   private _job: TJob | null = null;
   private _loading: boolean = true;
-  private _timer: NodeJS.Timeout | null = null;
+  private _events: EventSource | null = null;
 
   constructor() {
     this._forecast = null;
@@ -27,8 +27,12 @@ class ForecastsStore {
     return this._job;
   }
 
-  async startForecast(): Promise<void> {
-    const response = await api.post("/forecasts/start-forecast");
+  /**
+   * Start a new forecast. The results of an earlier forecast with the same
+   * inputs and insights are reused, unless `force` is set.
+   */
+  async startForecast(force: boolean = false): Promise<void> {
+    const response = await api.post("/forecasts/start-forecast", { force });
     const data = await response.json(ZStartForecastResponse);
     runInAction(() => {
       this._forecast = data.forecast;
@@ -47,6 +51,17 @@ class ForecastsStore {
     });
   }
 
+  async cancelForecast(): Promise<void> {
+    const response = await api.post("/forecasts/cancel-forecast", {
+      id: this._forecast?.id,
+    });
+    const data = await response.json(ZCancelForecastResponse);
+    runInAction(() => {
+      this._forecast = data.forecast;
+      this._job = data.job;
+    });
+  }
+
   async _fetchForecast(): Promise<void> {
     const response = await api.get("/forecasts/get-latest-forecast");
     const data = await response.json(ZGetLatestForecastResponse);
@@ -59,24 +74,21 @@ class ForecastsStore {
   }
 
   private _pollForecastJob() {
-    if (this._timer) clearInterval(this._timer);
+    this._events?.close();
+    this._events = null;
     if (!this._job) return;
-    if (this._job.status !== "running") return;
-    const jobId = this._job.id;
+    if (isJobFinished(this._job)) return;
 
-    this._timer = setInterval(async () => {
-      const response = await api.get("/jobs/get-job", { id: jobId });
-      const data = await response.json(ZGetJobResponse);
+    this._events = followJob(this._job.id, (job) => {
       runInAction(() => {
-        this._job = data.job;
-        if (data.job.status !== "running") {
-          clearInterval(this._timer!);
-          this._timer = null;
+        this._job = job;
+        if (isJobFinished(job)) {
+          this._events = null;
           // Retrieve the file id
           this._fetchForecast();
         }
       });
-    }, 1000);
+    });
   }
 }
 
@@ -103,5 +115,10 @@ const ZPublishForecastResponse = z.object({
   forecast: ZForecast,
 });
 
+const ZCancelForecastResponse = z.object({
+  forecast: ZForecast,
+  job: ZJob,
+});
+
 const forecastStore = new ForecastsStore();
 export { forecastStore };
@@ -1,12 +1,14 @@
 import { makeAutoObservable, runInAction } from "mobx";
 import { z } from "zod";
-import { api, ApiResponse } from "~/lib/api";
+import { api, ApiResponse, cursorOf } from "~/lib/api";
 import { useCurrentUser } from "./current-user";
 
 class InputsStore {
   private _inputs: TInput[] | null;
   private _filesInProgress: FileInProgress[] = [];
   private _loading: boolean = true;
+  // Cursor of the newest input fetched from the server, see `refresh()`
+  private _cursor: string | null = null;
 
   constructor() {
     this._inputs = null;
@@ -40,11 +42,33 @@ class InputsStore {
     });
   }
 
+  /** Fetch only the inputs that were uploaded since the last fetch. */
+  refresh = async (): Promise<void> => {
+    if (!this._inputs) return;
+    // There were no inputs at all: fetch everything, which is just as cheap
+    if (this._cursor === null) return this._fetchInputs();
+    const pages = await api.getPages(
+      "/inputs/list-inputs",
+      { since: this._cursor },
+      ZListInputsResponse,
+    );
+    const inputs = pages.flatMap((page) => page.inputs);
+    if (inputs.length === 0) return;
+    runInAction(() => {
+      // Our own uploads are already there, see `_removeFileInProgress()`
+      const known = new Set(this._inputs!.map((input) => input.id));
+      this._inputs = [...this._inputs!, ...inputs.filter((i) => !known.has(i.id))];
+      this._cursor = cursorOf(inputs[inputs.length - 1].seq!);
+    });
+  };
+
   async _fetchInputs(): Promise<void> {
-    const response = await api.get("/inputs/list-inputs");
-    const data = await response.json(ZListInputsResponse);
+    const pages = await api.getPages("/inputs/list-inputs", {}, ZListInputsResponse);
+    // The pages come newest first
+    const inputs = pages.flatMap((page) => page.inputs).reverse();
     runInAction(() => {
-      this._inputs = data.inputs;
+      this._inputs = inputs;
+      this._cursor = inputs.length ? cursorOf(inputs[inputs.length - 1].seq!) : null;
       this._loading = false;
     });
   }
@@ -55,6 +79,7 @@ class InputsStore {
       ...this._inputs!,
       {
         id: fip.fileId,
+        seq: null,
         file_name: fip.fileName,
         username: useCurrentUser().username ?? "",
         size: fip.fileSize,
@@ -69,7 +94,7 @@ class InputsStore {
 class FileInProgress {
   private _response: ApiResponse;
   private _jobId: string;
-  private _timer: NodeJS.Timeout | null = null;
+  private _events: EventSource | null = null;
   fileName: string;
   fileSize: number;
   fileId: string;
@@ -84,9 +109,14 @@ class FileInProgress {
     this.progress = 0;
     makeAutoObservable(this);
     this._waitForResponse();
-    this._timer = setInterval(() => {
-      this._fetchJobStatus();
-    }, 1000);
+    this._events = followJob(this._jobId, (job) => {
+      runInAction(() => {
+        this.progress = job.progress;
+        if (job.status === "completed") {
+          this._finish();
+        }
+      });
+    });
   }
 
   private async _waitForResponse(): Promise<void> {
@@ -98,28 +128,20 @@ class FileInProgress {
     });
   }
 
-  private async _fetchJobStatus(): Promise<void> {
-    const response = await api.get("/jobs/get-job", { id: this._jobId });
-    const data = await response.json(ZGetJobResponse);
-    runInAction(() => {
-      this.progress = data.job.progress;
-      if (data.job.status === "completed") {
-        this._finish();
-      }
-    });
-  }
-
   private _finish() {
     runInAction(() => {
       this.progress = 1;
       inputsStore._removeFileInProgress(this);
-      this._timer && clearInterval(this._timer);
+      this._events?.close();
+      this._events = null;
     });
   }
 }
 
 const ZInput = z.object({
   id: z.string(),
+  // Always set by the server, null for our own uploads that were added locally
+  seq: z.number().nullable(),
   file_name: z.string(),
   username: z.string(),
   size: z.number(),
@@ -130,14 +152,16 @@ type TInput = z.infer<typeof ZInput>;
 const ZJob = z.object({
   id: z.string(),
   progress: z.number(),
-  status: z.enum(["completed", "running", "failed"]),
+  status: z.enum(["queued", "running", "completed", "failed", "cancelled"]),
   error: z.string().nullable().optional(),
   created_at: z.string(),
+  queue_position: z.number().nullable().optional(),
 });
 type TJob = z.infer<typeof ZJob>;
 
 const ZListInputsResponse = z.object({
   inputs: z.array(ZInput),
+  next_cursor: z.string().nullable().optional(),
 });
 
 const ZUploadFileResponse = z.object({
@@ -149,9 +173,33 @@ const ZGetJobResponse = z.object({
   job: ZJob,
 });
 
+function isJobFinished(job: TJob): boolean {
+  return job.status !== "queued" && job.status !== "running";
+}
+
+/**
+ * Follow the progress of a job, calling `onUpdate` whenever it changes.
+ * The stream is closed once the job is finished, or when the
+ * returned EventSource is closed.
+ */
+function followJob(jobId: string, onUpdate: (job: TJob) => void): EventSource {
+  const source = api.events(
+    "/jobs/stream",
+    { id: jobId },
+    ZGetJobResponse,
+    (data) => {
+      if (isJobFinished(data.job)) source.close();
+      onUpdate(data.job);
+    },
+  );
+  return source;
+}
+
 const inputsStore = new InputsStore();
 export {
+  followJob,
   inputsStore,
+  isJobFinished,
   ZGetJobResponse,
   ZJob,
   type FileInProgress,
@@ -1,11 +1,13 @@
 import { makeAutoObservable, runInAction } from "mobx";
 import { z } from "zod";
-import { api } from "~/lib/api";
+import { api, cursorOf } from "~/lib/api";
 import { useCurrentUser } from "~/state/current-user";
 
 class InsightsStore {
   private _insights: TInsight[] | null;
   private _loading: boolean = true;
+  // Cursor of the newest insight fetched from the server, see `refresh()`
+  private _cursor: string | null = null;
 
   constructor() {
     this._insights = null;
@@ -44,13 +46,39 @@ class InsightsStore {
     }
   };
 
+  /** Fetch only the insights that were posted since the last fetch. */
+  refresh = async (): Promise<void> => {
+    if (!this._insights) return;
+    // There were no insights at all: fetch everything, which is just as cheap
+    if (this._cursor === null) return this._fetchInsights();
+    const pages = await api.getPages(
+      "/insights/list-insights",
+      { since: this._cursor },
+      ZListInsightsResponse,
+    );
+    const insights = pages.flatMap((page) => page.insights);
+    if (insights.length === 0) return;
+    runInAction(() => {
+      // Our own messages are already there, see `sendMessage()`
+      const known = new Set(this._insights!.map((i) => i.id));
+      this._insights!.push(...insights.filter((i) => !known.has(i.id)));
+      this._cursor = cursorOf(insights[insights.length - 1].id);
+    });
+  };
+
   async _fetchInsights(): Promise<void> {
-    const response = await api.get("/insights/list-insights");
-    const data = await response.json(ZListInsightsResponse);
+    const pages = await api.getPages(
+      "/insights/list-insights",
+      {},
+      ZListInsightsResponse,
+    );
+    // The pages come newest first
+    const insights = pages.flatMap((page) => page.insights).reverse();
     runInAction(() => {
-      this._insights = data.insights.sort((a, b) =>
-        a.created_at.localeCompare(b.created_at),
-      );
+      this._insights = insights;
+      this._cursor = insights.length
+        ? cursorOf(insights[insights.length - 1].id)
+        : null;
       this._loading = false;
     });
   }
@@ -66,6 +94,7 @@ type TInsight = z.infer<typeof ZInsight>;
 
 const ZListInsightsResponse = z.object({
   insights: z.array(ZInsight),
+  next_cursor: z.string().nullable().optional(),
 });
 
 const ZSendMessageResponse = z.object({